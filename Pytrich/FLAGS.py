@@ -3,4 +3,14 @@ LOG_SEARCH=True
 LOG_HEURISTIC=False
 MONITOR_SEARCH_RESOURCES=False #monitor resources while search
 MONITOR_LM_TIME=False #monitor time elapsed for landmark components
-USE_TO_REACHABILITY=False
\ No newline at end of file
+USE_PRUNING=False #prune the grounded model (TDG reachability and relaxed executability) and compact its ids
+USE_TO_REACHABILITY=False
+USE_PULLUP=False #pull subtask preconditions up into method preconditions
+USE_FLATTENING=False #inline single method tasks and single subtask chains, remove duplicate methods
+LIFT_METHOD_PRECONDITIONS=False #move pandaPI's __method_precondition_* actions into method preconditions
+MODEL_CACHE_DIR=None #directory of the compiled model cache (see Grounder/model_cache.py), None disables it
+GROUNDING_CACHE_DIR=None #directory of the grounding cache (see Grounder/grounding_cache.py), None disables it
+GROUNDING_CACHE_MB=1024 #size cap of the grounding cache, least recently used groundings are evicted
+GROUNDING_TIMEOUT=None #wall time limit (seconds) of each pandaPI stage, None for no limit
+GROUNDING_MEMORY_MB=None #address space limit (MB) of each pandaPI stage, None for no limit
+GROUNDING_STREAM=True #hand off between pandaPI stages through FIFOs (see Grounder/grounding_pipeline.py), else through files
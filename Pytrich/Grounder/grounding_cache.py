@@ -0,0 +1,78 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+def atomic_copy(src, dst):
+    """Copy src to dst through a temporary file in dst's directory, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dst)), suffix='.tmp')
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+class GroundingCache:
+    """
+    Content addressed cache of pandaPI groundings (.psas), keyed by the sha1 of the domain,
+    the problem and the grounder arguments. Entries are added atomically, so concurrent runs
+    may share the directory, and the least recently used ones are evicted above max_mb.
+    """
+    def __init__(self, cache_dir, max_mb=1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * (1 << 20))
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, domain_file, problem_file, grounder_args):
+        sha1 = hashlib.sha1()
+        for path in (domain_file, problem_file):
+            with open(path, 'rb') as file:
+                for chunk in iter(lambda: file.read(1 << 20), b''):
+                    sha1.update(chunk)
+            sha1.update(b'\0')
+        sha1.update(' '.join(grounder_args).encode())
+        return sha1.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.psas')
+
+    def get(self, key):
+        """Path of the cached grounding (marked as recently used), or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, psas_file):
+        """Add a grounding and evict the least recently used ones over the size cap, returns its cached path."""
+        path = self.path(key)
+        atomic_copy(psas_file, path)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.psas'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError: # evicted by another run
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
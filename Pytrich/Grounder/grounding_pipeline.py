@@ -0,0 +1,232 @@
+import math
+import os
+import resource
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+class GroundingError(RuntimeError):
+    """A grounding stage failed, timed out or was killed."""
+
+class StageStats:
+    """Wall and CPU (user + system) seconds, peak RSS and status of a grounding stage."""
+    def __init__(self, name):
+        self.name = name
+        self.status = 'NOT_RUN' # SUCCESS, FAILED (exit code), TIMEOUT or KILLED
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.max_rss_kb = 0
+
+    def __str__(self):
+        return f'{self.name} {self.status}, wall {self.wall_time:.4f}s, cpu {self.cpu_time:.4f}s, ' \
+               f'max rss {self.max_rss_kb / 1024:.1f} MB'
+
+def tmpfs_dir():
+    """/dev/shm if usable (intermediate files then never touch the disk), else None (the default temp dir)."""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK | os.X_OK):
+        return '/dev/shm'
+    return None
+
+class _Stage:
+    """
+    A pandaPI process under resource limits (address space, and CPU time as a backstop of the wall timeout),
+    reaped by a waiter thread with os.wait4 for its rusage.
+    """
+    def __init__(self, name, args, timeout=None, memory_mb=None):
+        self.stats = StageStats(name)
+        self.args = args
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.process = None
+        self.returncode = None
+        self.start_time = None
+        self.end_time = None
+        self._lock = threading.Lock()
+        self._timer = None
+        self._waiter = None
+
+    def _limit_resources(self):
+        # runs in the child, between fork and exec
+        if self.memory_mb:
+            limit = int(self.memory_mb * (1 << 20))
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if self.timeout:
+            limit = math.ceil(self.timeout)
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, limit + 1))
+
+    def spawn(self):
+        self.start_time = time.perf_counter()
+        try:
+            self.process = subprocess.Popen(self.args, preexec_fn=self._limit_resources)
+        except OSError as error: # e.g. missing pandaPI build
+            self.stats.status = f'FAILED ({error})'
+            raise GroundingError(str(self.stats)) from error
+
+    def watch(self, on_exit):
+        """Start the timeout and the waiter thread (after every spawn: forking with threads around is unsafe)."""
+        if self.process is None:
+            return
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self.kill, args=('TIMEOUT',))
+            self._timer.daemon = True
+            self._timer.start()
+        self._waiter = threading.Thread(target=self._wait, args=(on_exit,), daemon=True)
+        self._waiter.start()
+
+    def _wait(self, on_exit):
+        _, wait_status, rusage = os.wait4(self.process.pid, 0)
+        with self._lock:
+            self.returncode = os.waitstatus_to_exitcode(wait_status)
+            # reaped here, Popen must not wait for it again
+            self.process.returncode = self.returncode
+        self.end_time = time.perf_counter()
+        if self._timer is not None:
+            self._timer.cancel()
+        self.stats.wall_time = self.end_time - self.start_time
+        self.stats.cpu_time = rusage.ru_utime + rusage.ru_stime
+        self.stats.max_rss_kb = rusage.ru_maxrss
+        if self.stats.status == 'NOT_RUN':
+            self.stats.status = 'SUCCESS' if self.returncode == 0 else f'FAILED ({self.returncode})'
+        on_exit(self)
+
+    def kill(self, status='KILLED'):
+        # not Popen.kill: it may reap the process before the waiter thread gets its rusage
+        with self._lock:
+            if self.process is None or self.returncode is not None or self.stats.status != 'NOT_RUN':
+                return
+            self.stats.status = status
+            os.kill(self.process.pid, signal.SIGKILL)
+
+    def join(self):
+        if self._waiter is not None:
+            self._waiter.join()
+
+    @property
+    def succeeded(self):
+        return self.stats.status == 'SUCCESS'
+
+class GroundingPipeline:
+    """
+    Runs pandaPIparser and pandaPIgrounder on a domain and problem, each with an optional wall
+    timeout (seconds) and address space limit (MB), and yields the lines of the grounding as the
+    grounder writes them, so the SAS parser can build the model while grounding goes on.
+
+    With stream, the stages hand off through FIFOs in work_dir (pandaPI reads and writes them
+    sequentially) and run concurrently; otherwise they run one after the other through files
+    in work_dir (preferably a tmpfs, see tmpfs_dir).
+    stats has the wall/CPU/RSS numbers of each stage once done: 'parser', 'grounder', and 'model'
+    for this process while it consumes the lines (its RSS is the process peak).
+    """
+    def __init__(self, parser_path, grounder_path, grounder_args=(), timeout=None, memory_mb=None, stream=True):
+        self.parser_path = parser_path
+        self.grounder_path = grounder_path
+        self.grounder_args = tuple(grounder_args)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.stream = stream
+        self.stats = {}
+        self.grounding_time = 0.0 # until the grounder exits
+
+    def run(self, domain_file, problem_file, work_dir, psas_file):
+        """Ground to psas_file without consuming the lines."""
+        for _ in self.lines(domain_file, problem_file, work_dir, psas_file):
+            pass
+
+    def lines(self, domain_file, problem_file, work_dir, psas_file):
+        """
+        Lines (bytes) of the grounding, also written to psas_file (atomically, once complete).
+        Raises GroundingError if a stage fails, stages still running are killed if the lines aren't consumed to the end.
+        """
+        parsed_output = os.path.join(work_dir, 'temp.parsed')
+        grounded_output = os.path.join(work_dir, 'temp.psas')
+        parser = _Stage('parser', [self.parser_path, domain_file, problem_file, parsed_output],
+                        self.timeout, self.memory_mb)
+        grounder = _Stage('grounder', [self.grounder_path, *self.grounder_args, parsed_output, grounded_output],
+                          self.timeout, self.memory_mb)
+        stages = (parser, grounder)
+        self.stats = {stage.stats.name: stage.stats for stage in stages}
+        model_stats = self.stats['model'] = StageStats('model')
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(psas_file)), suffix='.tmp')
+        os.close(fd)
+        # write end of the grounding FIFO held open until the grounder exits (see _open_grounding)
+        held = []
+        held_lock = threading.Lock()
+        def release_held():
+            with held_lock:
+                while held:
+                    os.close(held.pop())
+        def on_exit(stage):
+            if not stage.succeeded:
+                for other in stages:
+                    other.kill()
+            if stage is grounder:
+                release_held()
+
+        start_time = time.perf_counter()
+        grounding = None
+        try:
+            if self.stream:
+                os.mkfifo(parsed_output)
+                os.mkfifo(grounded_output)
+                grounding = self._open_grounding(grounded_output, held)
+                try:
+                    for stage in stages:
+                        stage.spawn()
+                finally:
+                    for stage in stages:
+                        stage.watch(on_exit)
+            else:
+                for stage in stages:
+                    stage.spawn()
+                    stage.watch(on_exit)
+                    stage.join()
+                    if not stage.succeeded:
+                        raise GroundingError(str(stage.stats))
+                    if not os.path.exists(stage.args[-1]):
+                        raise GroundingError(f'{stage.stats.name} output missing')
+                grounding = open(grounded_output, 'rb')
+
+            model_start = time.perf_counter()
+            model_rusage = resource.getrusage(resource.RUSAGE_SELF)
+            with grounding, open(tmp_path, 'wb') as psas:
+                for line in grounding:
+                    psas.write(line)
+                    yield line
+            for stage in stages:
+                stage.join()
+            rusage = resource.getrusage(resource.RUSAGE_SELF)
+            model_stats.wall_time = time.perf_counter() - model_start
+            model_stats.cpu_time = rusage.ru_utime + rusage.ru_stime - model_rusage.ru_utime - model_rusage.ru_stime
+            model_stats.max_rss_kb = rusage.ru_maxrss
+            self.grounding_time = grounder.end_time - start_time
+            for stage in stages:
+                if not stage.succeeded:
+                    model_stats.status = 'FAILED (incomplete grounding)'
+                    raise GroundingError(str(stage.stats))
+            model_stats.status = 'SUCCESS'
+            os.replace(tmp_path, psas_file)
+        finally:
+            for stage in stages:
+                stage.kill()
+            for stage in stages:
+                stage.join()
+            release_held()
+            if grounding is not None:
+                grounding.close()
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @staticmethod
+    def _open_grounding(path, held):
+        """
+        Read end of the grounding FIFO, opened before the grounder starts. A write end is also
+        opened and kept in held until the grounder exits: reads don't see EOF before the grounder
+        opens the FIFO, and do once it is gone even if it never opened it.
+        """
+        read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        held.append(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+        os.set_blocking(read_fd, True)
+        return open(read_fd, 'rb')
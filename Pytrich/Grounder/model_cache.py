@@ -0,0 +1,220 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from Pytrich.model import AbstractTask, Decomposition, Fact, Model, Operator
+from Pytrich.ProblemRepresentation.name_table import NAMES
+
+MAGIC = b'PYTRICHM'
+# bump when the layout below (or what the parser/postprocessing produce) changes
+FORMAT_VERSION = 3
+
+class ModelCache:
+    """
+    On-disk cache of grounded models, so runs on the same .psas skip parsing.
+    Entries are keyed by the sha1 of the SAS file, the format version and a stage
+    ('parsed', or e.g. 'pruned' for a post-processed model), and written atomically.
+
+    Layout (little endian), after MAGIC and the version:
+        counts of facts, operators, abstract tasks, methods and initial tasks
+        names of facts, operators, abstract tasks and methods
+        operator costs, operator bitsets (pos/neg precons, add/del effects)
+        method bitsets (pos/neg precons), decomposed tasks, task networks
+        initial task network, initial state and goals, mutex groups
+        sources of flattened decompositions, by name (see flatten_hierarchy)
+    Tasks are numbered as operators first, then abstract tasks; global ids are
+    reassigned in the model order (facts, operators, abstract tasks, methods).
+    Entries are memory mapped when loaded, and names are left in the mapped file
+    (see NameTable.add_blob), only decoded if printed.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, sas_file, stage='parsed'):
+        sha1 = hashlib.sha1()
+        with open(sas_file, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha1.update(chunk)
+        return f'{sha1.hexdigest()}-v{FORMAT_VERSION}-{stage}'
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.model')
+
+    def load(self, key):
+        """The cached model, or None if missing or written by another format version."""
+        try:
+            with open(self.path(key), 'rb') as file:
+                # not closed here: the name table keeps views of the mapped names
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError): # missing or empty file
+            return None
+        if data[:len(MAGIC)] != MAGIC:
+            return None
+        reader = _Reader(data, len(MAGIC))
+        if reader.unpack('<I')[0] != FORMAT_VERSION:
+            return None
+        return _decode_model(reader)
+
+    def store(self, key, model):
+        """Write the model, replacing any previous entry atomically."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(MAGIC)
+                file.write(struct.pack('<I', FORMAT_VERSION))
+                _encode_model(file, model)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+def _write_array(file, typecode, values):
+    values = array(typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    file.write(struct.pack('<Q', len(values)))
+    file.write(values.tobytes())
+
+def _write_names(file, components):
+    encoded = [NAMES.raw(c.name_id) for c in components]
+    _write_array(file, 'Q', [len(n) for n in encoded])
+    for n in encoded:
+        file.write(n)
+
+def _write_bitsets(file, bitsets):
+    encoded = [b.to_bytes((b.bit_length() + 7) >> 3, 'little') for b in bitsets]
+    _write_array(file, 'Q', [len(b) for b in encoded])
+    file.write(b''.join(encoded))
+
+class _Reader:
+    def __init__(self, data, offset=0):
+        self.data = memoryview(data)
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def read(self, size):
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def array(self, typecode):
+        length = self.unpack('<Q')[0]
+        values = array(typecode)
+        values.frombytes(self.read(length * values.itemsize))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def _chunks(self):
+        lengths = self.array('Q')
+        blob = self.read(sum(lengths))
+        start = 0
+        for length in lengths:
+            yield blob[start:start + length]
+            start += length
+
+    def names(self):
+        """Registers the names (written by _write_names) in NAMES, without copying, returns the first id."""
+        lengths = self.array('Q')
+        return NAMES.add_blob(self.read(sum(lengths)), lengths)
+
+    def bitsets(self):
+        return [int.from_bytes(chunk, 'little') for chunk in self._chunks()]
+
+def _encode_model(file, model):
+    op_count = len(model.operators)
+    task_index = {op.global_id: i for i, op in enumerate(model.operators)}
+    task_index.update((t.global_id, op_count + i) for i, t in enumerate(model.abstract_tasks))
+    abstract_index = {t.global_id: i for i, t in enumerate(model.abstract_tasks)}
+
+    file.write(struct.pack('<5Q', len(model.facts), op_count, len(model.abstract_tasks),
+                           len(model.decompositions), len(model.initial_tn)))
+    _write_names(file, model.facts)
+    _write_names(file, model.operators)
+    _write_names(file, model.abstract_tasks)
+    _write_names(file, model.decompositions)
+
+    _write_array(file, 'q', [op.cost for op in model.operators])
+    for attr in ('pos_precons', 'neg_precons', 'add_effects', 'del_effects'):
+        _write_bitsets(file, [getattr(op, attr) for op in model.operators])
+
+    for attr in ('pos_precons', 'neg_precons'):
+        _write_bitsets(file, [getattr(d, attr) for d in model.decompositions])
+    _write_array(file, 'q', [abstract_index[d.compound_task.global_id] for d in model.decompositions])
+    _write_array(file, 'Q', [len(d.task_network) for d in model.decompositions])
+    _write_array(file, 'q', [task_index[t.global_id] for d in model.decompositions for t in d.task_network])
+
+    _write_array(file, 'q', [task_index[t.global_id] for t in model.initial_tn])
+    _write_bitsets(file, [model.initial_state, model.goals])
+    _write_array(file, 'Q', [len(g) for g in model.mutex_groups])
+    _write_array(file, 'q', [f for g in model.mutex_groups for f in g])
+    sources = [d.source or [] for d in model.decompositions]
+    _write_array(file, 'Q', [len(source) for source in sources])
+    _write_names(file, [t for source in sources for t, _ in source])
+    _write_names(file, [d for source in sources for _, d in source])
+
+def _decode_model(reader):
+    fact_count, op_count, abt_count, dec_count, _ = reader.unpack('<5Q')
+    fact_names = reader.names()
+    op_names = reader.names()
+    abt_names = reader.names()
+    dec_names = reader.names()
+
+    facts = [Fact(fact_names + f_id, f_id, f_id) for f_id in range(fact_count)]
+    costs = reader.array('q')
+    pos_precons, neg_precons, add_effects, del_effects = (reader.bitsets() for _ in range(4))
+    operators = [
+        Operator(fact_count + i, i, op_names + i, costs[i], pos_precons[i], neg_precons[i], add_effects[i], del_effects[i])
+        for i in range(op_count)
+    ]
+    abt_init = fact_count + op_count
+    abstract_tasks = [AbstractTask(abt_init + i, i, [], abt_names + i) for i in range(abt_count)]
+    tasks = operators + abstract_tasks
+
+    dec_pos, dec_neg = reader.bitsets(), reader.bitsets()
+    compound_tasks = reader.array('q')
+    tn_sizes = reader.array('Q')
+    tn_tasks = reader.array('q')
+    dec_init = abt_init + abt_count
+    decompositions = []
+    start = 0
+    for i in range(dec_count):
+        end = start + tn_sizes[i]
+        d = Decomposition(dec_names + i, dec_init + i, i, dec_pos[i], dec_neg[i],
+                          abstract_tasks[compound_tasks[i]], [tasks[t] for t in tn_tasks[start:end]])
+        d.compound_task.decompositions.append(d)
+        decompositions.append(d)
+        start = end
+
+    initial_tn = [tasks[t] for t in reader.array('q')]
+    initial_state, goals = reader.bitsets()
+    group_sizes = reader.array('Q')
+    group_facts = reader.array('q')
+    mutex_groups = []
+    start = 0
+    for size in group_sizes:
+        mutex_groups.append(tuple(group_facts[start:start + size]))
+        start += size
+
+    # original tasks and decompositions of flattened ones are only needed to report solutions, by name
+    source_sizes = reader.array('Q')
+    source_tasks = reader.names()
+    source_decompositions = reader.names()
+    start = 0
+    for d, size in zip(decompositions, source_sizes):
+        if size:
+            d.source = []
+            for i in range(start, start + size):
+                task = AbstractTask(-1, -1, [], source_tasks + i)
+                d.source.append((task, Decomposition(source_decompositions + i, -1, -1, 0, 0, task, [])))
+        start += size
+    return Model(facts, initial_state, initial_tn, goals, operators, decompositions, abstract_tasks, mutex_groups)
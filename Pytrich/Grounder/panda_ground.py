@@ -1,9 +1,16 @@
-import subprocess
 import os
+import tempfile
+import time
+from Pytrich.Grounder.grounding_cache import GroundingCache
+from Pytrich.Grounder.grounding_pipeline import GroundingError, GroundingPipeline, tmpfs_dir
+from Pytrich.Grounder.model_cache import ModelCache
 from Pytrich.Grounder.sasplus_parser import SASPlusParser
+from Pytrich.PostProcessing.postprocessing_model import lift_method_preconditions, postprocess
 import Pytrich.FLAGS as FLAGS
+from Pytrich.DESCRIPTIONS import Descriptions
 from Pytrich.model import AbstractTask, Decomposition, Fact, Model, Operator
 
+GROUNDER_ARGS = ("-q", "-D", "-e")
 
 class PandaGrounder:
     def __init__(self, sas_file=None, domain_file=None, problem_file=None):
@@ -17,6 +24,9 @@ class PandaGrounder:
         self.problem_file    = problem_file
         self.sasplus_parser  = None
         self.grounder_status = 'NOT_RUN'
+        self.grounding_cache_status = None
+        self.grounding_time = 0
+        self.grounding_stats = {} # per stage StageStats of the last grounding (see GroundingPipeline)
         self.model = None
         
         # Validate that either sas_file is provided or both domain_file and problem_file are provided
@@ -26,18 +36,49 @@ class PandaGrounder:
     def __call__(self):
         """
         Runs the grounding process if needed, then parses the SAS file.
+        Without a model cache (which is keyed by the SAS file) the grounding is parsed as the grounder writes it.
         """
         if not self.sas_file:
             # If sas_file is not provided, perform grounding
-            self.sas_file = self._run_panda_grounding()
+            self.sas_file = self._run_panda_grounding(parse=not FLAGS.MODEL_CACHE_DIR)
             if self.sas_file is None:
                 print("Grounding failed.")
                 return
         
-        # Parse the SAS file to create the model
-        self.sasplus_parser = SASPlusParser(self._read_sas_file())
-        self.sasplus_parser.parse()
-        return self._build_model()
+        desc = Descriptions()
+        use_postprocessing = FLAGS.USE_PRUNING or FLAGS.USE_TO_REACHABILITY or FLAGS.USE_PULLUP or FLAGS.USE_FLATTENING
+        model_cache = None
+        if FLAGS.MODEL_CACHE_DIR and self.sasplus_parser is None:
+            model_cache = ModelCache(FLAGS.MODEL_CACHE_DIR)
+            stage = 'parsed'
+            if use_postprocessing:
+                stage = 'pruned' + ('-tor' if FLAGS.USE_TO_REACHABILITY else '') + ('-pullup' if FLAGS.USE_PULLUP else '') \
+                    + ('-flat' if FLAGS.USE_FLATTENING else '')
+            if FLAGS.LIFT_METHOD_PRECONDITIONS:
+                stage += '-lifted'
+            cache_key = model_cache.key(self.sas_file, stage)
+            start_time = time.perf_counter()
+            model = model_cache.load(cache_key)
+            print(desc('model_cache', 'hit' if model is not None else 'miss'))
+            if model is not None:
+                print(desc('model_cache_load_time', time.perf_counter() - start_time))
+                return model
+
+        # Parse the SAS file to create the model (unless parsed while grounding)
+        if self.sasplus_parser is None:
+            self.sasplus_parser = SASPlusParser(sas_file=self.sas_file)
+            self.sasplus_parser.parse()
+        print(desc('sas_parse_time', self.sasplus_parser.parse_time))
+        print(desc('sas_parse_throughput', self.sasplus_parser.throughput()))
+        model = self._build_model()
+        if FLAGS.LIFT_METHOD_PRECONDITIONS:
+            print(desc('lifted_method_preconditions', lift_method_preconditions(model)))
+        if use_postprocessing:
+            postprocess(model, use_to_reachability=FLAGS.USE_TO_REACHABILITY, use_pullup=FLAGS.USE_PULLUP,
+                        use_flattening=FLAGS.USE_FLATTENING)
+        if model_cache is not None:
+            model_cache.store(cache_key, model)
+        return model
 
     def _build_model(self):
         facts = [Fact(**fact_dict) for fact_dict in self.sasplus_parser.facts]
@@ -56,17 +97,24 @@ class PandaGrounder:
                     d.task_network[task_id]=abstract_tasks[task_name]
         #processs intial task network
         initial_task_network = [abstract_tasks[t['local_id']]  for t in self.sasplus_parser.initial_task_network]
+        mutex_groups = [tuple(range(g['start'], g['end'] + 1)) for g in self.sasplus_parser.mutex_groups]
         return Model(facts,
                     self.sasplus_parser.initial_state,
                     initial_task_network,
                     self.sasplus_parser.goals,
                     operators,
                     decompositions,
-                    abstract_tasks)
+                    abstract_tasks,
+                    mutex_groups)
 
-    def _run_panda_grounding(self):
+    def _run_panda_grounding(self, parse=False):
         """
-        Run the panda grounding process on the provided domain and problem files.
+        Run the panda grounding process on the provided domain and problem files (see GroundingPipeline),
+        in a temporary directory of its own (concurrent runs don't share intermediate files), on a tmpfs if available.
+        The stages run under FLAGS.GROUNDING_TIMEOUT and FLAGS.GROUNDING_MEMORY_MB, their resource usage is kept in grounding_stats.
+        With parse, the SAS parser reads the grounding as the grounder writes it (sasplus_parser is set).
+        With a grounding cache (FLAGS.GROUNDING_CACHE_DIR) a previous grounding of the same
+        domain, problem and grounder arguments is reused.
         Returns the path to the generated SAS file if successful, otherwise None.
         """
         script_dir = os.path.dirname(__file__)
@@ -78,53 +126,62 @@ class PandaGrounder:
         #domain_base = os.path.splitext(os.path.basename(self.domain_file))[0]
         problem_base = os.path.splitext(os.path.basename(self.problem_file))[0]
 
+        desc = Descriptions()
+        grounding_cache = None
+        if FLAGS.GROUNDING_CACHE_DIR:
+            grounding_cache = GroundingCache(FLAGS.GROUNDING_CACHE_DIR, FLAGS.GROUNDING_CACHE_MB)
+            cache_key = grounding_cache.key(self.domain_file, self.problem_file, GROUNDER_ARGS)
+            cached_psas = grounding_cache.get(cache_key)
+            self.grounding_cache_status = 'hit' if cached_psas is not None else 'miss'
+            print(desc('grounding_cache', self.grounding_cache_status))
+            if cached_psas is not None:
+                self.grounder_status = 'SUCCESS'
+                return cached_psas
+
         if FLAGS.LOG_GROUNDER:
             print(f"Grounding domain: {self.domain_file}\nProblem: {self.problem_file}")
 
-        # Step 1: Parse with pandaPIparser
-        parsed_output = "temp.parsed"
-        result = subprocess.run(
-            [pandaPIparser_path, self.domain_file, self.problem_file, parsed_output],
-            check=True
-        )
-        
-        # Check if parsing was successful
-        if result.returncode != 0 or not os.path.exists(parsed_output):
-            print("Panda Parsing failed.")
-            self.grounder_status = 'FAILED'
-            return None
-        
-        if FLAGS.LOG_GROUNDER:
-            print("Panda Parsing ended")
+        pipeline = GroundingPipeline(pandaPIparser_path, pandaPIgrounder_path, GROUNDER_ARGS,
+                                     timeout=FLAGS.GROUNDING_TIMEOUT, memory_mb=FLAGS.GROUNDING_MEMORY_MB,
+                                     stream=FLAGS.GROUNDING_STREAM)
+        with tempfile.TemporaryDirectory(prefix='pytrich-', dir=tmpfs_dir()) as work_dir:
+            if grounding_cache is not None:
+                grounded_output = os.path.join(work_dir, f"{domain_folder}-{problem_base}.psas")
+            else:
+                grounded_output = f"{domain_folder}-{problem_base}.psas"
+            lines = pipeline.lines(self.domain_file, self.problem_file, work_dir, grounded_output)
+            try:
+                if parse:
+                    self.sasplus_parser = SASPlusParser(sas_stream=lines)
+                    self.sasplus_parser.parse()
+                else:
+                    for _ in lines:
+                        pass
+            except (GroundingError, ValueError) as error:
+                # a truncated grounding can fail parsing before the pipeline reports the failed stage
+                lines.close()
+                self.sasplus_parser = None
+                print(f"Panda Grounding failed: {error}")
+                timed_out = any(stats.status == 'TIMEOUT' for stats in pipeline.stats.values())
+                self.grounder_status = 'TIMEOUT' if timed_out else 'FAILED'
+                return None
+            finally:
+                lines.close()
+                self.grounding_stats = pipeline.stats
+                for stats in pipeline.stats.values():
+                    print(desc('grounding_stage', stats))
 
-        # Step 2: Ground with pandaPIgrounder
-        psas_output = f"{domain_folder}-{problem_base}.psas"
-        result = subprocess.run(
-            [pandaPIgrounder_path, "-q", "-D", "-e", parsed_output, psas_output],
-            check=True
-        )
+            self.grounding_time = pipeline.grounding_time
+            print(desc('grounding_time', self.grounding_time))
+            if FLAGS.LOG_GROUNDER:
+                print("Panda Grounding completed successfully")
 
-        os.remove(parsed_output)
-        
-        # Check if grounding was successful
-        if result.returncode != 0 or not os.path.exists(psas_output):
-            print("Panda Grounding failed.")
-            self.grounder_status = 'FAILED'
-            return None
-        
-        if FLAGS.LOG_GROUNDER:
-            print("Panda Grounding completed successfully")
+            if grounding_cache is not None:
+                grounded_output = grounding_cache.put(cache_key, grounded_output)
         
         self.grounder_status = 'SUCCESS'
-        return psas_output
+        return grounded_output
 
-    def _read_sas_file(self):
-        """
-        Reads the content of the SAS file.
-        """
-        with open(self.sas_file, "r") as file:
-            return file.read()
-    
     def get_model(self):
         """
         Returns the parsed model data from the SAS file.
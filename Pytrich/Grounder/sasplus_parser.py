@@ -1,16 +1,41 @@
-import re
+import mmap
 import sys
-from typing import List, Set, Dict, Union
+import time
+from typing import Dict, Iterable, List, Set, Union
 
 from Pytrich.model import Fact
+from Pytrich.ProblemRepresentation.name_table import NAMES
 
 class SASPlusParser:
-    def __init__(self, sas_content: str):
-        self.sas_content = sas_content.replace('\r\n', '\n').replace('\r', '\n')
-        self.facts: List[str] = []
+    """
+    Single pass, line oriented parser of pandaPI's .psas output.
+    The file is memory mapped and read as bytes, section by section in file order,
+    building the bitmasks of operators, initial state and goals directly.
+    Component names are added to NAMES as read (undecoded), the parsed data holds their ids.
+    """
+    # section header -> (reader, name reported when missing)
+    SECTIONS = {
+        b';; #state features': ('_read_facts', 'State features'),
+        b';; Mutex Groups': ('_read_mutex_groups', 'Mutex groups'),
+        b';; Actions': ('_read_actions', 'Actions'),
+        b';; initial state': ('_read_initial_state', 'Initial state'),
+        b';; goal': ('_read_goals', 'Goal'),
+        b';; tasks (primitive and abstract)': ('_read_task_names', 'Tasks'),
+        b';; initial abstract task': ('_read_initial_abstract_task', 'Initial abstract task'),
+        b';; methods': ('_read_methods', 'Methods'),
+    }
+
+    def __init__(self, sas_content: str = None, sas_file: str = None, sas_stream: Iterable[bytes] = None):
+        if sas_content is None and sas_file is None and sas_stream is None:
+            raise ValueError("Either `sas_content`, `sas_file` or `sas_stream` must be provided.")
+        self.sas_content = sas_content
+        self.sas_file = sas_file
+        self.sas_stream = sas_stream
+        self.facts: List[Dict] = []
+        self.mutex_groups = []
         self.operators = []
         self.abstract_tasks = []
-        self.tasks_by_id: Dict[int, Union[str, List]] = {}  # Mapping of task IDs to names or operator data
+        self.tasks_by_id: Dict[int, Union[int, Dict]] = {}  # Mapping of task IDs to name ids (see NAMES) or operator data
         self.decompositions = []
         self.initial_state: Set[str] = set()
         self.goals: Set[str] = set()
@@ -20,207 +45,204 @@ class SASPlusParser:
         self.count_actions = 0
         self.count_abstract_tasks = 0
         self.count_methods = 0
-        
+
+        self.parsed_bytes = 0
+        self.parse_time = 0
 
     def parse(self):
-        self.parse_facts()
-        self.parse_actions()
-        self.parse_task_names()
-        self.parse_initial_abstract_task()
-        self.parse_methods()
-        self.parse_initial_state()
-        self.parse_goals()
-        
-    def parse_facts(self):
-        state_features_section = re.search(r';; #state features\n(\d+)(.*?)\n\n', self.sas_content, re.DOTALL)
-        if state_features_section:
-            tmp_count_facts, features = state_features_section.groups()
-            self.count_facts = int(tmp_count_facts)
-            # Create a dictionary with fact details instead of Fact instances
-            self.facts = [
-                {'name': fact, 'local_id': f_id, 'global_id': f_id}
-                for f_id, fact in enumerate(feature.strip() for feature in features.strip().split('\n') if feature.strip())
-            ]
-        else:
-            print("State features section not found.")
+        start_time = time.perf_counter()
+        found = set()
+        lines = self._lines()
+        try:
+            for line in lines:
+                section = self.SECTIONS.get(line.strip())
+                if section is not None:
+                    found.add(section)
+                    getattr(self, section[0])(lines)
+        finally:
+            lines.close()
+        for section in self.SECTIONS.values():
+            if section not in found:
+                print(f"{section[1]} section not found.")
+        self.parse_time = time.perf_counter() - start_time
 
-    def _to_binary_representation(self, fact_ids: Set[int]) -> int:
-        """Convert a set of fact IDs to a binary representation."""
-        binary_representation = 0
-        for fact_id in fact_ids:
-            binary_representation |= (1 << fact_id)  # Set the bit at the position of each fact ID
-        return binary_representation
+    def throughput(self):
+        """Parsed MB per second."""
+        return self.parsed_bytes / (1 << 20) / self.parse_time if self.parse_time else 0
 
-    def _parse_effects_line(self, line: str) -> Set[int]:
+    def _lines(self):
         """
-        Parses a line of effects, skipping the fact operation type.
-        Example: '0 28 0 15 0 7 -1' -> {28, 15, 7}
+        Lines of the input as bytes, from a memory map of sas_file (or from sas_content,
+        or as they come from sas_stream, e.g. GroundingPipeline.lines).
         """
-        tokens = line.split()
-        fact_ids = set()
-        
-        num_pairs = len(tokens) // 2
-        for i in range(num_pairs):
-            fact_id = tokens[i * 2 + 1]
-            if fact_id != '-1':
-                fact_ids.add(int(fact_id))
-        return fact_ids
+        if self.sas_stream is not None:
+            for line in self.sas_stream:
+                self.parsed_bytes += len(line)
+                yield line
+            return
+        if self.sas_file is None:
+            content = self.sas_content.encode()
+            self.parsed_bytes = len(content)
+            yield from content.splitlines()
+            return
+        with open(self.sas_file, 'rb') as file:
+            try:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file, can't be mapped
+                return
+            with mapped:
+                self.parsed_bytes = len(mapped)
+                yield from iter(mapped.readline, b'')
 
-    def parse_actions(self):
-        
-        # Parse actions (operators)
-        actions_section = re.search(r';; Actions\n(\d+)(.*?)\n\n', self.sas_content, re.DOTALL)
-        if actions_section:
-            tmp_count_actions, actions = actions_section.groups()
-            self.count_actions = int(tmp_count_actions)
-            action_lines = [line.strip() for line in actions.strip().split('\n') if line.strip()]
-            i = 0
-            while i < len(action_lines):
-                action_data = {
-                    'global_id': self.count_facts+int(i/4), 
-                    'local_id': int(i/4),  
-                    'name': '', 
-                    'cost': int(action_lines[i]),
-                    'pos_precons': self._to_binary_representation({int(x) for x in action_lines[i + 1].split() if x != '-1'}),
-                    'neg_precons': 0,
-                    'add_effects': self._to_binary_representation(self._parse_effects_line(action_lines[i+2])),
-                    'del_effects': self._to_binary_representation(self._parse_effects_line(action_lines[i+3])),
-                }
+    def _next_line(self, lines):
+        """Next non empty line, stripped."""
+        for line in lines:
+            line = line.strip()
+            if line:
+                return line
+        raise ValueError("Parsing failed, unexpected end of file")
+
+    def _parse_facts_line(self, line: bytes) -> int:
+        """
+        Bitmask of a -1 terminated list of facts.
+        Example: b'0 5 9 -1' -> 0b1000100001
+        """
+        bits = 0
+        for token in line.split():
+            if token != b'-1':
+                bits |= 1 << int(token)
+        return bits
 
-                self.operators.append(action_data)
-                i += 4
-            if len(self.operators) != int(self.count_actions):
+    def _parse_effects_line(self, line: bytes) -> int:
+        """
+        Bitmask of a line of effects, skipping the fact operation type.
+        Example: b'0 28 0 15 0 7 -1' -> {28, 15, 7}
+        """
+        bits = 0
+        for token in line.split()[1::2]:
+            if token != b'-1':
+                bits |= 1 << int(token)
+        return bits
+
+    def _read_facts(self, lines):
+        self.count_facts = int(self._next_line(lines))
+        # Create a dictionary with fact details instead of Fact instances
+        self.facts = [
+            {'name': NAMES.add(self._next_line(lines)), 'local_id': f_id, 'global_id': f_id}
+            for f_id in range(self.count_facts)
+        ]
+
+    def _read_mutex_groups(self, lines):
+        # Parse mutex groups (SAS+ variables): first and last fact of a range, and the group name
+        count_groups = int(self._next_line(lines))
+        for _ in range(count_groups):
+            fields = self._next_line(lines).split(None, 2)
+            self.mutex_groups.append({
+                'start': int(fields[0]),
+                'end': int(fields[1]),
+                'name': fields[2].decode() if len(fields) > 2 else ''
+            })
+
+    def _read_actions(self, lines):
+        self.count_actions = int(self._next_line(lines))
+        next_line = self._next_line
+        for op_id in range(self.count_actions):
+            try:
+                cost = int(next_line(lines))
+                pos_precons = self._parse_facts_line(next_line(lines))
+                add_effects = self._parse_effects_line(next_line(lines))
+                del_effects = self._parse_effects_line(next_line(lines))
+            except ValueError:
                 raise ValueError(f"Parsing failed, expected {self.count_actions} actions but got {len(self.operators)}")
-            
-        else:
-            print("Actions section not found.")
+            self.operators.append({
+                'global_id': self.count_facts + op_id,
+                'local_id': op_id,
+                'name': '',
+                'cost': cost,
+                'pos_precons': pos_precons,
+                'neg_precons': 0,
+                'add_effects': add_effects,
+                'del_effects': del_effects,
+            })
 
-    def parse_task_names(self):
+    def _read_task_names(self, lines):
         # Parse tasks (primitive and abstract)
-        tasks_section = re.search(r';; tasks \(primitive and abstract\)\n(\d+)(.*?)\n\n', self.sas_content, re.DOTALL)
-        if tasks_section:
-            tmp_count_tasks, tasks = tasks_section.groups()
-            self.count_abstract_tasks = int(tmp_count_tasks)-self.count_actions
-            task_lines = [line.strip() for line in tasks.strip().split('\n') if line.strip()]
-            for task_id, line in enumerate(task_lines):
-                match = re.match(r'(\d+)\s+(.*)', line)
-                if match:
-                    task_type_str, name = match.groups()
-                    task_type = int(task_type_str)
-                    if task_type == 0:
-                        # Primitive tasks are considered as operators
-                        name = name.strip()
-                        if task_id < len(self.operators):
-                            self.operators[task_id]["name"] = name
-                            self.tasks_by_id[task_id] = self.operators[task_id]
-                        else:
-                            print(f"Warning: Task ID {task_id} exceeds the number of operators.")
-                    elif task_type == 1:
-                        # Abstract tasks are added separately
-                        name = name.strip()
-                        abstract_task_data = {
-                            'global_id': self.count_facts +  task_id, 
-                            'local_id': task_id-self.count_actions,  
-                            'name': name, 
-                            'decompositions': []
-                        }
-                        self.abstract_tasks.append(abstract_task_data)
-                        self.tasks_by_id[task_id] = name
+        count_tasks = int(self._next_line(lines))
+        self.count_abstract_tasks = count_tasks - self.count_actions
+        for task_id in range(count_tasks):
+            line = self._next_line(lines)
+            fields = line.split(None, 1)
+            if len(fields) != 2 or not fields[0].isdigit():
+                print(f"Invalid task line: {line.decode()}")
+                continue
+            task_type = int(fields[0])
+            name = NAMES.add(fields[1].strip())
+            if task_type == 0:
+                # Primitive tasks are considered as operators
+                if task_id < len(self.operators):
+                    self.operators[task_id]["name"] = name
+                    self.tasks_by_id[task_id] = self.operators[task_id]
                 else:
-                    print(f"Invalid task line: {line}")
-        else:
-            print("Tasks section not found.")
+                    print(f"Warning: Task ID {task_id} exceeds the number of operators.")
+            elif task_type == 1:
+                # Abstract tasks are added separately
+                abstract_task_data = {
+                    'global_id': self.count_facts +  task_id,
+                    'local_id': task_id-self.count_actions,
+                    'name': name,
+                    'decompositions': []
+                }
+                self.abstract_tasks.append(abstract_task_data)
+                self.tasks_by_id[task_id] = name
 
-    def parse_methods(self):
-        # Parse methods (decompositions)
-        methods_section = re.search(r';; methods\s*\n(\d+)\s*\n(.*)', self.sas_content, re.DOTALL)
-        if methods_section:
-            count_methods_str, methods_content = methods_section.groups()
-            self.count_methods = int(count_methods_str)
-            method_lines = [line.strip() for line in methods_content.strip().split('\n') if line.strip()]
-            methods = []
-            current_method = []
-            for line in method_lines:
-                if not re.match(r'^(-1|\d)', line):
-                    # method name
-                    if current_method:
-                        methods.append(current_method)
-                    current_method = [line]
+    def _read_methods(self, lines):
+        # Parse methods (decompositions): name, decomposed task, subtasks and orderings lines
+        self.count_methods = int(self._next_line(lines))
+        first_global_id = self.count_facts + self.count_actions + self.count_abstract_tasks
+        for m_local_id in range(self.count_methods):
+            try:
+                method_name = NAMES.add(self._next_line(lines))
+                abstract_task_id = int(self._next_line(lines)) - self.count_actions
+                subtasks_line = self._next_line(lines)
+                self._next_line(lines) # orderings, not available yet
+            except ValueError:
+                raise ValueError(f"Parsing failed, expected {self.count_methods} methods but got {len(self.decompositions)}")
+            subtasks = []
+            for token in subtasks_line.split():
+                if token == b'-1':
+                    continue
+                subtask_id = int(token)
+                if subtask_id >= self.count_actions:
+                    subtasks.append(('AT',subtask_id-self.count_actions))
                 else:
-                    current_method.append(line)
-            if current_method:
-                methods.append(current_method)
-            if len(methods) != self.count_methods:
-                raise ValueError(f"Parsing failed, expected {self.count_methods} methods but got {len(methods)}")
+                    subtasks.append(('O',subtask_id))
 
-            # Parse each method
-            for m_local_id, method in enumerate(methods):
-                # Parse method name
-                method_name = method[0]
-                # Parse abstract task
-                abstract_task_id = int(method[1])-self.count_actions
-                abstract_task = self.abstract_tasks[abstract_task_id]
-                # Parse subtasks
-                subtasks_line = method[2]
-                subtasks_ids = [int(x) for x in subtasks_line.split() if x != '-1']
-                subtasks = []
-                for subtask_id in subtasks_ids:
-                    if subtask_id >= self.count_actions:
-                        subtasks.append(('AT',subtask_id-self.count_actions))
-                    else:
-                        subtasks.append(('O',subtask_id))
-                # Parse orderings
-                orderings = []
-                ordering_line = method[3]
-                if re.match(r'^-?\d+(\s+-?\d+)*\s*-1$', ordering_line):
-                    ordering_elements = [int(x) for x in ordering_line.split() if x != '-1']
-                    for j in range(0, len(ordering_elements), 2):
-                        orderings.append((ordering_elements[j], ordering_elements[j + 1]))
-                
-                decomposition = {
-                    'name': method_name,
-                    'compound_task': abstract_task,
-                    'pos_precons': 0,
-                    'neg_precons': 0,
-                    'task_network': subtasks,
-                    'global_id': self.count_facts+self.count_actions+self.count_abstract_tasks+m_local_id, #,
-                    'local_id': m_local_id #,
-                    #'orderings': orderings #NOTE: task orderings not available yet
-                }
-
-                #self.abstract_tasks[abstract_task['local_id']]['decompositions'].append(decomposition)
-                self.decompositions.append(decomposition)
-        else:
-            print("Methods section not found.")
+            decomposition = {
+                'name': method_name,
+                'compound_task': self.abstract_tasks[abstract_task_id],
+                'pos_precons': 0,
+                'neg_precons': 0,
+                'task_network': subtasks,
+                'global_id': first_global_id + m_local_id,
+                'local_id': m_local_id
+                #'orderings': orderings #NOTE: task orderings not available yet
+            }
+            self.decompositions.append(decomposition)
 
-    def parse_initial_abstract_task(self):
-        initial_task_network_section = re.search(r';; initial abstract task\s*\n(\d+)\s*(?=\n|$)', self.sas_content)
-        if initial_task_network_section:
-            compound_task_id = int(initial_task_network_section.group(1)) - self.count_actions
-            task_name = self.abstract_tasks[compound_task_id]
-            self.initial_task_network.append(task_name)
-        else:
-            print("Initial abstract task section not found.")
+    def _read_initial_abstract_task(self, lines):
+        compound_task_id = int(self._next_line(lines)) - self.count_actions
+        self.initial_task_network.append(self.abstract_tasks[compound_task_id])
 
-    def parse_initial_state(self):
-        initial_state_section = re.search(r';; initial state\n(.*?)\n\n', self.sas_content, re.DOTALL)
-        if initial_state_section:
-            state_indices = [int(x) for x in initial_state_section.group(1).split() if x.strip() and x != '-1']
-            self.initial_state = self._to_binary_representation(set(state_indices))
-        else:
-            print("Initial state section not found.")
+    def _read_initial_state(self, lines):
+        self.initial_state = self._parse_facts_line(next(lines, b''))
 
-    def parse_goals(self):
-        goal_section = re.search(r';; goal\n(.*?)\n\n', self.sas_content, re.DOTALL)
-        if goal_section:
-            goal_indices = [int(x) for x in goal_section.group(1).split() if x.strip() and x != '-1']
-            self.goals = self._to_binary_representation(set(goal_indices))
-        else:
-            print("Goal section not found.")
+    def _read_goals(self, lines):
+        self.goals = self._parse_facts_line(next(lines, b''))
 
     def get_parsed_data(self):
         return {
             'facts': self.facts,
+            'mutex_groups': self.mutex_groups,
             'operators': self.operators,
             'tasks_by_id': self.tasks_by_id,
             'initial_task_network': self.initial_task_network,
@@ -232,6 +254,9 @@ class SASPlusParser:
     def print_parsed_data(self):
         print(f"Facts ({len(self.facts)}):")
         print(self.facts)
+        print(f"\nMutex Groups ({len(self.mutex_groups)}):")
+        for group in self.mutex_groups:
+            print(group)
         print(f"\nOperators ({len(self.operators)}):")
         for idx, op in enumerate(self.operators):
             print(f"Operator {idx}: {op}")
@@ -254,13 +279,10 @@ if __name__ == "__main__":
         print("Usage: python script.py <sas_problem_file_path>")
         sys.exit(1)
 
-    sas_file_path = sys.argv[1]
-    with open(sas_file_path, "r") as problem_file:
-        sas_content = problem_file.read()
-
-    # Create a parser instance and parse the content
-    parser = SASPlusParser(sas_content)
+    # Create a parser instance and parse the file
+    parser = SASPlusParser(sas_file=sys.argv[1])
     parser.parse()
+    print(f"Parsed {parser.parsed_bytes} bytes in {parser.parse_time:.4f}s ({parser.throughput():.2f} MB/s)")
 
     # Optionally, print the parsed data
     parser.print_parsed_data()
@@ -1,5 +1,8 @@
 # store landmarks, needed when landmarks are updated for each new node
+# NOTE: bits are dense landmark indices (see Landmarks.build_dense_index), not AND/OR node IDs
 class BitLm_Node:
+    __slots__ = ('lms', 'mark', 'total_cost', 'achieved_cost', 'tn_lms')
+
     def __init__(self, parent=None):
         if parent:
             self.lms = parent.lms
@@ -11,19 +14,39 @@ class BitLm_Node:
             self.mark = 0
             self.total_cost   = 0   # total number of lms
             self.achieved_cost = 0   # total achieved lms
+        self.tn_lms = None # landmarks of task network suffixes, see LandmarkCountHeuristic._tn_lms
             
     # mark as 'achieved' if node is a lm and not already marked
-    def mark_lm(self, node_id, lm_cost=1):
-        if self.lms & (1 << node_id) and ~self.mark & (1 << node_id):
+    def mark_lm(self, lm_index, lm_cost=1):
+        if self.lms & (1 << lm_index) and ~self.mark & (1 << lm_index):
             self.achieved_cost+=lm_cost
-        self.mark |= 1 << node_id
+        self.mark |= 1 << lm_index
+
+    # mark every landmark in 'mask' at once, lm_costs gives the cost of each landmark index (default 1)
+    def mark_lms(self, mask, lm_costs=None):
+        new_lms = mask & self.lms & ~self.mark
+        if new_lms:
+            if lm_costs is None:
+                self.achieved_cost += new_lms.bit_count()
+            else:
+                while new_lms:
+                    low_bit = new_lms & -new_lms
+                    self.achieved_cost += lm_costs[low_bit.bit_length() - 1]
+                    new_lms ^= low_bit
+        self.mark |= mask
+
+    # unmark an achieved landmark, it has to be achieved again (lm_cost as given when marked)
+    def unmark_lm(self, lm_index, lm_cost=1):
+        if self.lms & self.mark & (1 << lm_index):
+            self.achieved_cost-=lm_cost
+        self.mark &= ~(1 << lm_index)
 
-    def is_active_lm(self, node_id):
-        return self.lms & (1 << node_id) and ~self.mark & (1 << node_id)
+    def is_active_lm(self, lm_index):
+        return self.lms & (1 << lm_index) and ~self.mark & (1 << lm_index)
     
-    # for recomputing landmarks and update lms
+    # for recomputing landmarks and update lms (only landmarks not known nor achieved yet are added)
     def update_lms(self, u_lms):
-        new_bits = u_lms & ~self.mark
+        new_bits = u_lms & ~(self.lms | self.mark)
         self.lms |= new_bits
         self.total_cost += new_bits.bit_count()
         
@@ -37,10 +60,10 @@ class BitLm_Node:
     
     def get_unreached_landmarks(self):
         unreached = []
-        for i in range(len(bin(self.lms))-2):
+        for i in range(self.lms.bit_length()):
             if self.lms & (1 << i) and not self.mark & (1 << i):
                 unreached.append(i)
         return unreached
 
     def __str__(self):
-        return f"Lms (value={self.lm_value()}): \n\tlms: {bin(self.lms)}\n\tachieved: {bin(self.mark)}\n"
\ No newline at end of file
+        return f"Lms (value={self.lm_value()}): \n\tlms: {bin(self.lms)}\n\tachieved: {bin(self.mark)}\n"
@@ -2,14 +2,150 @@ from collections import deque
 from copy import deepcopy
 import gc
 import math
+import time
 
+from Pytrich.Heuristics.Landmarks.lp_solver import solve_packing_lp
 from Pytrich.ProblemRepresentation.and_or_graph import AndOrGraph
-from Pytrich.ProblemRepresentation.and_or_graph import NodeType
+from Pytrich.ProblemRepresentation.and_or_graph import NodeType, AND_NODE, OR_NODE, INIT_NODE
 from Pytrich.ProblemRepresentation.and_or_graph import ContentType
 from Pytrich.model import Model
+
+def _bit_positions(bits):
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+def disjunction_masks(model, index_of, appears_in):
+    '''
+    For each operator and method (by global id), the bitmask of landmark disjunctions it appears in.
+    index_of maps a component to its unique landmark index, appears_in maps this index to disjunctions.
+    '''
+    masks = [0] * (model.idec_end + 1)
+    for component_id in range(model.iop_init, model.idec_end + 1):
+        for dlm in appears_in[index_of.get(component_id, -1)]:
+            masks[component_id] |= 1 << dlm
+    return masks
+
+class LandmarkTable:
+    '''
+    Landmark sets of AND/OR nodes (node ID -> bitset), computed on demand.
+    The landmarks of a node only depend on its ancestors, so the fixpoint is only computed
+    over the ancestors of the nodes looked up, extending this region when needed.
+    Nodes not reached yet keep the initial 'all nodes' set implicitly (None),
+    instead of each holding a graph-wide bitset.
+    If the stored sets exceed memory_budget bytes, the table falls back to trivial
+    landmarks (each node is only a landmark of itself).
+    The graph is kept in its compact form (CompactAndOrGraph) for lookups during search.
+    '''
+    def __init__(self, and_or_graph, memory_budget=None):
+        self.and_or_graph = and_or_graph
+        self.all_nodes = (1 << len(and_or_graph)) - 1
+        self.table = {}
+        self.memory_budget = memory_budget
+        self.memory = 0
+        self.iterations = 0
+        self.exhausted = False
+
+    def __len__(self):
+        return len(self.and_or_graph)
+
+    def __getitem__(self, n_id):
+        if n_id not in self.table:
+            self._extend(n_id)
+        if self.exhausted:
+            return 1 << n_id
+        lms = self.table[n_id]
+        return self.all_nodes if lms is None else lms
+
+    def _extend(self, n_id):
+        if self.exhausted:
+            return
+        table = self.table
+        graph = self.and_or_graph
+        pred, pred_start, node_type = graph.pred, graph.pred_start, graph.node_type
+        # collect ancestors not computed yet
+        region = []
+        stack = [n_id]
+        table[n_id] = None
+        while stack:
+            node = stack.pop()
+            region.append(node)
+            for p in pred[pred_start[node]:pred_start[node+1]]:
+                if p not in table:
+                    table[p] = None
+                    stack.append(p)
+        # start from sources, init nodes and nodes whose predecessors were already computed
+        queue = deque([node for node in region 
+                       if pred_start[node] == pred_start[node+1] or node_type[node] == INIT_NODE
+                       or any(table[p] is not None for p in pred[pred_start[node]:pred_start[node+1]])])
+        self._propagate(queue)
+
+    def refresh(self, and_or_graph=None):
+        '''
+        Recompute the fixpoint over the current region starting from its current sets
+        (used when the graph changed, see AndOrGraph.update_bu_graph).
+        '''
+        if and_or_graph is not None:
+            self.and_or_graph = and_or_graph
+        if self.exhausted:
+            return
+        pred_start, node_type = self.and_or_graph.pred_start, self.and_or_graph.node_type
+        region = list(self.table)
+        for node in region:
+            if node_type[node] == INIT_NODE:
+                self._store(node, 0)
+        self._propagate(deque([node for node in region if pred_start[node] == pred_start[node+1] or node_type[node] == INIT_NODE]))
+
+    def _propagate(self, queue):
+        table = self.table
+        graph = self.and_or_graph
+        pred, pred_start, node_type = graph.pred, graph.pred_start, graph.node_type
+        succ, succ_start = graph.succ, graph.succ_start
+        while queue:
+            self.iterations += 1
+            node = queue.popleft()
+            new_landmarks = 0
+            start, end = pred_start[node], pred_start[node+1]
+            if node_type[node] == OR_NODE and start < end:
+                new_landmarks = None # intersection starting with ALLNODES
+                for p in pred[start:end]:
+                    pred_lms = table[p]
+                    if pred_lms is not None:
+                        new_landmarks = pred_lms if new_landmarks is None else new_landmarks & pred_lms
+            elif node_type[node] == AND_NODE and start < end:
+                for p in pred[start:end]:
+                    pred_lms = table[p]
+                    if pred_lms is None:
+                        new_landmarks = None
+                        break
+                    new_landmarks |= pred_lms
+            if new_landmarks is not None:
+                new_landmarks |= (1 << node)
+            
+            if new_landmarks != table[node]:
+                self._store(node, new_landmarks)
+                if self.exhausted:
+                    return
+                for s in succ[succ_start[node]:succ_start[node+1]]:
+                    if s in table:
+                        queue.append(s)
+
+    def _store(self, n_id, lms):
+        old_lms = self.table[n_id]
+        self.memory += ((lms.bit_length() + 7) >> 3 if lms is not None else 0) \
+                     - ((old_lms.bit_length() + 7) >> 3 if old_lms is not None else 0)
+        self.table[n_id] = lms
+        if self.memory_budget is not None and self.memory > self.memory_budget:
+            print(f'landmark table exceeded {self.memory_budget} bytes: using trivial landmarks')
+            self.exhausted = True
+            self.table = {}
+            self.memory = 0
+
 class Landmarks:
-    def __init__(self, model:Model, bu:bool, bid:bool, mt:bool):
+    def __init__(self, model:Model, bu:bool, bid:bool, mt:bool, memory_budget=None):
         self.model=model
+        self.memory_budget = memory_budget # bytes per landmark table
         self.count_operator_lms = 0
         self.count_abtask_lms  = 0
         self.count_fact_lms    = 0
@@ -27,99 +163,94 @@ class Landmarks:
         self.mt_count  = None
         self.mt_lookup = None
         self.bu_graph  = None
+        self.own_bu_graph = False # bu_graph is shared (model.graphs) until updated for a state
         self.bu_count  = None
         self.bu_lookup = None
         self.td_graph  = None
         self.td_count  = None
         self.td_lookup = None
+        # dense landmark indexing (see build_dense_index)
+        self.lm_node_ids  = []
+        self.lm_bit       = {}
+        self.achieve_mask = None
+        self.delete_mask  = None
+        # top-down and bidirectional closure statistics
+        self.closure_time  = 0
+        self.closure_nodes = 0
+        # optimal cost partitioning: value and basic landmarks per component (see compute_ocp)
+        self.ocp_components = {}
+        self.ocp_cache_size = 100000
         if mt:
-            self.mt_graph  = AndOrGraph(model, graph_type=2)
+            self.mt_graph  = model.graphs.get(2)
             self.mt_count  = len(self.mt_graph.nodes)
-            self.mt_lookup = [None] * self.mt_count
         if bu:
-            self.bu_graph  = AndOrGraph(model, graph_type=0)
+            self.bu_graph  = model.graphs.get(0)
             self.bu_count  = len(self.bu_graph.nodes)
-            self.bu_lookup = [None] * self.bu_count
         if bid:
-            self.td_graph  = AndOrGraph(model, graph_type=1)
+            self.td_graph  = model.graphs.get(1)
             self.td_count  = len(self.td_graph.nodes)
-            self.td_lookup = [None] * self.td_count
     
     def generate_mt_table(self, reinitialize=True):
-        self._generate_lm_table(self.mt_lookup, self.mt_graph, reinitialize)
+        self.mt_lookup = self._generate_lm_table(self.mt_lookup, self.mt_graph, reinitialize)
     
     def generate_bu_table(self, state=None, reinitialize=True):
         if not reinitialize:
+            if not self.own_bu_graph:
+                # the shared graph is read-only: update a graph of our own
+                self.bu_graph = AndOrGraph(self.model, graph_type=0)
+                self.own_bu_graph = True
+                self.bu_lookup = None
             self.bu_graph.update_bu_graph(state)
-        self._generate_lm_table(self.bu_lookup, self.bu_graph, reinitialize)
+        self.bu_lookup = self._generate_lm_table(self.bu_lookup, self.bu_graph, reinitialize)
 
     def generate_td_table(self, reinitialize=True):
-        self._generate_lm_table(self.td_lookup, self.td_graph, reinitialize)
+        self.td_lookup = self._generate_lm_table(self.td_lookup, self.td_graph, reinitialize)
     
     def _generate_lm_table(self, lm_table, and_or_graph, reinitialize):
         """
         
-        We calculate landmarks using binary representation
+        We calculate landmarks using binary representation,
+            landmarks of each node are computed on demand (see LandmarkTable)
         """
-        queue = deque([node for node in and_or_graph.nodes if node and (len(node.predecessors) == 0 or node.type == NodeType.INIT)])
-        it=0
-
-        for node in and_or_graph.nodes:
-            if node and node.type == NodeType.INIT:
-                lm_table[node.ID] = 0
-            if reinitialize:
-            #else:
-                lm_table[node.ID] = (1 << len(and_or_graph.nodes)) - 1
-
-        while queue:
-            it+=1
-            node = queue.popleft()
-            new_landmarks= 0
-            if node.type == NodeType.OR and node.predecessors:
-                new_landmarks= (1 << len(and_or_graph.nodes)) - 1 # initialize intersection operation with ALLNODES
-                for pred_lm in node.predecessors:
-                    new_landmarks &= lm_table[pred_lm.ID]
-            elif node.type == NodeType.AND and node.predecessors:
-                for pred_lm in node.predecessors:
-                    new_landmarks |= lm_table[pred_lm.ID]
-            new_landmarks |= (1<<node.ID)
-            
-            if  new_landmarks != lm_table[node.ID]:
-                lm_table[node.ID] = new_landmarks
-                for succ in node.successors:
-                    queue.append(succ)
-        if reinitialize:
-            print(f'ITERATIONS {it}')
+        if reinitialize or lm_table is None:
+            return LandmarkTable(and_or_graph.compact(), self.memory_budget)
+        lm_table.refresh(and_or_graph.compact())
+        return lm_table
 
     def bidirectional_lms(self):
-        self.bid_lms = 0
-        new_lms = self.bu_lms
-        it_n = 0
-        # iterate over each landmark and increment with td and bu landmarks while new landmarks are discovered
-        while new_lms != self.bid_lms:
-            it_n += 1
-            self.bid_lms = new_lms
-            for n_id in range(len(self.bu_graph.nodes)):
-                if new_lms & (1 << n_id):
-                    new_lms |= self.bu_lookup[n_id]
-                if new_lms & (1 << n_id):
-                    new_lms |= self.td_lookup[n_id]
-        self.bid_lms = self.bid_lms & ((1 << len(self.bu_graph.nodes))-1) #remove recomposition nodes
+        """
+        Closure of the bottom-up landmarks under the bottom-up and top-down landmarks of each landmark.
+        Worklist over the landmark bits: each node is expanded once, when it becomes a landmark,
+        so lookups are only computed for landmarks.
+        """
+        start_time = time.perf_counter()
+        node_mask = (1 << len(self.bu_graph.nodes)) - 1 # recomposition nodes are not expanded
+        bid_lms = self.bu_lms
+        queue = deque(_bit_positions(bid_lms & node_mask))
+        while queue:
+            n_id = queue.popleft()
+            self.closure_nodes += 1
+            new_lms = (self.bu_lookup[n_id] | self.td_lookup[n_id]) & ~bid_lms
+            if new_lms:
+                bid_lms |= new_lms
+                queue.extend(_bit_positions(new_lms & node_mask))
+        self.bid_lms = bid_lms & node_mask #remove recomposition nodes
+        self.closure_time += time.perf_counter() - start_time
 
     def top_down_lms(self):
-        for lm in range(self.bu_lms.bit_length()):
-            if self.bu_lms & (1 << lm):
-                self.td_lms |= self.td_lookup[lm]
+        start_time = time.perf_counter()
+        for lm in _bit_positions(self.bu_lms):
+            self.closure_nodes += 1
+            self.td_lms |= self.td_lookup[lm]
+        self.closure_time += time.perf_counter() - start_time
 
     def bottom_up_lms(self, state, task_network, reinitialize=True):
         # GOAL SET: tnI U G
         # compute landmarks based on the initial state and goal conditions
         self.bu_lms = state
         if not reinitialize:
-            for fact_pos in range(self.model.goals.bit_length()):
-                if self.model.goals & (1 << fact_pos) and ~state & (1 << fact_pos):
-                #if self.model.goals & (1 << fact_pos): # and ~self.model.initial_state & (1 << fact_pos):
-                    self.bu_lms |= self.bu_lookup[fact_pos]
+            for fact_pos in _bit_positions(self.model.goals & ~state):
+                self.bu_lms |= self.bu_lookup[fact_pos]
             
                 
         # compute landmarks based on task network
@@ -168,10 +299,7 @@ class Landmarks:
         # Assign a unique index for each landmark element and record its appearances.
         iof = 0
         dlm=0
-        for lm_id in range(landmarks.bit_length()):
-            if ~landmarks & (1 << lm_id):
-                continue
-
+        for lm_id in _bit_positions(landmarks):
             node = self.bu_graph.nodes[lm_id]
             if node.type == NodeType.INIT:
                 continue
@@ -210,8 +338,58 @@ class Landmarks:
         
              
         self.bu_lms = (1 << dlm) - 1
+        self.achieve_mask = disjunction_masks(self.model, self.index_of, self.appears_in)
+        self.elements_of = [[] for _ in range(dlm)]
+        for uid, appearance_list in self.appears_in.items():
+            for lm_index in appearance_list:
+                self.elements_of[lm_index].append(uid)
         return self.ucp_cost
 
+    def compute_ocp(self, remaining, warm_basis=(), deadline=None):
+        """
+        Compute Optimal Cost Partitioning (OCP) for the disjunctive landmarks in 'remaining' (see compute_ucp):
+            max sum(h_d) s.t. for each landmark element e: sum(h_d for d containing e) <= 1
+        The LP splits into components of landmarks sharing elements,
+        each one solved once (see lp_solver) and memoized in self.ocp_components
+        (cleared when it reaches ocp_cache_size entries).
+        Returns the value and the basic landmarks, used to warm start similar sets.
+        """
+        value = 0
+        basis = set()
+        pending = remaining
+        while pending:
+            # collect the component of the lowest pending landmark
+            component = []
+            comp_mask = pending & -pending
+            stack = [comp_mask.bit_length() - 1]
+            while stack:
+                dlm = stack.pop()
+                component.append(dlm)
+                for uid in self.elements_of[dlm]:
+                    for other in self.appears_in[uid]:
+                        if remaining & (1 << other) and not comp_mask & (1 << other):
+                            comp_mask |= 1 << other
+                            stack.append(other)
+            pending &= ~comp_mask
+
+            solved = self.ocp_components.get(comp_mask)
+            if solved is None:
+                if len(component) == 1:
+                    solved = (1.0, (component[0],))
+                else:
+                    component.sort()
+                    rows = {}
+                    columns = [[rows.setdefault(uid, len(rows)) for uid in self.elements_of[dlm]] for dlm in component]
+                    comp_warm = [j for j, dlm in enumerate(component) if dlm in warm_basis]
+                    comp_value, comp_basis = solve_packing_lp(columns, [1] * len(rows), comp_warm, deadline)
+                    solved = (comp_value, tuple(component[j] for j in comp_basis))
+                if len(self.ocp_components) >= self.ocp_cache_size:
+                    self.ocp_components.clear()
+                self.ocp_components[comp_mask] = solved
+            value += solved[0]
+            basis.update(solved[1])
+        return value, basis
+
 
     def compute_gn_fact_orderings(self, lm_table, and_or_graph, lm_set):
         '''
@@ -320,8 +498,8 @@ class Landmarks:
 
          
     def identify_lms(self, lm_set, and_or_graph):
-        for lm_id in range(lm_set.bit_length()):
-            if lm_id < len(and_or_graph.nodes) and lm_set & (1 << lm_id):
+        for lm_id in _bit_positions(lm_set):
+            if lm_id < len(and_or_graph.nodes):
                 if and_or_graph.nodes[lm_id].content_type == ContentType.FACT:
                     self.count_fact_lms +=1
                 elif and_or_graph.nodes[lm_id].content_type == ContentType.METHOD:
@@ -331,6 +509,52 @@ class Landmarks:
                 elif and_or_graph.nodes[lm_id].content_type == ContentType.OPERATOR:
                     self.count_operator_lms +=1
 
+    def build_dense_index(self, lm_set, and_or_graph, universe=0):
+        '''
+        Remap landmarks from AND/OR node IDs to a dense 0..L-1 index, so each search node
+        stores L-bit wide landmark sets instead of sets spanning the whole graph.
+            lm_node_ids[i]: node ID of the i-th landmark
+            lm_bit[node_id]: bit of the landmark (missing if not a landmark)
+            achieve_mask[global_id]: landmarks achieved by an operator (itself and its add effects)
+                or a method (itself and its compound task)
+            delete_mask[global_id]: fact landmarks deleted by an operator
+        'universe' adds nodes that may become landmarks later (e.g. bottom-up updates during search).
+        '''
+        universe = (lm_set | universe) & ((1 << len(and_or_graph.nodes)) - 1)
+        self.lm_node_ids = list(_bit_positions(universe))
+        self.lm_bit = {n_id: 1 << lm_i for lm_i, n_id in enumerate(self.lm_node_ids)}
+        lm_bit = self.lm_bit
+        self.achieve_mask = [0] * (self.model.idec_end + 1)
+        self.delete_mask  = [0] * (self.model.idec_end + 1)
+        for o in self.model.operators:
+            mask = lm_bit.get(o.global_id, 0)
+            for fact_pos in _bit_positions(o.add_effects):
+                mask |= lm_bit.get(fact_pos, 0)
+            self.achieve_mask[o.global_id] = mask
+            self.delete_mask[o.global_id] = self.to_dense(o.del_effects)
+        for d in self.model.decompositions:
+            self.achieve_mask[d.global_id] = lm_bit.get(d.global_id, 0) | lm_bit.get(d.compound_task.global_id, 0)
+        return self.to_dense(lm_set)
+
+    def to_dense(self, node_set):
+        '''
+        Convert a set of AND/OR node IDs into dense landmark bits (ignoring non-landmarks).
+        '''
+        dense = 0
+        lm_bit = self.lm_bit
+        for n_id in _bit_positions(node_set):
+            dense |= lm_bit.get(n_id, 0)
+        return dense
+
+    def release_graphs(self):
+        '''
+        Drop the AND/OR graphs once landmarks are generated,
+        landmark tables keep the compact graphs they need during search.
+        '''
+        self.mt_graph = None
+        self.bu_graph = None
+        self.td_graph = None
+
     def clear_structures(self):
         self.bu_graph = None
         self.r_graph = None
@@ -1,29 +1,37 @@
+from array import array
 from collections import deque
 from copy import deepcopy
 import heapq
 import math
 import time
-from Pytrich.ProblemRepresentation.and_or_graph import AndOrGraph, NodeType, ContentType
+from Pytrich.Heuristics.Landmarks.landmark import _bit_positions, disjunction_masks
+from Pytrich.ProblemRepresentation.and_or_graph import AND_NODE, INIT_NODE, ContentType
+
+OPERATOR = ContentType.OPERATOR.value
+METHOD = ContentType.METHOD.value
 
 class LMCutRC:
     """
     Computes an LM‐Cut heuristic over the Relaxed Composition (RC) graph.
     
-    The RC graph is assumed to be an instance of AndOrGraph built via rc_initialize.
+    The RC graph is the compact form (CompactAndOrGraph) of the AndOrGraph built via rc_initialize.
     
     Cost propagation:
       - INIT nodes (facts in the initial state) have cost 0.
       - For AND nodes, cost = local_cost (if any) + max_{p in predecessors} cost(p)
       - For OR nodes, cost = min_{p in predecessors} cost(p)
     
-    Only operator nodes (i.e. AND nodes with content_type OPERATOR) carry a weight
-    (stored in node.weight). These are the only nodes whose cost is reduced when a
-    landmark cut is extracted.
+    AND nodes carry a weight (stored in the graph's weight array): the operator cost, and 1 for methods
+    unless method_cost is given (e.g. 0 when decompositions add nothing to the plan cost, as for LMCUT).
+    Their cost is reduced when a landmark cut is extracted.
+
+    The cuts can be computed for any state (facts of the state are the INIT nodes),
+    see lm_cut; costs are reduced over a copy of local_costs.
     """
 
-    def __init__(self, model):
+    def __init__(self, model, method_cost=None):
         self.model= model
-        self.graph = AndOrGraph(model, graph_type=3)
+        self.graph = model.graphs.compact(3)
         self.lms = set()
         
         self.count_operator_lms = 0
@@ -33,145 +41,165 @@ class LMCutRC:
         self.index_of = {}
         self.appears_in = {}
         self.appears_in[-1]=[]
-        self.local_costs = {}
-        for node in self.graph.nodes:
-            self.index_of[node.ID] = -1
+        self.achieve_mask = None # disjunctions each operator/method appears in
+        self.elapsed_time = 0
+        n_nodes = len(self.graph)
+        self.local_costs = array('q', [0]) * n_nodes
+        self.init_operators = [] # operators without preconditions are always INIT nodes
+        self.init_ids = set()    # INIT nodes of the current computation
+        self.is_init = bytearray(n_nodes)
+        self.is_and = bytearray(n_nodes)
+        node_type, content_type = self.graph.node_type, self.graph.content_type
+        for n_id in range(n_nodes):
+            self.index_of[n_id] = -1
             
-            if node is not None and node.type == NodeType.AND:
-                self.local_costs[node.ID] = node.weight
+            if node_type[n_id] == AND_NODE:
+                if method_cost is not None and content_type[n_id] == METHOD:
+                    self.local_costs[n_id] = method_cost
+                else:
+                    self.local_costs[n_id] = self.graph.weight[n_id]
+                self.is_and[n_id] = 1
+            elif node_type[n_id] == INIT_NODE and content_type[n_id] == OPERATOR:
+                self.init_operators.append(n_id)
+        # CSR adjacency of the compact graph: successors of n are succ[succ_start[n]:succ_start[n+1]] (same for predecessors)
+        # (as lists: slicing is faster than with array.array)
+        self.succ_start = self.graph.succ_start
+        self.pred_start = self.graph.pred_start
+        self.succ = list(self.graph.succ)
+        self.pred = list(self.graph.pred)
+        self.n_pred = array('l', [self.pred_start[n+1] - self.pred_start[n] for n in range(n_nodes)])
+        # AND nodes without predecessors (e.g. methods without subtasks nor preconditions) never get
+        # their cost from a predecessor: they start with their local cost
+        self.source_ands = [n_id for n_id in range(n_nodes) if self.is_and[n_id] and not self.n_pred[n_id]]
+        # preallocated vectors indexed by node ID, reset by copying these templates
+        # (cost, pcf and num_ft are lists: faster than array.array for element-wise access)
+        # unreached AND nodes start at inf so an update never lowers an OR node below its reached achievers
+        self._init_cost = [math.inf] * n_nodes
+        self._zeros = [0] * n_nodes
+        self._no_pcf = [-1] * n_nodes
+        self.cost   = list(self._init_cost)
+        self.pcf    = list(self._no_pcf)
+        self.num_ft = list(self._zeros)
+        self.forced_true = bytearray(n_nodes)
+        self.in_update = bytearray(n_nodes)
+        self.visited = bytearray(n_nodes)
+        self.stack = []
         
-    def hmax_update(self, cut, cut_cost, pcf, cost):
-        needs_update = set()
+    def hmax_update(self, cut, cut_cost, pcf, cost, local_costs=None):
+        if local_costs is None:
+            local_costs = self.local_costs
+        succ, succ_start = self.succ, self.succ_start
+        pred, pred_start = self.pred, self.pred_start
+        is_and, is_init = self.is_and, self.is_init
+        in_update = self.in_update
+        needs_update = []
         for c in cut:
-            # old_cost = cost[c]
             cost[c] -= cut_cost
-            node_c = self.graph.nodes[c]
-            #print(f"Cut update: Node {node_c.str_name} (ID {c}) cost updated from {old_cost} to {cost[c]} (subtracted cut_cost {cut_cost})")
-            for succ in node_c.successors:
-                needs_update.add(succ.ID)
-            #    print(f"  Adding successor {succ.str_name} (ID {succ.ID}) for update")
+            for s_id in succ[succ_start[c]:succ_start[c+1]]:
+                if not in_update[s_id]:
+                    in_update[s_id] = 1
+                    needs_update.append(s_id)
         
         while needs_update:
-            next_updates =set()
-            #print("\n--- New update round ---")
-            #update_names = [self.graph.nodes[nid].str_name for nid in needs_update]
-            #print("Nodes to update:", len(update_names))
-
+            next_updates = []
             for nid in needs_update:
-                node = self.graph.nodes[nid]
-                if node.type == NodeType.AND:
+                in_update[nid] = 0
+            for nid in needs_update:
+                if is_init[nid]:
+                    continue
+                if is_and[nid]:
                     max_val=-math.inf
                     curr_pcf = -1
-                    for pred in node.predecessors:
-                        if cost[pred.ID] > max_val:
-                            max_val=cost[pred.ID]
-                            curr_pcf=pred.ID
-                    # print(f"AND Node {node.str_name} (ID {nid}):")
-                    # print(f"  - Max predecessor cost = {max_val} from node {self.graph.nodes[curr_pcf].str_name if curr_pcf is not None else 'None'}")
-                    # print(f"  - Local cost = {self.local_costs.get(nid, 0)}")
-                    # print(f"  - Current cost = {cost[nid]}, New computed cost = {max_val + self.local_costs[nid]}")
+                    for p_id in pred[pred_start[nid]:pred_start[nid+1]]:
+                        if cost[p_id] > max_val:
+                            max_val=cost[p_id]
+                            curr_pcf=p_id
                     if pcf[nid] != curr_pcf or max_val != cost[nid]:
                         pcf[nid] = curr_pcf
                         nid_old_cost = cost[nid]
-                        cost[nid] = max_val + self.local_costs[nid]
-                        for succ in node.successors:
+                        cost[nid] = max_val + local_costs[nid]
+                        for s_id in succ[succ_start[nid]:succ_start[nid+1]]:
                             # [OPT] only update successor (OR nodes) if the new value affects the successors
-                            if pcf[succ.ID] and \
-                                ((pcf[succ.ID] != nid and cost[pcf[succ.ID]] > cost[nid]) or \
-                                (pcf[succ.ID] == nid and nid_old_cost != cost[nid])):
-                                next_updates.add(succ.ID)
-                elif node.type == NodeType.OR:
+                            s_pcf = pcf[s_id]
+                            if s_pcf > 0 and not in_update[s_id] and \
+                                ((s_pcf != nid and cost[s_pcf] > cost[nid]) or \
+                                (s_pcf == nid and nid_old_cost != cost[nid])):
+                                in_update[s_id] = 1
+                                next_updates.append(s_id)
+                else: # OR node (or a fact not holding in the current state)
                     min_val=math.inf
                     curr_pcf = -1 # pcf for OR nodes is useless, debug verificaiton only
-                    # print(f"OR Node {node.str_name} (ID {nid}):")
-                    # print(f'Predecessors:')
-                    for pred in node.predecessors:
-                        #print(f'\t{pred.str_name} and cost {cost[pred.ID]}')
-                        if cost[pred.ID] < min_val:
-                            min_val=cost[pred.ID]
-                            curr_pcf=pred.ID
-                    # print()
-                    # print(f"  - Min predecessor cost = {min_val} from node {self.graph.nodes[curr_pcf].str_name if curr_pcf is not None else 'None'}")
-                    # print(f"  - Current cost = {cost[nid]}, New computed cost = {min_val}")
+                    for p_id in pred[pred_start[nid]:pred_start[nid+1]]:
+                        if cost[p_id] < min_val:
+                            min_val=cost[p_id]
+                            curr_pcf=p_id
                     if min_val != cost[nid]:
                         pcf[nid] = curr_pcf
                         cost[nid] = min_val
-                        for succ in node.successors:
+                        for s_id in succ[succ_start[nid]:succ_start[nid+1]]:
                             # [OPT] only update successor (AND nodes) if the new value affects the successors
-                            if pcf[succ.ID] == nid:
-                                next_updates.add(succ.ID)
+                            if pcf[s_id] == nid and not in_update[s_id]:
+                                in_update[s_id] = 1
+                                next_updates.append(s_id)
 
             needs_update = next_updates
 
-
-
-    def compute_h_max(self):
-        cost = {}
-        num_ft = {}
-        forced_true = {}
+    def compute_h_max(self, state=None, local_costs=None):
+        """
+        Compute hmax costs from a state (default: the initial state).
+        Returns the (reused) cost and pcf vectors indexed by node ID, pcf is -1 if undefined.
+        """
+        if state is None:
+            state = self.model.initial_state
+        if local_costs is None:
+            local_costs = self.local_costs
+        for n_id in self.init_ids:
+            self.is_init[n_id] = 0
+        self.init_ids = set(_bit_positions(state))
+        self.init_ids.update(self.init_operators)
+        for n_id in self.init_ids:
+            self.is_init[n_id] = 1
+        succ, succ_start = self.succ, self.succ_start
+        pred, pred_start = self.pred, self.pred_start
+        is_and, n_pred = self.is_and, self.n_pred
+        cost, pcf, num_ft, forced_true = self.cost, self.pcf, self.num_ft, self.forced_true
+        cost[:] = self._init_cost
+        pcf[:] = self._no_pcf
+        num_ft[:] = self._zeros
+        forced_true[:] = bytes(len(forced_true))
         heap = []
-        for node in self.graph.nodes:
-            num_ft[node.ID]=0
-            forced_true[node.ID]= False
-            if node.type == NodeType.INIT:
-                cost[node.ID] = 0
-                heapq.heappush(heap, (0, node.ID))
-            elif node.type == NodeType.AND:
-                cost[node.ID] = -math.inf
-            else:
-                cost[node.ID] = math.inf
-        pcf = {node.ID: None for node in self.graph.nodes}
+        for n_id in sorted(self.init_ids):
+            cost[n_id] = 0
+            heap.append((0, n_id))
+        for n_id in self.source_ands:
+            cost[n_id] = local_costs[n_id]
+            heap.append((local_costs[n_id], n_id))
+        heapq.heapify(heap)
         while heap:
             c, u_id = heapq.heappop(heap)
-            u_node = self.graph.nodes[u_id]
-            # print(f'{u_node.str_name}')
-            # print(f'\t{u_node.type}')
-            # print(f'\t{num_ft[u_id]} {len(u_node.predecessors)}')
-            # print(f'\t{c} {cost[u_id]}')
-            # assert (u_node.type == NodeType.AND and num_ft[u_id] == len(u_node.predecessors)) or\
-            #     (u_node.type == NodeType.OR and num_ft[u_id] >= 1) or\
-            #     (u_node.type == NodeType.INIT)
-            
             if cost[u_id] != c:
                 continue
             if forced_true[u_id]:
                 continue
             forced_true[u_id]=True
-            for v_node in u_node.successors:
-                v_id = v_node.ID
+            for v_id in succ[succ_start[u_id]:succ_start[u_id+1]]:
                 num_ft[v_id]+=1
-                if v_node.type == NodeType.OR:
-                    new_cost = c
-                    if new_cost < cost[v_id]:
+                if not is_and[v_id]:
+                    if c < cost[v_id]:
                         cost[v_id]=c
                         pcf[v_id] = u_id
                         heapq.heappush(heap, (c, v_id))
-                        # print(f'\tnew cost: {cost[v_id]} to {v_node.str_name}')
-                elif v_node.type == NodeType.AND and num_ft[v_id] == len(v_node.predecessors):
+                elif num_ft[v_id] == n_pred[v_id]:
                     high_predv = -1
                     pcf_v  = -1
-                    lc_v = self.local_costs[v_id]
-                    for pred in v_node.predecessors:
-                        #assert cost[pred.ID] < math.inf
-                        #assert forced_true[pred.ID]
-                        if high_predv < cost[pred.ID]:
-                            high_predv = cost[pred.ID]
-                            pcf_v = pred.ID
-                    v_cost = high_predv + lc_v
+                    for p_id in pred[pred_start[v_id]:pred_start[v_id+1]]:
+                        if high_predv < cost[p_id]:
+                            high_predv = cost[p_id]
+                            pcf_v = p_id
+                    v_cost = high_predv + local_costs[v_id]
                     cost[v_id]= v_cost
                     pcf[v_id] = pcf_v
-                    # print(f'\tnew cost: {cost[v_id]} to {v_node.str_name} ')
                     heapq.heappush(heap, (v_cost, v_id))
-
-        # for node in self.graph.nodes:
-        #     print(f'{node.ID}\ttype: {node.type}\tcost: {cost[node.ID]}\tpcf: {str(pcf[node.ID])}\t pcf-cost: {str(cost[pcf[node.ID]]) if node.type==NodeType.AND else '---'}')
-        # for t in self.model.initial_tn:
-        #     node = self.graph.nodes[t.global_id]
-        #     pcf_node = self.graph.nodes[pcf[node.ID]]
-        #     print(f'{t.name}\ttype: GOAL_NODE\tcost: {cost[node.ID]}\tpcf: {pcf_node.str_name}\t pcf-cost: {str(cost[pcf[node.ID]]) if node.type==NodeType.AND else '---'}')
-        #     pcf_of_pcf = self.graph.nodes[pcf[pcf_node.ID]]
-        #     print(f'{pcf_of_pcf.str_name}\tcost: {cost[pcf_of_pcf.ID]}')
-        # exit(0)            
         return cost, pcf
 
     def find_landmark_cut(self, cost, pcf, goals, hmax_value):
@@ -186,9 +214,12 @@ class LMCutRC:
         - When an AND node has cost different than its pcf, 
             this means the AND node is part of the cut.
         """
-        cut = set()
-        stack = []
-        visited = set()
+        cut = []
+        stack = self.stack
+        visited = self.visited
+        pred, pred_start = self.pred, self.pred_start
+        is_and, n_pred = self.is_and, self.n_pred
+        seen = []
         
         for gid in goals:
             if cost[gid] == hmax_value:
@@ -197,43 +228,46 @@ class LMCutRC:
                 
         while stack:
             v_id = stack.pop()
-            if v_id in visited:
+            if visited[v_id]:
                 continue
-            visited.add(v_id)
-            v_node = self.graph.nodes[v_id]
+            visited[v_id] = 1
+            seen.append(v_id)
             
             # OR node, include all predecessors with the same cost of v
-            if v_node.type == NodeType.OR:
-                for u_node in v_node.predecessors:
-                    #if cost[u_node.ID] == cost[v_id]:
-                    stack.append(u_node.ID)
+            if not is_and[v_id]:
+                stack.extend(pred[pred_start[v_id]:pred_start[v_id+1]])
             else: 
             # AND node: get pcf node check pcf -> v
                 u_id = pcf[v_id]
-                if cost[u_id] == math.inf: # unsatisfiable test: pcf max value is inf
-                    return
+                if u_id < 0 and not n_pred[v_id]: # no predecessors: its cost is its local cost
+                    if cost[v_id] > 0:
+                        cut.append(v_id)
+                elif u_id < 0 or cost[u_id] == math.inf: # unreachable achiever, not part of the cut
+                    continue
                 elif cost[u_id] < cost[v_id]: # cut test: pcf has a lower cost of v
-                    cut.add(v_id)
+                    cut.append(v_id)
                 else: # goal zone: pcf has the same cost as v, both are in the goal zone
                     stack.append(u_id)
+        for v_id in seen:
+            visited[v_id] = 0
         
         return cut
 
     
-    def compute_lm_cut(self, goal_ids):
+    def lm_cut(self, goal_ids, state=None):
         """
-        Compute the LM-Cut heuristic over the Relaxed Composition Graph 
-        for the given goal nodes.
+        LM-Cut value of reaching goal_ids (node IDs) from a state (default: the initial state).
+        Returns the heuristic value and the list of cuts found.
         """
-        start_time = time.perf_counter()
         h = 0
         landmarks = []
         iterations = 0
-        cost, pcf = self.compute_h_max()
+        local_costs = self.local_costs[:] # cuts reduce a copy of the costs
+        cost, pcf = self.compute_h_max(state, local_costs)
         while True:
             iterations+=1
             #cost, pcf = self.compute_h_max()
-            hmax_val = max(cost.get(gid, math.inf) for gid in goal_ids)
+            hmax_val = max((cost[gid] for gid in goal_ids), default=0)
             #print(f'iteration {iterations} {hmax_val}')
             if hmax_val == 0:
                 break
@@ -244,18 +278,25 @@ class LMCutRC:
             if not cut:
                 break
 
-            cut_cost = min(self.local_costs[nid] for nid in cut)
+            cut_cost = min(local_costs[nid] for nid in cut)
             #print(f'[',end='')
             for nid in cut:
-                self.local_costs[nid] -= cut_cost
+                local_costs[nid] -= cut_cost
                 #print(f'{self.graph.nodes[nid].str_name} ',end='')
             #print(f']')
             h += cut_cost
             landmarks.append(cut)
-            self.hmax_update(cut, cut_cost, pcf, cost)
-            
-        elapsed_time = time.perf_counter() - start_time
-        print(f"compute_lm_cut completed in {elapsed_time:.6f} seconds")
+            self.hmax_update(cut, cut_cost, pcf, cost, local_costs)
+        return h, landmarks
+
+    def compute_lm_cut(self, goal_ids):
+        """
+        Compute the LM-Cut heuristic over the Relaxed Composition Graph 
+        for the given goal nodes, and index its cuts as disjunctive landmarks.
+        """
+        start_time = time.perf_counter()
+        _, landmarks = self.lm_cut(goal_ids)
+        self.elapsed_time = time.perf_counter() - start_time
         # process data structure for tracking lms
         # for each landmark create an index
         #   and maps the component to the the list of landmark it appears
@@ -265,9 +306,9 @@ class LMCutRC:
         for i_dlm, dlm in enumerate(landmarks):
             if len(dlm) == 1:
                 element = next(iter(dlm))
-                if self.graph.nodes[element].content_type == ContentType.METHOD:
+                if self.graph.content_type[element] == METHOD:
                     self.count_method_lms +=1
-                elif self.graph.nodes[element].content_type == ContentType.OPERATOR:
+                elif self.graph.content_type[element] == OPERATOR:
                     self.count_operator_lms +=1
             else:
                 self.count_disjunction_lms+=1
@@ -279,6 +320,7 @@ class LMCutRC:
                         self.appears_in[iof]=[]
                     iof+=1
                 self.appears_in[self.index_of[ulm]].append(i_dlm)
+        self.achieve_mask = disjunction_masks(self.model, self.index_of, self.appears_in)
                 
         # print(landmarks)
         # print(bin(self.lms))
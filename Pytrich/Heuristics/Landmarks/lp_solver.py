@@ -0,0 +1,78 @@
+import math
+import time
+
+EPS = 1e-9
+
+class LPTimeout(Exception):
+    pass
+
+def solve_packing_lp(columns, bounds, warm_basis=(), deadline=None):
+    '''
+    Dense primal simplex for the landmark cost partitioning LPs:
+        maximize sum(x) subject to A x <= b, x >= 0, with A in {0,1} and b >= 0
+    The slack basis is feasible, so no phase 1 is needed.
+        columns[j]: rows where variable j has coefficient 1
+        bounds[i]: right hand side of row i
+        warm_basis: variables entering the basis first (e.g. basic variables of a similar LP)
+        deadline: time.perf_counter() value, raises LPTimeout when passed
+    Returns the optimal value and the set of basic variables,
+    or math.inf if the LP is unbounded (a variable in no row).
+    '''
+    n = len(columns)
+    m = len(bounds)
+    width = n + m + 1
+    tableau = []
+    for i in range(m):
+        row = [0.0] * width
+        row[n + i] = 1.0
+        row[-1] = float(bounds[i])
+        tableau.append(row)
+    for j, rows in enumerate(columns):
+        for i in rows:
+            tableau[i][j] = 1.0
+    z = [-1.0] * n + [0.0] * (m + 1)
+    basis = [n + i for i in range(m)]
+
+    def pivot(c):
+        # ratio test, ties broken by the lowest basic variable (Bland)
+        r = -1
+        best = None
+        for i in range(m):
+            a = tableau[i][c]
+            if a > EPS:
+                ratio = tableau[i][-1] / a
+                if best is None or ratio < best - EPS or (ratio <= best + EPS and basis[i] < basis[r]):
+                    best = ratio
+                    r = i
+        if r < 0:
+            return False
+        p_row = tableau[r]
+        p_val = p_row[c]
+        nonzero = [k for k in range(width) if p_row[k] != 0.0]
+        for k in nonzero:
+            p_row[k] /= p_val
+        for row in tableau:
+            f = row[c]
+            if row is not p_row and f != 0.0:
+                for k in nonzero:
+                    row[k] -= f * p_row[k]
+        f = z[c]
+        for k in nonzero:
+            z[k] -= f * p_row[k]
+        basis[r] = c
+        return True
+
+    for j in warm_basis:
+        if z[j] < -EPS:
+            pivot(j)
+    while True:
+        if deadline is not None and time.perf_counter() > deadline:
+            raise LPTimeout()
+        # entering variable: lowest index with negative reduced cost (Bland)
+        c = next((k for k in range(n + m) if z[k] < -EPS), -1)
+        if c < 0:
+            break
+        if not pivot(c):
+            # no row limits the entering variable
+            return math.inf, {j for j in basis if j < n}
+    return z[-1], {j for j in basis if j < n}
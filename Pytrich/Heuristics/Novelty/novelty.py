@@ -1,27 +1,42 @@
+import sys
 from Pytrich.Heuristics.lmcount_heuristic import LandmarkCountHeuristic
+from Pytrich.Heuristics.registry import SHARED_HEURISTICS
 from Pytrich.Heuristics.tdg_heuristic import TaskDecompositionHeuristic
 from Pytrich.Search.htn_node import HTNNode
-class NoveltyFT:
+
+class NoveltyTable:
+    """
+    Facts seen so far for each key (a task, or heuristic values and a task), stored as int bitsets.
+    A state is novel for a key if it has some fact never seen with that key.
+    """
     def __init__(self):
-        self.seen_tuples = set()
+        self.seen = {}
+
+    def is_novel(self, key, state):
+        seen = self.seen.get(key, 0)
+        if state & ~seen:
+            self.seen[key] = seen | state
+            return True
+        return False
+
+    def memory(self):
+        """Approximate size in bytes of the table."""
+        return sys.getsizeof(self.seen) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.seen.items())
+
+class NoveltyFT(NoveltyTable):
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
         """
         Compute the novelty of a node based on unseen (fact, task) pairs 
         return has novelty or not.
         """
         novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos):
-                for t in node.task_network:
-                    if (bit_pos, t.global_id) not in self.seen_tuples:
-                        novelty = 0
-                        self.seen_tuples.add((bit_pos, t.global_id))
+        for t in node.task_network:
+            if self.is_novel(t.global_id, node.state):
+                novelty = 0
         
         return novelty
 
-class NoveltyLazyFT:
-    def __init__(self):
-        self.seen_tuples = set()
+class NoveltyLazyFT(NoveltyTable):
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
         """
         Compute the novelty of a node based on unseen (fact, task) pairs considering the progressed task
@@ -30,143 +45,184 @@ class NoveltyLazyFT:
         if node.task is None:
             return 1
         
-        novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos):
-                if (bit_pos, node.task.global_id) not in self.seen_tuples:
-                    novelty = 0
-                    self.seen_tuples.add((bit_pos, node.task.global_id))
+        novelty = 0 if self.is_novel(node.task.global_id, node.state) else 1
         
         return novelty
     
-class NoveltyH1FT:
+class NoveltyW2(NoveltyTable):
+    """
+    Width-2 novelty: 0 if the node has a new fact (a new (fact, task) pair with use_tasks, task being the progressed task),
+    1 if it has a new pair of facts, 2 otherwise.
+    Seen pairs are bitset rows: rows[p] has q if facts p and q were seen together.
+    Only pairs with a fact added by the node are checked, pairs of the parent's facts were recorded with the parent.
+    Pairs are recorded in the row of the added fact only, the other row is repaired when checked.
+    When rows exceed memory_limit bytes, pairs are no longer recorded (width 1 only).
+    """
+    def __init__(self, initial_node:HTNNode, use_tasks=False, memory_limit=None):
+        super().__init__()
+        self.use_tasks = use_tasks
+        self.memory_limit = memory_limit
+        self.rows = {}
+        self.rows_memory = 0
+        self.use_pairs = True
+        self.is_novel(None, initial_node.state)
+        self._new_pairs(initial_node.state, initial_node.state)
+
+    def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
+        added = node.state & ~parent_node.state if parent_node else node.state
+        key = node.task.global_id if self.use_tasks and node.task else None
+        novelty = 2
+        if self.is_novel(key, node.state):
+            novelty = 0
+        if self.use_pairs and added and self._new_pairs(added, node.state) and novelty == 2:
+            novelty = 1
+        return novelty
+
+    def _new_pairs(self, added, state):
+        """
+        Record pairs of each added fact with the facts of the state, return if any pair is new.
+        """
+        rows = self.rows
+        new_pair = False
+        while added:
+            p_bit = added & -added
+            added ^= p_bit
+            p = p_bit.bit_length() - 1
+            row = rows.get(p, 0)
+            unseen = state & ~row & ~p_bit
+            while unseen:
+                q_bit = unseen & -unseen
+                unseen ^= q_bit
+                if (rows.get(q_bit.bit_length() - 1, 0) & p_bit) == 0:
+                    new_pair = True
+                    break
+            new_row = row | state
+            if new_row != row:
+                self.rows_memory += (new_row.bit_length() - row.bit_length() + 7) >> 3
+                rows[p] = new_row
+        if self.memory_limit is not None and self.rows_memory > self.memory_limit:
+            print(f'novelty pairs exceeded {self.memory_limit} bytes: using width 1 only')
+            self.use_pairs = False
+            self.rows = {}
+        return new_pair
+
+    def memory(self):
+        return super().memory() + sys.getsizeof(self.rows) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.rows.items())
+
+class NoveltyKeysFT(NoveltyTable):
+    """
+    Novelty over the values of a list of heuristics and the progressed task:
+    0 if the state has a fact never seen with the same heuristic values and task, 1 otherwise.
+    The heuristics are shared instances (see HeuristicRegistry), initialized and evaluated once per node
+    even if they are also used elsewhere, e.g. Tiebreaking([NOVELTY(keys=[TDG()]), TDG()]).
+    """
+    def __init__(self, model, initial_node, heuristics):
+        super().__init__()
+        self.heuristics = heuristics
+        self.initial_values = tuple(h.shared_initialize(model, initial_node) for h in heuristics)
+
+    def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
+        key = tuple(h.evaluate(parent_node, node) for h in self.heuristics) + (node.task.global_id,)
+        return 0 if self.is_novel(key, node.state) else 1
+
+class NoveltyH1FT(NoveltyTable):
     def __init__(self, model, initial_node):
-        self.seen_tuples = set()
-        self.heuristic =  TaskDecompositionHeuristic(use_satis=True)
-        self.initial_h = self.heuristic.initialize(model, initial_node)
+        super().__init__()
+        self.heuristic =  SHARED_HEURISTICS.get(TaskDecompositionHeuristic, use_satis=True)
+        self.initial_h = self.heuristic.shared_initialize(model, initial_node)
         
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
         """
         Compute the novelty of a node based on unseen (fact, task) pairs considering the progressed task
         return uhas novelty or not.
         """
-        h_value = self.heuristic(parent_node, node)
-        novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos): #fato
-                if (h_value, bit_pos, node.task.global_id) not in self.seen_tuples:
-                    novelty = 0
-                    self.seen_tuples.add((h_value, bit_pos, node.task.global_id))
+        h_value = self.heuristic.evaluate(parent_node, node)
+        novelty = 0 if self.is_novel((h_value, node.task.global_id), node.state) else 1
         
         return (novelty, h_value)
     
-class NoveltyH2FT:
+class NoveltyH2FT(NoveltyTable):
     def __init__(self, model, initial_node):
-        self.seen_tuples = set()
-        self.h1 =  LandmarkCountHeuristic()
-        self.initial_h1 = self.h1.initialize(model, initial_node)
+        super().__init__()
+        self.h1 =  SHARED_HEURISTICS.get(LandmarkCountHeuristic)
+        self.initial_h1 = self.h1.shared_initialize(model, initial_node)
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
         """
         Compute the novelty of a node based on unseen (fact, task) pairs considering the progressed task
         return uhas novelty or not.
         """
-        h1_value = self.h1(parent_node, node)
-        novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos):
-                if (h1_value, bit_pos, node.task.global_id) not in self.seen_tuples:
-                    novelty = 0
-                    self.seen_tuples.add((h1_value, bit_pos, node.task.global_id))
+        h1_value = self.h1.evaluate(parent_node, node)
+        novelty = 0 if self.is_novel((h1_value, node.task.global_id), node.state) else 1
         return (novelty, h1_value)
 
-class NoveltyH3FT:
+class NoveltyH3FT(NoveltyTable):
     def __init__(self, model, initial_node):
-        self.seen_tuples = set()
-        self.h2 =  TaskDecompositionHeuristic(use_satis=True)
-        self.initial_h2 = self.h2.initialize(model, initial_node)
-        self.h1 =  LandmarkCountHeuristic()
-        self.initial_h1 = self.h1.initialize(model, initial_node)
+        super().__init__()
+        self.h2 =  SHARED_HEURISTICS.get(TaskDecompositionHeuristic, use_satis=True)
+        self.initial_h2 = self.h2.shared_initialize(model, initial_node)
+        self.h1 =  SHARED_HEURISTICS.get(LandmarkCountHeuristic)
+        self.initial_h1 = self.h1.shared_initialize(model, initial_node)
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
         """
         Compute the novelty of a node based on unseen (fact, task) pairs considering the progressed task
         return uhas novelty or not.
         """
-        h1_value = self.h1(parent_node, node)
-        h2_value = self.h2(parent_node, node)
-        novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos):
-                if (h1_value, h2_value, bit_pos, node.task.global_id) not in self.seen_tuples:
-                    novelty = 0
-                    self.seen_tuples.add((h1_value, h2_value, bit_pos, node.task.global_id))
+        h1_value = self.h1.evaluate(parent_node, node)
+        h2_value = self.h2.evaluate(parent_node, node)
+        novelty = 0 if self.is_novel((h1_value, h2_value, node.task.global_id), node.state) else 1
         return (novelty, h1_value, h2_value)
     
-class NoveltyH4FT:
+class NoveltyH4FT(NoveltyTable):
     def __init__(self, model, initial_node):
-        self.seen_tuples = set()
-        self.h2 =  TaskDecompositionHeuristic(use_satis=True)
-        self.initial_h2 = self.h2.initialize(model, initial_node)
-        self.h1 =  LandmarkCountHeuristic()
-        self.initial_h1 = self.h1.initialize(model, initial_node)
+        super().__init__()
+        self.h2 =  SHARED_HEURISTICS.get(TaskDecompositionHeuristic, use_satis=True)
+        self.initial_h2 = self.h2.shared_initialize(model, initial_node)
+        self.h1 =  SHARED_HEURISTICS.get(LandmarkCountHeuristic)
+        self.initial_h1 = self.h1.shared_initialize(model, initial_node)
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
         """
         Compute the novelty of a node based on unseen (fact, task) pairs considering the progressed task
         return uhas novelty or not.
         """
-        h1_value = self.h1(parent_node, node)
-        h2_value = self.h2(parent_node, node)
+        h1_value = self.h1.evaluate(parent_node, node)
+        h2_value = self.h2.evaluate(parent_node, node)
         return (h1_value, h2_value)
     
-class NoveltyH5FT:
+class NoveltyH5FT(NoveltyTable):
     def __init__(self, model, initial_node):
-        self.seen_tuples = set()
-        self.h1 =  TaskDecompositionHeuristic(use_satis=True)
-        self.h2 =  LandmarkCountHeuristic(use_bid=True)
-        self.initial_h1 = self.h1.initialize(model, initial_node)
-        self.initial_h1 = self.h1.initialize(model, initial_node)
+        super().__init__()
+        self.h1 =  SHARED_HEURISTICS.get(TaskDecompositionHeuristic, use_satis=True)
+        self.h2 =  SHARED_HEURISTICS.get(LandmarkCountHeuristic, use_bid=True)
+        self.initial_h1 = self.h1.shared_initialize(model, initial_node)
+        self.initial_h2 = self.h2.shared_initialize(model, initial_node)
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
-        h1_value = self.h1(parent_node, node)
-        h2_value = self.h2(parent_node, node)
-        novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos):
-                if (h1_value, h2_value, bit_pos, node.task.global_id) not in self.seen_tuples:
-                    novelty = 0
-                    self.seen_tuples.add((h1_value, h2_value, bit_pos, node.task.global_id))
+        h1_value = self.h1.evaluate(parent_node, node)
+        h2_value = self.h2.evaluate(parent_node, node)
+        novelty = 0 if self.is_novel((h1_value, h2_value, node.task.global_id), node.state) else 1
         return (novelty, h1_value, h2_value)
 
-class NoveltyH6FT:
+class NoveltyH6FT(NoveltyTable):
     def __init__(self, model, initial_node):
-        self.seen_tuples = set()
-        self.h1 =  LandmarkCountHeuristic(use_bid=True)
-        self.h2 =  TaskDecompositionHeuristic(use_satis=True)
-        self.initial_h1 = self.h1.initialize(model, initial_node)
-        self.initial_h1 = self.h1.initialize(model, initial_node)
+        super().__init__()
+        self.h1 =  SHARED_HEURISTICS.get(LandmarkCountHeuristic, use_bid=True)
+        self.h2 =  SHARED_HEURISTICS.get(TaskDecompositionHeuristic, use_satis=True)
+        self.initial_h1 = self.h1.shared_initialize(model, initial_node)
+        self.initial_h2 = self.h2.shared_initialize(model, initial_node)
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
-        h1_value = self.h1(parent_node, node)
-        h2_value = self.h2(parent_node, node)
-        novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos):
-                if (h1_value, h2_value, bit_pos, node.task.global_id) not in self.seen_tuples:
-                    novelty = 0
-                    self.seen_tuples.add((h1_value, h2_value, bit_pos, node.task.global_id))
+        h1_value = self.h1.evaluate(parent_node, node)
+        h2_value = self.h2.evaluate(parent_node, node)
+        novelty = 0 if self.is_novel((h1_value, h2_value, node.task.global_id), node.state) else 1
         return (novelty, h1_value, h2_value)
     
-class NoveltyH7FT:
+class NoveltyH7FT(NoveltyTable):
     def __init__(self, model, initial_node):
-        self.seen_tuples = set()
-        self.h1 =  LandmarkCountHeuristic()
-        self.h2 =  TaskDecompositionHeuristic(use_satis=True)
-        self.initial_h1 = self.h1.initialize(model, initial_node)
-        self.initial_h1 = self.h1.initialize(model, initial_node)
+        super().__init__()
+        self.h1 =  SHARED_HEURISTICS.get(LandmarkCountHeuristic)
+        self.h2 =  SHARED_HEURISTICS.get(TaskDecompositionHeuristic, use_satis=True)
+        self.initial_h1 = self.h1.shared_initialize(model, initial_node)
+        self.initial_h2 = self.h2.shared_initialize(model, initial_node)
     def __call__(self, parent_node:HTNNode, node:HTNNode) -> int:
-        h1_value = self.h1(parent_node, node)
-        h2_value = self.h2(parent_node, node)
-        novelty = 1
-        for bit_pos in range(node.state.bit_length()):
-            if node.state & (1 << bit_pos):
-                if (h1_value, bit_pos, node.task.global_id) not in self.seen_tuples:
-                    novelty = 0
-                    self.seen_tuples.add((h1_value, bit_pos, node.task.global_id))
+        h1_value = self.h1.evaluate(parent_node, node)
+        h2_value = self.h2.evaluate(parent_node, node)
+        novelty = 0 if self.is_novel((h1_value, node.task.global_id), node.state) else 1
         return (novelty, h1_value, h2_value)
\ No newline at end of file
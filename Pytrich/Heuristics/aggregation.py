@@ -1,4 +1,7 @@
+import math
+from functools import total_ordering
 
+from Pytrich.DESCRIPTIONS import Descriptions
 from Pytrich.Search.htn_node import TiebreakingNode
 
 
@@ -9,17 +12,80 @@ class Aggregation:
         The parameters can include heuristics or other aggregation functions.
         """
         self.params = params
-    
+        self.component_calls = [0] * len(params)
+
+    @property
+    def order_dependent(self):
+        return any(getattr(param, 'order_dependent', False) for param in self.params)
+
     def initialize(self, model, node):
         pass
-    
+
+    def shared_initialize(self, model, node):
+        return self.initialize(model, node)
+
+    def evaluate(self, parent_node, node):
+        return self(parent_node, node)
+
+    def stored_value(self, node):
+        return None
+
+    def _initialize_components(self, model, node):
+        values = [param.shared_initialize(model, node) for param in self.params]
+        for i in range(len(values)):
+            self.component_calls[i] += 1
+        node.tn_values[self] = values
+        return values
+
+    def component(self, i, node):
+        """
+        Value of component i for a node, computed on demand.
+        Components may rely on their value at the parent node (e.g. LMCOUNT),
+        so ancestors where it was skipped are evaluated first, from the top.
+        Values already stored on a node by another consumer of a shared heuristic are reused.
+        """
+        values = node.tn_values[self]
+        if values[i] is None:
+            param = self.params[i]
+            pending = []
+            while node is not None and node.tn_values[self][i] is None:
+                value = param.stored_value(node)
+                if value is not None:
+                    node.tn_values[self][i] = value
+                    break
+                pending.append(node)
+                node = node.parent
+            for n in reversed(pending):
+                n.tn_values[self][i] = param.evaluate(n.parent, n)
+                self.component_calls[i] += 1
+        return values[i]
+
     def __output__(self):
-        print(self.params)
+        return f'{self.params}'
+
+    def statistics(self):
+        """
+        Evaluations of each component (reported after search).
+        """
+        desc = Descriptions()
+        return '\n'.join(desc('heuristic_component_calls', f'{param}: {calls}')
+                         for param, calls in zip(self.params, self.component_calls))
 
 class Max(Aggregation):
+    """
+    Maximum of the components.
+    Options:
+        dead_ends: stop at the first infinite component (the remaining ones are only
+                   computed if a descendant needs them)
+    """
+    def __init__(self, params, dead_ends=False):
+        super().__init__(params)
+        self.dead_ends = dead_ends
+
     def initialize(self, model, node):
-        return max(param.initialize(model, node) for param in self.params)
-    
+        values = self._initialize_components(model, node)
+        return max(values)
+
     def __call__(self, parent_node, node):
         """
         Evaluate all parameters and return the maximum value.
@@ -27,9 +93,68 @@ class Max(Aggregation):
         # for param in self.params:
         #     print(f'name: {param} h: {param(parent_node,node)}', end=' ')
         # print()
-        return max(param(parent_node, node) for param in self.params)
+        if not self.dead_ends:
+            for i in range(len(self.params)):
+                self.component_calls[i] += 1
+            return max(param.evaluate(parent_node, node) for param in self.params)
+        values = [None] * len(self.params)
+        node.tn_values[self] = values
+        h_value = 0
+        for i, param in enumerate(self.params):
+            if h_value == math.inf and not getattr(param, 'order_dependent', False):
+                continue
+            values[i] = self.component(i, node)
+            h_value = max(h_value, values[i])
+        return h_value
+
+@total_ordering
+class LazyTuple:
+    """
+    Values of a Tiebreaking aggregation for a node, compared lexicographically.
+    Component i is only computed when a comparison reaches it.
+    """
+    __slots__ = ('aggregation', 'node', 'values')
+
+    def __init__(self, aggregation, node, values):
+        self.aggregation = aggregation
+        self.node = node
+        self.values = values
+
+    def __getitem__(self, i):
+        value = self.values[i]
+        if value is None:
+            value = self.aggregation.component(i, self.node)
+            if None not in self.values:
+                self.node = None
+        return value
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self.values)))
+
+    def __eq__(self, other):
+        if len(self) != len(other):
+            return False
+        return all(self[i] == other[i] for i in range(len(self.values)))
+
+    def __lt__(self, other):
+        for i in range(min(len(self), len(other))):
+            a, b = self[i], other[i]
+            if a != b:
+                return a < b
+        return len(self) < len(other)
+
+    def __repr__(self):
+        return repr(tuple(self))
 
 class Tiebreaking(Aggregation):
+    """
+    Lexicographic comparison of the components (use with TiebreakingNode).
+    The first component and the order dependent ones (novelty) are computed for every node,
+    the others only when the previous ones tie.
+    """
     def initialize(self, model, node):
         # print(f'initializing tie breakign')
         assert isinstance(node, TiebreakingNode)
@@ -37,19 +162,25 @@ class Tiebreaking(Aggregation):
             #print(f'initializing {param}')
             #param.initialize(model, node)
 
-        values = tuple(param.initialize(model, node) for param in self.params)
+        values = self._initialize_components(model, node)
         #print(values)
-        return values
-    
+        return LazyTuple(self, None, values)
+
     def __call__(self, parent_node, node):
         """
-        Evaluate all parameters and store their values for tie-breaking.
+        Evaluate the eager parameters and defer the others until a comparison needs them.
         """
-        
+
         # for param in self.params:
         #     h= param(parent_node, node)
         #     print(f'{param}:{h}', end=' ')
         # print(f' ')
-        
-        return tuple(param(parent_node, node) for param in self.params)
 
+        values = [None] * len(self.params)
+        node.tn_values[self] = values
+        for i, param in enumerate(self.params):
+            if i == 0 or getattr(param, 'order_dependent', False):
+                self.component(i, node)
+        if None not in values:
+            return LazyTuple(self, None, values)
+        return LazyTuple(self, node, values)
@@ -28,12 +28,15 @@ class DeleteRelaxationHeuristic(Heuristic):
         self._compute_relaxed_costs(model, initial_node)
         self.preprocessing_time = time.time() - start_time
 
-        initial_h = self._estimate_remaining_cost(initial_node.state, initial_node.task_network)
+        self.set_task_values(model, self.task_costs)
+        initial_h = self._estimate_remaining_cost(None, initial_node)
         self.update_info(initial_h)
         return initial_h
 
     def _create_relaxed_operators(self, model: Model):
         self.relaxed_operators = {}
+        if not model.compiled:
+            model.compile()
 
         for op in model.operators:
             relaxed_op = type('RelaxedOperator', (), {
@@ -41,6 +44,8 @@ class DeleteRelaxationHeuristic(Heuristic):
                 'global_id': op.global_id,
                 'preconditions': getattr(op, 'pos_precons', 0),  # ? corrected
                 'add_effects': getattr(op, 'add_effects', 0),
+                'pre_idx': op.pre_idx,
+                'add_idx': op.add_idx,
                 'del_effects': 0,
                 'cost': getattr(op, 'cost', 1)
             })()
@@ -69,17 +74,14 @@ class DeleteRelaxationHeuristic(Heuristic):
             # Operator updates
             for op_id, op in self.relaxed_operators.items():
                 old_cost = self.task_costs[op_id]
-                preconds = op.preconditions or 0
-
                 can_apply = True
                 precond_cost = 0
 
-                for i in range(preconds.bit_length()):
-                    if preconds & (1 << i):
-                        if self.fact_costs[i] == math.inf:
-                            can_apply = False
-                            break
-                        precond_cost = max(precond_cost, self.fact_costs[i])
+                for i in op.pre_idx:
+                    if self.fact_costs[i] == math.inf:
+                        can_apply = False
+                        break
+                    precond_cost = max(precond_cost, self.fact_costs[i])
 
                 if can_apply:
                     new_cost = precond_cost + op.cost
@@ -112,33 +114,21 @@ class DeleteRelaxationHeuristic(Heuristic):
             for op_id, op in self.relaxed_operators.items():
                 op_cost = self.task_costs[op_id]
                 if op_cost < math.inf:
-                    effects = op.add_effects or 0
-                    for i in range(effects.bit_length()):
-                        if effects & (1 << i):
-                            if op_cost < self.fact_costs[i]:
-                                self.fact_costs[i] = op_cost
-                                changed = True
-
-    def _estimate_remaining_cost(self, state, task_network):
-        if not task_network:
-            return 0
+                    for i in op.add_idx:
+                        if op_cost < self.fact_costs[i]:
+                            self.fact_costs[i] = op_cost
+                            changed = True
 
+    def _estimate_remaining_cost(self, parent_node, node):
         if self.use_ordering_relaxation:
-            return max(
-                (self.task_costs.get(task.global_id, math.inf) for task in task_network),
-                default=0
-            )
-        else:
-            total = 0
-            for task in task_network:
-                cost = self.task_costs.get(task.global_id, math.inf)
-                if cost == math.inf:
-                    return 999999  # ? safe cap instead of math.inf
-                total += cost
-            return total
+            return self.tn_max(parent_node, node)
+        total = self.tn_sum(parent_node, node)
+        if total == math.inf:
+            return 999999  # ? safe cap instead of math.inf
+        return total
 
     def __call__(self, parent_node: HTNNode, node: HTNNode):
-        h_value = self._estimate_remaining_cost(node.state, node.task_network)
+        h_value = self._estimate_remaining_cost(parent_node, node)
         self.update_info(h_value)
         return h_value
 
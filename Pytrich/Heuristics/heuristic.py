@@ -1,6 +1,11 @@
+import math
+
 from Pytrich.Search.htn_node import HTNNode
 from Pytrich.model import Model
 class Heuristic:
+    # values depend on the order nodes are evaluated in (e.g. novelty), so they cannot be computed lazily
+    order_dependent = False
+
     def __init__(self, name="blind"):
         self.model = None
         self.name = name
@@ -8,6 +13,15 @@ class Heuristic:
         self.total_hvalue = 0
         self.min_hvalue = 1000000
         self.initial_h  = 0
+        # task network heuristics: value per task and per-method changes (see set_task_values)
+        self.task_values = None
+        self.method_sum_delta = None
+        self.method_max = None
+        # heuristics shared between several consumers: h-value kept on each node (see evaluate)
+        self.shared_model = None
+        self.shared_initial_h = None
+        self.value_key = (self, 'h') # tn_values[self] is taken by tn_sum/tn_max
+        self.shared_hits = 0
     
     def initialize(self, model, initial_h):
         self.model=model
@@ -15,6 +29,37 @@ class Heuristic:
         self.update_info(initial_h)
         return initial_h
 
+    def shared_initialize(self, model, initial_node):
+        """
+        Initialize unless already initialized for this model (by another consumer), return h of the initial node.
+        """
+        if self.shared_model is model:
+            self.shared_hits += 1
+            return self.shared_initial_h
+        self.shared_model = model
+        self.shared_initial_h = self.initialize(model, initial_node)
+        initial_node.tn_values[self.value_key] = self.shared_initial_h
+        return self.shared_initial_h
+
+    def stored_value(self, node):
+        """
+        h-value of node if it was already evaluated, None otherwise.
+        """
+        return node.tn_values.get(self.value_key)
+
+    def evaluate(self, parent_node, node):
+        """
+        h-value of node, computed once if several consumers (aggregations, novelty keys) ask for the same node,
+        in any order: the value is stored on the node.
+        """
+        value = node.tn_values.get(self.value_key)
+        if value is not None:
+            self.shared_hits += 1
+            return value
+        value = self(parent_node, node)
+        node.tn_values[self.value_key] = value
+        return value
+
     def update_info(self, h_value):
         """
         Set heuristic and f-value for the node.
@@ -22,9 +67,58 @@ class Heuristic:
         self.calls += 1
         self.total_hvalue += h_value
         self.min_hvalue = min(self.min_hvalue, h_value)
+
+    def set_task_values(self, model, task_values):
+        """
+        Store a value per task (keyed by global id) and precompute, for each method:
+            method_sum_delta: sum of its subtasks minus its compound task (None if the task is infinite)
+            method_max: max over its subtasks
+        """
+        self.task_values = task_values
+        self.method_sum_delta = {}
+        self.method_max = {}
+        for d in model.decompositions:
+            task_value = task_values.get(d.compound_task.global_id, math.inf)
+            sub_values = [task_values.get(t.global_id, math.inf) for t in d.task_network]
+            self.method_sum_delta[d.global_id] = sum(sub_values) - task_value if task_value != math.inf else None
+            self.method_max[d.global_id] = max(sub_values, default=0)
+
+    def tn_sum(self, parent_node, node):
+        """
+        Sum of task values over the node's task network, kept incrementally on the node:
+            progression:   h(parent) - value(task)
+            decomposition: h(parent) - value(task) + sum(value(subtasks))
+        Falls back to a full sum at the root or when h(parent) is infinite.
+        """
+        parent_value = parent_node.tn_values.get(self) if parent_node is not None else None
+        if parent_value is None or parent_value == math.inf:
+            value = sum(self.task_values.get(t.global_id, math.inf) for t in node.task_network)
+        elif node.decomposition is None:
+            value = parent_value - self.task_values[node.task.global_id]
+        else:
+            value = parent_value + self.method_sum_delta[node.decomposition.global_id]
+        node.tn_values[self] = value
+        return value
+
+    def tn_max(self, parent_node, node):
+        """
+        Max of task values over the node's task network.
+        h(parent) is kept while the removed task is strictly below it,
+        otherwise the max is recomputed over the whole task network.
+        """
+        parent_value = parent_node.tn_values.get(self) if parent_node is not None else None
+        task_value = self.task_values.get(node.task.global_id, math.inf) if node.task is not None else math.inf
+        if parent_value is None or task_value >= parent_value:
+            value = max((self.task_values.get(t.global_id, math.inf) for t in node.task_network), default=0)
+        elif node.decomposition is None:
+            value = parent_value
+        else:
+            value = max(parent_value, self.method_max[node.decomposition.global_id])
+        node.tn_values[self] = value
+        return value
         
     def __call__(self, parent_node, node):
         pass
     
     def __output__(self):
-        pass
\ No newline at end of file
+        pass
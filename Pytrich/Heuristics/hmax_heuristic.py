@@ -1,10 +1,14 @@
 import time
 import math
 from Pytrich.Heuristics.heuristic import Heuristic
-from Pytrich.ProblemRepresentation.and_or_graph import AndOrGraph, ContentType, NodeType
+from Pytrich.ProblemRepresentation.and_or_graph import AND_NODE, INIT_NODE, OR_NODE, ContentType
 from Pytrich.Search.htn_node import HTNNode
 from Pytrich.model import Model
 
+OPERATOR = ContentType.OPERATOR.value
+ABSTRACT_TASK = ContentType.ABSTRACT_TASK.value
+FACT = ContentType.FACT.value
+
 
 class HmaxHeuristic(Heuristic):
     """
@@ -25,17 +29,19 @@ class HmaxHeuristic(Heuristic):
         """
         start_time = time.time()
 
-        # Build AND/OR graph for hmax computation
-        self.and_or_graph = AndOrGraph(model, graph_type=4)
+        # Build AND/OR graph for hmax computation (relaxed composition graph)
+        self.and_or_graph = model.graphs.compact(3)
 
         # Compute hmax values for all nodes in the graph
         self._compute_hmax()
+        self.and_or_graph = None # shared graph, only needed for preprocessing
 
         # Store preprocessing time
         self.preprocessing_time = time.time() - start_time
 
         # Initial h-value for the root node
-        initial_h = sum(self.h_values.get(t.global_id, math.inf) for t in initial_node.task_network)
+        self.set_task_values(model, self.h_values)
+        initial_h = self.tn_sum(None, initial_node)
         self.update_info(initial_h)
         return initial_h
 
@@ -44,54 +50,51 @@ class HmaxHeuristic(Heuristic):
         Propagate costs in the AND/OR graph using hmax combination:
         - OR node: min over predecessors
         - AND node: weight + max over predecessors
+        Values are indexed by node ID (over the compact graph, see CompactAndOrGraph).
         """
+        graph = self.and_or_graph
+        node_type, content_type, weight = graph.node_type, graph.content_type, graph.weight
+        pred, pred_start = graph.pred, graph.pred_start
         # Initialize node values
-        for node in self.and_or_graph.nodes:
-            if node is None:
-                continue
-            if node.type == NodeType.INIT:
-                node.value = 0
-            else:
-                node.value = math.inf
+        values = [math.inf] * len(graph)
+        for n_id in range(len(graph)):
+            if node_type[n_id] == INIT_NODE:
+                values[n_id] = 0
 
+        # only OR and AND nodes change
+        node_ids = [n_id for n_id in range(len(graph)) if node_type[n_id] in (OR_NODE, AND_NODE)]
         changed = True
         while changed:
             self.iterations += 1
             changed = False
-            for node in self.and_or_graph.nodes:
-                if node is None:
-                    continue
-
-                old_value = node.value
-                if node.type == NodeType.OR:
-                    if node.predecessors:
-                        new_value = min(p.value for p in node.predecessors)
-                    else:
-                        new_value = node.value
-                elif node.type == NodeType.AND:
-                    if node.predecessors:
-                        new_value = node.weight + max(p.value for p in node.predecessors)
+            for n_id in node_ids:
+                old_value = values[n_id]
+                start, end = pred_start[n_id], pred_start[n_id+1]
+                if node_type[n_id] == OR_NODE:
+                    if start < end:
+                        new_value = min([values[p] for p in pred[start:end]])
                     else:
-                        new_value = node.weight
+                        new_value = old_value
                 else:
-                    new_value = node.value
+                    if start < end:
+                        new_value = weight[n_id] + max([values[p] for p in pred[start:end]])
+                    else:
+                        new_value = weight[n_id]
 
                 if new_value < old_value:
-                    node.value = new_value
+                    values[n_id] = new_value
                     changed = True
 
         # Store values for operators, abstract tasks, and facts
-        for n in self.and_or_graph.nodes:
-            if n is None:
-                continue
-            if n.content_type in {ContentType.OPERATOR, ContentType.ABSTRACT_TASK, ContentType.FACT}:
-                self.h_values[n.ID] = n.value
+        for n_id in range(len(graph)):
+            if content_type[n_id] in (OPERATOR, ABSTRACT_TASK, FACT):
+                self.h_values[n_id] = values[n_id]
 
     def __call__(self, parent_node: HTNNode, node: HTNNode):
         """
         Return hmax value for the given node's remaining task network.
         """
-        h_val = sum(self.h_values.get(t.global_id, math.inf) for t in node.task_network)
+        h_val = self.tn_sum(parent_node, node)
         self.update_info(h_val)
         return h_val
 
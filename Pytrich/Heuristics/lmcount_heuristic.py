@@ -1,15 +1,16 @@
 import time
 from Pytrich.DESCRIPTIONS import Descriptions
 from Pytrich.Heuristics.Landmarks.bit_lm_node import BitLm_Node
-from Pytrich.Heuristics.Landmarks.landmark import Landmarks
+from Pytrich.Heuristics.Landmarks.landmark import Landmarks, _bit_positions
 from Pytrich.Heuristics.Landmarks.landmark_cut import LMCutRC
+from Pytrich.Heuristics.Landmarks.lp_solver import LPTimeout
 from Pytrich.Heuristics.heuristic import Heuristic
 from Pytrich.Search.htn_node import HTNNode
 from Pytrich.model import AbstractTask, Operator, Model
 import Pytrich.FLAGS as FLAGS
 #TODO: need code refactor
-# landmark should have a lm_index that is different from global_id (at least not necessarily equal)
-# this is implemented in UCP and lm-cut lms
+# landmarks use a dense lm index (Landmarks.build_dense_index), different from the AND/OR node ID
+# UCP and lm-cut lms index disjunctions instead
 class LandmarkCountHeuristic(Heuristic):
     """
     Compute landmarks and perform a sort of hamming distance with it (not admissible yet)
@@ -20,6 +21,9 @@ class LandmarkCountHeuristic(Heuristic):
         use_disj: <UNAVAILABLE> compute disjunctive landmarks over facts with minimal hitting set over fatcs (work in progress)
         use_bu_update: updates landmarks based on node's task network
         use_bu_strict: bottom-up landmarks without mandatory tasks
+        use_ucp: uniform cost partitioning over disjunctive landmarks
+        use_ocp: optimal cost partitioning over the same landmarks, solving a LP per node (falls back to UCP when exceeding ocp_time_limit seconds)
+        lm_memory_mb: memory budget (MB) of each landmark table, falling back to trivial landmarks when exceeded
     """
     
     def __init__(self,
@@ -32,6 +36,9 @@ class LandmarkCountHeuristic(Heuristic):
                  use_bu_strict=False,
                  use_lmc=False,
                  use_ucp=False,
+                 use_ocp=False,
+                 ocp_time_limit=0.05,
+                 lm_memory_mb=None,
                  name="lmcount"):
         super().__init__(name=name)
         self.use_bid = use_bid
@@ -42,12 +49,22 @@ class LandmarkCountHeuristic(Heuristic):
         self.use_disj = use_disj
         self.use_task_ord = use_task_ord
         self.use_fact_ord = use_fact_ord
-        self.use_ucp = use_ucp
+        self.use_ocp = use_ocp
+        self.use_ucp = use_ucp or use_ocp # OCP uses the UCP landmarks, and UCP as fallback
+        self.ocp_time_limit = ocp_time_limit
+        self.lm_memory = int(lm_memory_mb * (1 << 20)) if lm_memory_mb is not None else None
 
         
         self._define_param_str()
 
         self.landmarks = None
+        # bottom-up updates: memoized dense landmarks of tasks and of missing goal facts
+        self.task_lms = {}
+        self.goal_lms = {}
+        # optimal cost partitioning: value and basic landmarks per set of remaining landmarks
+        self.ocp_values = {}
+        self.ocp_cache_size = 100000
+        self.ocp_fallbacks = 0
         
         # Timing and statistics
         self.start_time = 0
@@ -69,7 +86,7 @@ class LandmarkCountHeuristic(Heuristic):
         self.start_time = time.perf_counter()
         
         if self.use_bid:
-            self.landmarks = Landmarks(model, True, True, False)
+            self.landmarks = Landmarks(model, True, True, False, self.lm_memory)
             self.landmarks.generate_bu_table()
             self.landmarks.bottom_up_lms(model.initial_state, model.initial_tn)
             self.landmarks.generate_td_table()
@@ -77,22 +94,22 @@ class LandmarkCountHeuristic(Heuristic):
             self.landmarks.bidirectional_lms()
             self.landmarks.identify_lms(self.landmarks.bid_lms, self.landmarks.bu_graph)
             initial_node.lm_node = BitLm_Node()
-            initial_node.lm_node.initialize_lms(self.landmarks.bid_lms)
+            initial_node.lm_node.initialize_lms(self.landmarks.build_dense_index(self.landmarks.bid_lms, self.landmarks.bu_graph))
         elif self.use_mt:
-            self.landmarks =Landmarks(model, False, False, True)
+            self.landmarks =Landmarks(model, False, False, True, self.lm_memory)
             self.landmarks.generate_mt_table()
             self.landmarks.mandatory_tasks_lms(model.initial_tn)
             initial_node.lm_node = BitLm_Node()
-            initial_node.lm_node.initialize_lms(self.landmarks.mt_lms)
+            initial_node.lm_node.initialize_lms(self.landmarks.build_dense_index(self.landmarks.mt_lms, self.landmarks.mt_graph))
             self.landmarks.identify_lms(self.landmarks.mt_lms, self.landmarks.mt_graph)
         elif self.use_bu_strict:
-            self.landmarks =Landmarks(model, True, False, True)
+            self.landmarks =Landmarks(model, True, False, True, self.lm_memory)
             self.landmarks.generate_mt_table()
             self.landmarks.mandatory_tasks_lms(model.initial_tn)
             self.landmarks.generate_bu_table()
             self.landmarks.bottom_up_lms(model.initial_state, model.initial_tn)
             initial_node.lm_node = BitLm_Node()
-            initial_node.lm_node.initialize_lms(self.landmarks.bu_lms-self.landmarks.mt_lms)
+            initial_node.lm_node.initialize_lms(self.landmarks.build_dense_index(self.landmarks.bu_lms-self.landmarks.mt_lms, self.landmarks.bu_graph))
             self.landmarks.identify_lms(self.landmarks.bu_lms-self.landmarks.mt_lms, self.landmarks.bu_graph)
         elif self.use_lmc:
             self.landmarks =LMCutRC(model)
@@ -101,7 +118,7 @@ class LandmarkCountHeuristic(Heuristic):
             initial_node.lm_node = BitLm_Node()
             initial_node.lm_node.initialize_lms(self.landmarks.lms)
         else:
-            self.landmarks =Landmarks(model, True, False, False)
+            self.landmarks =Landmarks(model, True, False, False, self.lm_memory)
             self.landmarks.generate_bu_table()
             self.landmarks.bottom_up_lms(model.initial_state, model.initial_tn)
             initial_node.lm_node = BitLm_Node()
@@ -110,8 +127,15 @@ class LandmarkCountHeuristic(Heuristic):
                 self.landmarks.compute_ucp(self.landmarks.bu_lms)
                 initial_node.lm_node.initialize_lms(self.landmarks.bu_lms, lm_sum=sum(self.landmarks.ucp_cost))
             else:
-                initial_node.lm_node.initialize_lms(self.landmarks.bu_lms)
+                # bottom-up updates can add any landmark of a task or goal fact during search
+                universe = self._bu_update_universe(model) if self.use_bu_update else 0
+                initial_node.lm_node.initialize_lms(self.landmarks.build_dense_index(self.landmarks.bu_lms, self.landmarks.bu_graph, universe))
+                if self.use_bu_update:
+                    for t in reversed(initial_node.task_network):
+                        initial_node.lm_node.tn_lms = self._push_task(t, initial_node.lm_node.tn_lms)
             
+        if not self.use_lmc:
+            self.landmarks.release_graphs()
         self.elapsed_time = time.perf_counter() - self.start_time                                     
         
         #mark initial state
@@ -125,10 +149,7 @@ class LandmarkCountHeuristic(Heuristic):
                                 self.methods_lms + \
                                 self.fact_lms
             if not self.use_ucp:
-                for fact_pos in range(initial_node.state.bit_length()):
-                    if initial_node.state & (1 << fact_pos) \
-                            and initial_node.state & (1 << fact_pos):
-                            initial_node.lm_node.mark_lm(fact_pos)
+                initial_node.lm_node.mark_lms(self.landmarks.to_dense(initial_node.state))
         else: #lmcut doesen't have fact and abstract task landmarks
             self.operator_lms    = self.landmarks.count_operator_lms
             self.methods_lms     = self.landmarks.count_method_lms
@@ -138,23 +159,80 @@ class LandmarkCountHeuristic(Heuristic):
                                self.methods_lms + \
                                self.disjunction_lms
 
+        if self.use_ocp:
+            return super().initialize(model, self._ocp_value(initial_node.lm_node))
         return super().initialize(model, initial_node.lm_node.lm_value())
+
+    def _bu_update_universe(self, model):
+        """Every node that can become a bottom-up landmark while updating landmarks during search."""
+        universe = 0
+        for t in model.operators:
+            universe |= self.landmarks.bu_lookup[t.global_id]
+        for t in model.abstract_tasks:
+            universe |= self.landmarks.bu_lookup[t.global_id]
+        for fact_pos in model.goal_idx:
+            universe |= self.landmarks.bu_lookup[fact_pos]
+        return universe
+
+    def _ocp_value(self, lm_node, parent_lm_node=None):
+        """
+        Optimal cost partitioning of the landmarks not yet achieved, warm started from the parent's basis.
+        Falls back to UCP (lm_node's value) if the LP exceeds the time limit.
+        """
+        remaining = lm_node.lms & ~lm_node.mark
+        cached = self.ocp_values.get(remaining)
+        if cached is not None:
+            return cached[0]
+        warm_basis = ()
+        if parent_lm_node is not None:
+            warm_basis = self.ocp_values.get(parent_lm_node.lms & ~parent_lm_node.mark, (0, ()))[1]
+        try:
+            value, basis = self.landmarks.compute_ocp(remaining, warm_basis, time.perf_counter() + self.ocp_time_limit)
+        except LPTimeout:
+            self.ocp_fallbacks += 1
+            return lm_node.lm_value()
+        if len(self.ocp_values) >= self.ocp_cache_size:
+            self.ocp_values.clear()
+        self.ocp_values[remaining] = (value, basis)
+        return value
+
+    def _task_dense_lms(self, task):
+        lms = self.task_lms.get(task.global_id)
+        if lms is None:
+            lms = self.task_lms[task.global_id] = self.landmarks.to_dense(self.landmarks.bu_lookup[task.global_id])
+        return lms
+
+    def _push_task(self, task, tn_lms):
+        return (self._task_dense_lms(task) | (tn_lms[0] if tn_lms else 0), tn_lms)
+
+    def _tn_lms(self, parent_node, node):
+        """
+        Landmarks of the node's task network suffixes, as a linked list (lms of the suffix, rest),
+        shared with the parent: progression drops its first task, decomposition pushes the method's subtasks.
+        """
+        tn_lms = parent_node.lm_node.tn_lms
+        tn_lms = tn_lms[1] if tn_lms else None
+        if not isinstance(node.task, Operator):
+            for t in reversed(node.decomposition.task_network):
+                tn_lms = self._push_task(t, tn_lms)
+        return tn_lms
+
+    def _goal_dense_lms(self, state):
+        missing_goals = self.model.goals & ~state
+        lms = self.goal_lms.get(missing_goals)
+        if lms is None:
+            lms = 0
+            for fact_pos in _bit_positions(missing_goals):
+                lms |= self.landmarks.bu_lookup[fact_pos]
+            lms = self.goal_lms[missing_goals] = self.landmarks.to_dense(lms)
+        return lms
         
     def __call__(self, parent_node:HTNNode, node:HTNNode):
+        # component reached by this node: the applied operator or the applied method
+        component = node.task if isinstance(node.task, Operator) else node.decomposition
         if self.use_lmc:
-            # node.lm_node = LMC_Node(parent=parent_node.lm_node)
-            # if isinstance(node.task, Operator):
-            #     node.lm_node.mark_lm(node.task.global_id)
-            # else:
-            #     node.lm_node.mark_lm(node.decomposition.global_id)
             node.lm_node = BitLm_Node(parent=parent_node.lm_node)
-            if isinstance(node.task, Operator):
-                lm_index =  self.landmarks.index_of[node.task.global_id]
-            else:
-                lm_index = self.landmarks.index_of[node.decomposition.global_id]
-                
-            for dlm in self.landmarks.appears_in[lm_index]:
-                node.lm_node.mark_lm(dlm)
+            node.lm_node.mark_lms(self.landmarks.achieve_mask[component.global_id])
             h_value =  node.lm_node.lm_value()
 
             super().update_info(h_value)
@@ -162,44 +240,37 @@ class LandmarkCountHeuristic(Heuristic):
         
         if self.use_ucp:
             node.lm_node = BitLm_Node(parent=parent_node.lm_node)
-            if isinstance(node.task, Operator):
-                lm_index =  self.landmarks.index_of[node.task.global_id]
+            node.lm_node.mark_lms(self.landmarks.achieve_mask[component.global_id], self.landmarks.ucp_cost)
+            if self.use_ocp:
+                h_value = self._ocp_value(node.lm_node, parent_node.lm_node)
             else:
-                lm_index = self.landmarks.index_of[node.decomposition.global_id]
-            
-            for dlm in self.landmarks.appears_in[lm_index]:
-                if node.lm_node.is_active_lm(dlm):
-                    lm_cost = self.landmarks.ucp_cost[dlm]
-                    node.lm_node.mark_lm(dlm, lm_cost)
-            h_value =  node.lm_node.lm_value()
+                h_value =  node.lm_node.lm_value()
             super().update_info(h_value)
             return h_value
                     
         node.lm_node = BitLm_Node(parent=parent_node.lm_node)
         if self.use_bu_update:
-            #self.landmarks.generate_bu_table(node.state, reinitialize=False)
-            self.landmarks.bottom_up_lms(node.state, node.task_network, reinitialize=False)
-            node.lm_node.update_lms(self.landmarks.bu_lms)
+            # bottom-up landmarks of the task network and missing goals
+            # (facts of the state are already marked)
+            node.lm_node.tn_lms = self._tn_lms(parent_node, node)
+            tn_lms = node.lm_node.tn_lms[0] if node.lm_node.tn_lms else 0
+            node.lm_node.update_lms(tn_lms | self._goal_dense_lms(node.state))
             
-        # mark last reached task (also add decomposition here)
-        node.lm_node.mark_lm(node.task.global_id)
-        # in case there is a change in the state:
+        # mark last reached task together with
+        #   operator: its add effects (in case there is a change in the state)
+        #   method: the decomposition
+        node.lm_node.mark_lms(self.landmarks.achieve_mask[component.global_id])
         if isinstance(node.task, Operator):
-            for fact_pos in range(node.task.add_effects.bit_length()):
-                if node.task.add_effects & (1 << fact_pos) \
-                    and node.state & (1 << fact_pos):
-                    node.lm_node.mark_lm(fact_pos)
-                if self.use_disj:
-                    node.lm_node.mark_disjunction(node.state)
+            if self.use_disj:
+                node.lm_node.mark_disjunction(node.state)
             # orderings: deleted facts can reactivate fact landmarks
             if self.use_task_ord \
-                and (node.task.del_effects & node.lm_node.mark):  # fact landmark is deleted
+                and (self.landmarks.delete_mask[node.task.global_id] & node.lm_node.mark):  # fact landmark is deleted
                 self._deal_with_fact_ordering(node, parent_node)
-        else: #otherwise mark the decomposition
-            node.lm_node.mark_lm(node.decomposition.global_id)
+        else:
             # task landmark applied ('delete' task from task network)
             if self.use_fact_ord \
-                and (node.task.global_id & node.lm_node.lms): 
+                and (self.landmarks.lm_bit.get(node.task.global_id, 0) & node.lm_node.lms): 
                 self._deal_with_task_ordering(node, parent_node)
         
             
@@ -266,30 +337,31 @@ class LandmarkCountHeuristic(Heuristic):
         # -- Handle Fact Orderings/Dependencies --
         if self.landmarks.gn_fact_orderings:
             # Retrieve any fact landmarks deleted by the current operator.
-            deleted_lm_facts = node.lm_node.mark & node.task.del_effects
-            for bit_pos in range(deleted_lm_facts.bit_length()):
-                if deleted_lm_facts & (1 << bit_pos):  # If a landmark fact was deleted
-                    # Check if it was actually satisfied in the parent's state
-                    if parent_node.state & (1 << bit_pos):
-                        is_goal_fact = (self.model.goals & (1 << bit_pos)) != 0
-                        required_again = False
-
-                        # If it's a goal fact, it is automatically needed again
-                        if is_goal_fact:
-                            required_again = True
-                        else:
-                            # Check other landmark facts that depend on this fact
-                            for psi in self.landmarks.gn_fact_orderings[bit_pos]:
-                                # If psi is not yet accepted, fact is needed again
-                                if not (node.lm_node.mark & (1 << psi)):
-                                    required_again = True
-                                    break
-
-                        if required_again:
-                            # Unmark the fact landmark so it can be re-established
-                            node.lm_node.mark &= ~(1 << bit_pos)
-                            node.lm_node.achieved_lms -= 1
-                            self.fact_lm_reactivations+=1
+            lm_bit = self.landmarks.lm_bit
+            deleted_lm_facts = node.lm_node.mark & self.landmarks.delete_mask[node.task.global_id]
+            for lm_i in _bit_positions(deleted_lm_facts):  # landmark facts deleted by the operator
+                bit_pos = self.landmarks.lm_node_ids[lm_i]
+                # Check if it was actually satisfied in the parent's state
+                if parent_node.state & (1 << bit_pos):
+                    is_goal_fact = (self.model.goals & (1 << bit_pos)) != 0
+                    required_again = False
+
+                    # If it's a goal fact, it is automatically needed again
+                    if is_goal_fact:
+                        required_again = True
+                    else:
+                        # Check other landmark facts that depend on this fact
+                        for psi in self.landmarks.gn_fact_orderings[bit_pos]:
+                            # If psi is not yet accepted, fact is needed again
+                            if not (node.lm_node.mark & lm_bit.get(psi, 0)):
+                                required_again = True
+                                break
+
+                    if required_again:
+                        # Unmark the fact landmark so it can be re-established
+                        # orderings only run without UCP, where each landmark counts 1
+                        node.lm_node.unmark_lm(lm_i, 1)
+                        self.fact_lm_reactivations+=1
 
     def _deal_with_task_ordering(self, node: HTNNode, parent_node: HTNNode):
         """
@@ -311,16 +383,18 @@ class LandmarkCountHeuristic(Heuristic):
         # needs to remain "active" because other tasks in the decomposition rely on it.
         required_again = False
         # Determine which tasks are reachable from the current decomposition
+        lm_bit = self.landmarks.lm_bit
         reachable_tasks = 0
         for t in node.decomposition.task_network:
-            reachable_tasks |= (1 << t.global_id)
+            reachable_tasks |= lm_bit.get(t.global_id, 0)
         # Check tasks that require the current one to be completed (GN ordering)
         for psi in self.landmarks.gn_task_orderings[node.task.global_id-len(self.model.facts)]:
             # If psi is a landmark task not yet achieved and not reachable from here,
             # the current task may need to stay "unresolved" to enforce ordering.
-            psi_accepted = (node.lm_node.mark & (1 << psi)) != 0
-            psi_reachable = (reachable_tasks & (1 << psi)) != 0
-            if (node.lm_node.lms & (1 << psi)) and (not psi_accepted) and (not psi_reachable):
+            psi_bit = lm_bit.get(psi, 0)
+            psi_accepted = (node.lm_node.mark & psi_bit) != 0
+            psi_reachable = (reachable_tasks & psi_bit) != 0
+            if (node.lm_node.lms & psi_bit) and (not psi_accepted) and (not psi_reachable):
                 # print(f'\norderings of {node.task.name}')
                 # print(f'\t-> {self.model.get_component(psi).name}')
                 # print(f'\trequired again, pikced {node.decomposition.name}' )
@@ -330,9 +404,9 @@ class LandmarkCountHeuristic(Heuristic):
         if required_again:
             # print(f'task requires again {node.task.name}')
             # Unmark the current landmark task to indicate it must remain "open"
-            node.lm_node.mark &= ~(1 << node.task.global_id)
+            lm_i = lm_bit[node.task.global_id].bit_length() - 1
             #print(node.lm_node.lm_value())
-            node.lm_node.achieved_lms -= 1
+            node.lm_node.unmark_lm(lm_i, 1)
             #print(node.lm_node.lm_value())
             self.task_lm_reactivations+=1
 
@@ -396,6 +470,15 @@ class LandmarkCountHeuristic(Heuristic):
         out_str += f'\t{desc("disj_landmarks", self.disjunction_lms)}\n'
         out_str += f'\t{desc("fact_reactivations", self.fact_lm_reactivations)}\n'
         out_str += f'\t{desc("task_reactivations", self.fact_lm_reactivations)}\n'
+        if self.use_ocp:
+            out_str += f'\t{desc("ocp_fallbacks", self.ocp_fallbacks)}\n'
+        if not self.use_lmc:
+            lm_tables = [t for t in (self.landmarks.bu_lookup, self.landmarks.td_lookup, self.landmarks.mt_lookup) if t is not None]
+            out_str += f'\t{desc("lm_table_nodes", sum(len(t.table) for t in lm_tables))}\n'
+            out_str += f'\t{desc("lm_table_memory", sum(t.memory for t in lm_tables) / 1024)}\n'
+        if FLAGS.MONITOR_LM_TIME and self.use_bid:
+            out_str += f'\t{desc("lm_closure_time", self.landmarks.closure_time)}\n'
+            out_str += f'\t{desc("lm_closure_nodes", self.landmarks.closure_nodes)}\n'
         out_str += f'\t{desc("heuristic_elapsed_time", f"{self.elapsed_time:.4f}")}\n'
         
         
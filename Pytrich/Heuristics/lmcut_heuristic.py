@@ -0,0 +1,70 @@
+import time
+from Pytrich.DESCRIPTIONS import Descriptions
+from Pytrich.Heuristics.Landmarks.landmark_cut import LMCutRC
+from Pytrich.Heuristics.heuristic import Heuristic
+from Pytrich.Search.htn_node import HTNNode
+from Pytrich.model import Model
+
+class LMCutHeuristic(Heuristic):
+    """
+    LM-Cut over the relaxed composition graph, computed for each node
+    from its state and task network. Methods cost 0, as decompositions don't add
+    to the g-value, so it is admissible for the plan length.
+    Options:
+        use_cache: reuse the value of nodes with the same state and set of tasks
+                   (cleared when it reaches cache_size entries)
+    """
+    def __init__(self, use_cache=False, name="lmcut"):
+        super().__init__(name=name)
+        self.use_cache = use_cache
+        self.lmcut = None
+        self.cache = {}
+        self.cache_size = 100000
+        self.cache_hits = 0
+        self.preprocessing_time = 0
+        self.elapsed_time = 0
+
+    def initialize(self, model: Model, initial_node: HTNNode):
+        start_time = time.perf_counter()
+        self.lmcut = LMCutRC(model, method_cost=0)
+        self.preprocessing_time = time.perf_counter() - start_time
+        return super().initialize(model, self._compute(initial_node))
+
+    def __call__(self, parent_node: HTNNode, node: HTNNode):
+        h_value = self._compute(node)
+        super().update_info(h_value)
+        return h_value
+
+    def _compute(self, node):
+        # goals are the tasks in the node's task network (as in LMCutRC.compute_lms)
+        goal_ids = frozenset(t.global_id for t in node.task_network)
+        if self.use_cache:
+            key = (node.state, goal_ids)
+            h_value = self.cache.get(key)
+            if h_value is not None:
+                self.cache_hits += 1
+                return h_value
+        start_time = time.perf_counter()
+        h_value, _ = self.lmcut.lm_cut(goal_ids, node.state)
+        self.elapsed_time += time.perf_counter() - start_time
+        if self.use_cache:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[key] = h_value
+        return h_value
+
+    def __repr__(self):
+        return 'lmcut(use_cache)' if self.use_cache else 'lmcut()'
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __output__(self):
+        desc = Descriptions()
+        out_str = f'Heuristic Info:\n'
+        out_str += f'\t{desc("heuristic_name", self.name)}\n'
+        out_str += f'\t{desc("heuristic_preprocessing_time", self.preprocessing_time)}\n'
+        out_str += f'\t{desc("heuristic_elapsed_time", f"{self.elapsed_time:.4f}")}\n'
+        if self.use_cache:
+            out_str += f'\t{desc("heuristic_cache_hits", self.cache_hits)}\n'
+        return out_str
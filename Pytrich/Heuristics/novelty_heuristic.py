@@ -2,7 +2,7 @@ import time
 from typing import Optional, Dict, Union, List
 from Pytrich.DESCRIPTIONS import Descriptions
 from Pytrich.Heuristics.heuristic import Heuristic
-from Pytrich.Heuristics.Novelty.novelty import NoveltyFT, NoveltyH1FT, NoveltyH2FT, NoveltyH3FT, NoveltyH4FT, NoveltyH5FT, NoveltyH6FT, NoveltyH7FT, NoveltyLazyFT
+from Pytrich.Heuristics.Novelty.novelty import NoveltyTable, NoveltyFT, NoveltyKeysFT, NoveltyH1FT, NoveltyH2FT, NoveltyH3FT, NoveltyH4FT, NoveltyH5FT, NoveltyH6FT, NoveltyH7FT, NoveltyLazyFT, NoveltyW2
 from Pytrich.Search.htn_node import HTNNode
 from Pytrich.model import Model
 
@@ -10,10 +10,20 @@ class NoveltyHeuristic(Heuristic):
     """
     Novelty heuristic for HTN planning.
     Computes novelty based on different configurations and integrates it into the search process.
+    Options:
+        novelty_type: ft, lazyft, w2, w2ft, h1ft-h7ft
+        memory_limit_mb: memory for pairs of facts (w2, w2ft), only width 1 is used when exceeded
+        keys: heuristics whose values, with the progressed task, key the novelty table, e.g. NOVELTY(keys=[TDG(), LMCOUNT()])
+              (overrides novelty_type, the heuristics are shared with the rest of the configuration)
     """
-    def __init__(self, novelty_type: str = "ft", name: str = "novelty"):
+    order_dependent = True
+
+    def __init__(self, novelty_type: str = "ft", memory_limit_mb: Optional[float] = None,
+                 keys: Optional[List[Heuristic]] = None, name: str = "novelty"):
         super().__init__(name=name)
-        self.novelty_type = novelty_type.lower()
+        self.keys = keys
+        self.novelty_type = "keys" if keys else novelty_type.lower()
+        self.memory_limit = int(memory_limit_mb * (1 << 20)) if memory_limit_mb is not None else None
         self.novelty_function = None  # Assigned during initialization
         self.preprocessing_time = 0
         self.start_time = 0
@@ -33,10 +43,16 @@ class NoveltyHeuristic(Heuristic):
         """
         Map the novelty type string to the appropriate novelty function.
         """
-        if self.novelty_type == "ft":
+        if self.keys:
+            return NoveltyKeysFT(m, n, self.keys)
+        elif self.novelty_type == "ft":
             return NoveltyFT()
         elif self.novelty_type == "lazyft":
             return NoveltyLazyFT()
+        elif self.novelty_type == "w2":
+            return NoveltyW2(n, memory_limit=self.memory_limit)
+        elif self.novelty_type == "w2ft":
+            return NoveltyW2(n, use_tasks=True, memory_limit=self.memory_limit)
         elif self.novelty_type == "h1ft":
             return NoveltyH1FT(m,n)
         elif self.novelty_type == "h2ft":
@@ -72,18 +88,30 @@ class NoveltyHeuristic(Heuristic):
         return self.novelty_function(parent, node)
 
     def __repr__(self):
+        if self.keys:
+            return f"Novelty(keys={self.keys})"
         return f"Novelty(type={self.novelty_type})"
 
     def __str__(self):
-        return f"Novelty(type={self.novelty_type})"
+        return self.__repr__()
 
     def __output__(self):
         """
         Return a string representation of the heuristic configuration and statistics.
         """
-        return (
+        out_str = (
             f"Heuristic Info:\n"
             f"\tName: {self.name}\n"
             f"\tType: {self.novelty_type}\n"
-            f"\tPreprocessing Time: {getattr(self, 'preprocessing_time', 0):.2f} s\n"
         )
+        if self.keys:
+            out_str += f"\tKeys: {', '.join(str(h) for h in self.keys)}\n"
+        return out_str + f"\tPreprocessing Time: {getattr(self, 'preprocessing_time', 0):.2f} s\n"
+
+    def memory(self):
+        """
+        Approximate size in bytes of the novelty table (reported after search).
+        """
+        if isinstance(self.novelty_function, NoveltyTable):
+            return self.novelty_function.memory()
+        return 0
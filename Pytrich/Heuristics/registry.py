@@ -0,0 +1,28 @@
+import inspect
+
+class HeuristicRegistry:
+    """
+    One heuristic instance per configuration (class and parameters, defaults included),
+    so aggregations and novelty keys asking for the same heuristic share its preprocessing
+    (AND/OR graphs, landmarks) and its per node evaluation (see Heuristic.evaluate).
+    """
+    def __init__(self):
+        self.heuristics = {}
+
+    def get(self, heuristic_class, **params):
+        bound = inspect.signature(heuristic_class).bind(**params)
+        bound.apply_defaults()
+        key = (heuristic_class, tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in bound.arguments.items()))
+        heuristic = self.heuristics.get(key)
+        if heuristic is None:
+            heuristic = heuristic_class(**params)
+            self.heuristics[key] = heuristic
+        return heuristic
+
+    def clear(self):
+        self.heuristics = {}
+
+    def __len__(self):
+        return len(self.heuristics)
+
+SHARED_HEURISTICS = HeuristicRegistry()
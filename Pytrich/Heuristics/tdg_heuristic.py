@@ -1,6 +1,9 @@
 import time
 from Pytrich.Heuristics.heuristic import Heuristic
-from Pytrich.ProblemRepresentation.and_or_graph import AndOrGraph, ContentType, NodeType
+from Pytrich.ProblemRepresentation.and_or_graph import AND_NODE, OR_NODE, ContentType
+
+OPERATOR = ContentType.OPERATOR.value
+ABSTRACT_TASK = ContentType.ABSTRACT_TASK.value
 from Pytrich.Search.htn_node import HTNNode
 from Pytrich.model import Model
 
@@ -18,32 +21,37 @@ class TaskDecompositionHeuristic(Heuristic):
         Initialize the heuristic with the model and compute task decomposition graph.
         """
         start_time = time.time()
-        self.and_or_graph = AndOrGraph(model, graph_type=3)
-        self._compute_tdg()
+        self.and_or_graph = model.graphs.compact(3)
+        values = self._compute_tdg()
         self.preprocessing_time = time.time() - start_time
 
-        for node in self.and_or_graph.nodes:
-            if node and node.content_type in \
-                {ContentType.OPERATOR, ContentType.ABSTRACT_TASK}:
-                self.tdg_values[node.ID] = node.value
+        content_type = self.and_or_graph.content_type
+        for n_id in range(len(self.and_or_graph)):
+            if content_type[n_id] in (OPERATOR, ABSTRACT_TASK):
+                self.tdg_values[n_id] = values[n_id]
+        self.and_or_graph = None # shared graph, only needed for preprocessing
 
-        h_value = sum(self.tdg_values.get(task.global_id, float('inf')) \
-                      for task in initial_node.task_network)
+        self.set_task_values(model, self.tdg_values)
+        h_value = self.tn_sum(None, initial_node)
         
         return super().initialize(model, h_value)
 
     def _compute_tdg(self):
         """
         Iteratively compute values for the AND/OR graph using a bottom-up approach.
+        Values are indexed by node ID (over the compact graph, see CompactAndOrGraph).
         """
-        for node in self.and_or_graph.nodes:
-            if not node:
-                continue
-            if node.content_type == ContentType.OPERATOR:
-                node.value = 0
+        graph = self.and_or_graph
+        node_type, content_type, weight = graph.node_type, graph.content_type, graph.weight
+        pred, pred_start = graph.pred, graph.pred_start
+        node_ids = [n_id for n_id in range(len(graph)) if node_type[n_id]]
+        values = [0] * len(graph)
+        for n_id in node_ids:
+            if content_type[n_id] == OPERATOR:
+                values[n_id] = 0
             else:
-                node.value = 1 if self.use_satis and \
-                node.content_type == ContentType.ABSTRACT_TASK \
+                values[n_id] = 1 if self.use_satis and \
+                content_type[n_id] == ABSTRACT_TASK \
                 else float('inf')
 
         changed = True
@@ -51,23 +59,20 @@ class TaskDecompositionHeuristic(Heuristic):
             self.iterations += 1
             changed = False
 
-            for node in self.and_or_graph.nodes:
-                if not node:
-                    continue
-
-                new_value = node.weight
-                if node.type == NodeType.OR:
-                    new_value += min(n.value for n in node.predecessors)
-                elif node.type == NodeType.AND:
-                    new_value += sum(n.value for n in node.predecessors)
+            for n_id in node_ids:
+                new_value = weight[n_id]
+                if node_type[n_id] == OR_NODE:
+                    new_value += min([values[p] for p in pred[pred_start[n_id]:pred_start[n_id+1]]])
+                elif node_type[n_id] == AND_NODE:
+                    new_value += sum([values[p] for p in pred[pred_start[n_id]:pred_start[n_id+1]]])
 
-                if new_value != node.value:
+                if new_value != values[n_id]:
                     changed = True
-                    node.value = new_value
+                    values[n_id] = new_value
+        return values
 
     def __call__(self, parent_node, node):
-        h_value = sum(self.tdg_values.get(task.global_id, float('inf')) \
-                      for task in node.task_network)
+        h_value = self.tn_sum(parent_node, node)
         super().update_info(h_value)
         return h_value
     
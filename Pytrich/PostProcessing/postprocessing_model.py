@@ -1,187 +1,289 @@
-import logging
-import sys
+import time
+from collections import defaultdict
 
-
-from Pytrich.model import Operator, AbstractTask
+from Pytrich.DESCRIPTIONS import Descriptions
+from Pytrich.model import Decomposition, Operator, AbstractTask, bit_positions
 import Pytrich.FLAGS as FLAGS
 
+# Pruning of the grounded (bitwise) model. Tasks are identified by global id while pruning,
+# ids only become dense again after compact_model.
+
+# name prefix of the actions pandaPI adds in front of a method for its preconditions
+METHOD_PRECONDITION_PREFIX = '__method_precondition_'
+
+def postprocess(model, use_to_reachability=False, use_pullup=False, use_flattening=False):
+    """
+    Pruning pipeline:
+        TDG reachability and relaxed executability (del_relax_reachability),
+        total-order reachability (use_to_reachability), method precondition pullup (use_pullup),
+        hierarchy flattening (use_flattening), then compaction of facts and global ids (compact_model).
+    """
+    start_time = time.perf_counter()
+    count_facts_before = len(model.facts)
+    count_op_before = len(model.operators)
+    count_abs_task_before = len(model.abstract_tasks)
+    count_decomp_before = len(model.decompositions)
+
+    del_relax_reachability(model)
+    if use_to_reachability:
+        # TO reachability indexes tasks by global id
+        compact_model(model)
+        # imported here: total_order_reachability depends on this module
+        from Pytrich.PostProcessing.total_order_reachability import TO_relax_reachability
+        TO_relax_reachability(model)
+        del_relax_reachability(model)
+    if use_pullup:
+        pullup(model)
+        del_relax_reachability(model)
+    if use_flattening:
+        count_inlined, count_chains, count_duplicates = flatten_hierarchy(model)
+        desc = Descriptions()
+        print(desc('flattened_tasks', count_inlined))
+        print(desc('flattened_chains', count_chains))
+        print(desc('flattened_duplicates', count_duplicates))
+        del_relax_reachability(model)
+    compact_model(model)
+
+    desc = Descriptions()
+    print(desc('pruned_facts', f'{count_facts_before} => {len(model.facts)}'))
+    print(desc('pruned_operators', f'{count_op_before} => {len(model.operators)}'))
+    print(desc('pruned_abstract_tasks', f'{count_abs_task_before} => {len(model.abstract_tasks)}'))
+    print(desc('pruned_decompositions', f'{count_decomp_before} => {len(model.decompositions)}'))
+    print(desc('postprocessing_elapsed_time', time.perf_counter() - start_time))
 
 def clean_tdg(
-    model    
+    model
 ):
     """
-    Compresses the model representation to optimize memory usage and performance.
-
-    simple TDG cleaning: It filters out unachieved operators and decompositions based on the initial task network,
-    and updates the model with only the necessary elements.
-    It also logs the memory usage before and after the compression for profiling purposes.
+    simple TDG cleaning: It filters out operators, abstract tasks and decompositions
+    not reachable from the initial task network through decompositions.
     """
     # profilling stuff
     count_op_before     = len(model.operators)
     count_decomp_before = len(model.decompositions)
     count_abs_task_before = len(model.abstract_tasks)
 
-    used_operators      = []
-    used_decompositions = []
-    used_abstract_tasks = []
     visited_tasks = set()
-    used_facts    = set()
-    
+    used_decompositions = set()
     tasks = model.initial_tn[:]
-    for l in model.initial_state:
-        used_facts.add(l)
-    
     while len(tasks)>0:
         task = tasks.pop()
-        if task in visited_tasks:
+        if task.global_id in visited_tasks:
             continue
-        visited_tasks.add(task)
-        if type(task) == Operator:
-            used_operators.append(task)
-            used_facts.update(task.pos_precons) 
-            used_facts.update(task.neg_precons)
-            used_facts.update(task.add_effects)
-            used_facts.update(task.del_effects)
-        else:
-            used_abstract_tasks.append(task)
-            for method in model.methods(task):
-                used_facts.update(method.pos_precons)
-                used_facts.update(method.neg_precons)
-                used_decompositions.append(method)
-                tasks+= model.decompose(method)[:]
-                
+        visited_tasks.add(task.global_id)
+        if isinstance(task, AbstractTask):
+            for method in task.decompositions:
+                used_decompositions.add(method.global_id)
+                tasks += method.task_network
+
+    model.operators      = [o for o in model.operators if o.global_id in visited_tasks]
+    model.abstract_tasks = [t for t in model.abstract_tasks if t.global_id in visited_tasks]
+    model.decompositions = [d for d in model.decompositions if d.global_id in used_decompositions]
 
-    # profilling stuff
-    model.operators      = used_operators
-    model.decompositions = used_decompositions
-    model.facts          = used_facts
-    model.abstract_tasks = used_abstract_tasks
-    count_op_after     = len(model.operators)
-    count_decomp_after = len(model.decompositions)
-    count_abs_task_after = len(model.abstract_tasks)
-    
     if FLAGS.LOG_GROUNDER:
-        print(f"used facts: {len(used_facts)}")
-        print(f"cleaning operators: before {count_op_before} un ==> after {count_op_after} un")
-        print(f"cleaning decompositions: before {count_decomp_before} un ==> after {count_decomp_after} un")
-        print(f"cleaning tasks: before {count_abs_task_before} un ==> after {count_abs_task_after} un")
+        print(f"cleaning operators: before {count_op_before} un ==> after {len(model.operators)} un")
+        print(f"cleaning decompositions: before {count_decomp_before} un ==> after {len(model.decompositions)} un")
+        print(f"cleaning tasks: before {count_abs_task_before} un ==> after {len(model.abstract_tasks)} un")
 
 
-def remove_negative_precons(model):
-    neg_facts = set()
-    # convert negative preconditions into 'neg literals'
-    for o in model.operators:
-        new_pos_precons = set(o.pos_precons)
-        for n_p in o.neg_precons:
-            new_fact = '(not_' + n_p[1:]
-            new_pos_precons.add(new_fact)
-            model.facts.add(new_fact)
-        neg_facts.update(o.neg_precons)
-        o.pos_precons = frozenset(new_pos_precons)
+def lift_method_preconditions(model):
+    """
+    Move pandaPI's method precondition actions into the decompositions' preconditions:
+    leading subtasks named __method_precondition_* without effects or cost are removed from the
+    task network and their preconditions added to the decomposition (the plan is unchanged, as they
+    don't show up in it). Actions no longer referenced are dropped and global ids reassigned.
+    A method is left with its last precondition action instead of an empty task network without
+    preconditions (relaxed graphs only start exploring from facts and operators).
+    Returns the number of lifted actions.
+    """
+    def is_method_precondition(t):
+        return isinstance(t, Operator) and t.name.startswith(METHOD_PRECONDITION_PREFIX) and \
+            t.add_effects == 0 and t.del_effects == 0 and t.cost == 0
 
+    count_lifted = 0
     for d in model.decompositions:
-        new_pos_precons = set(d.pos_precons)
-        for n_p in d.neg_precons:
-            new_fact = '(not_' + n_p[1:]
-            new_pos_precons.add(new_fact)
-            model.facts.add(new_fact)
-        neg_facts.update(d.neg_precons)
-        d.pos_precons = frozenset(new_pos_precons)
-    
-    # change effects to turns a not literals true when modified
-    for o in model.operators:
-        for fact in o.add_effects:
-            if fact in neg_facts:
-                o.del_effects.add('(not_' + fact[1:])
-        for fact in o.del_effects:
-            if fact in neg_facts:
-                o.add_effects.add('(not_' + fact[1:])
-    
-    # update initial state
-    for fact in neg_facts:
-        new_initial_state = set()
-        if not fact in model.initial_state:
-            new_initial_state.add('(not_' + fact[1:])
-        new_initial_state.update(model.initial_state)
-        model.initial_state = frozenset(new_initial_state)
-    
-    #clear all negative precons
-    for o in model.operators:
-        o.neg_precons=frozenset()
-    for d in model.decompositions:
-        d.neg_precons=frozenset()
-    
-
-
-
-def convert_bitwise_repr(model):
-    def map_explicit_to_int(model):
-        """
-        Maps each fact to a unique integer, creating a mapping for bitwise operations.
-        This method is part of the process to convert states and operations to a bitwise format.
-        """
-        cont = 0
-
-        model.facts = sorted(model.facts)
-        model.goals = sorted(model.goals)
-        # NOTE: this is essential for fact count heuristic works faster
-        for g in model.goals:
-                model._explicit_to_int[g]    = cont
-                model._int_to_explicit[cont] = g
-                cont+=1
-        
-        for f in model.facts:
-            if f in model.goals:
-                continue
-            model._explicit_to_int[f]    = cont
-            model._int_to_explicit[cont] = f
-            cont+=1
-    
-    def convert_to_bitwise(model, facts_set):
-        bitwise_representation = 0
-        for fact in facts_set:
-            bit_position = model._explicit_to_int[fact]
-            bitwise_representation |= 1 << bit_position
-        return bitwise_representation
-    
+        lifted = 0
+        while lifted < len(d.task_network) and is_method_precondition(d.task_network[lifted]):
+            lifted += 1
+        if lifted == len(d.task_network) and lifted > 0:
+            pos_precons = d.pos_precons
+            for op in d.task_network:
+                pos_precons |= op.pos_precons
+            if pos_precons == 0:
+                lifted -= 1
+        if lifted == 0:
+            continue
+        for op in d.task_network[:lifted]:
+            d.pos_precons |= op.pos_precons
+            d.neg_precons |= op.neg_precons
+        d.task_network = d.task_network[lifted:]
+        count_lifted += lifted
+
+    if count_lifted:
+        used_tasks = {t.global_id for d in model.decompositions for t in d.task_network}
+        used_tasks.update(t.global_id for t in model.initial_tn)
+        model.operators = [o for o in model.operators if o.global_id in used_tasks or not is_method_precondition(o)]
+        model.assign_global_ids()
+    if FLAGS.LOG_GROUNDER:
+        print(f"lifted {count_lifted} method precondition actions, {len(model.operators)} operators left")
+    return count_lifted
+
+def _flattened(d, name, pos_precons, neg_precons, task_network, inlined):
     """
-    Compresses fact representations by mapping facts to bit positions and converting
-    states to integer representations.
+    Copy of decomposition d with another task network that also stands for the
+    decompositions in inlined, keeping the original ones in source (see HTNNode.extract_solution).
     """
-    # map facts to bit position for bit representation
-    map_explicit_to_int(model)
-    
-    # convert initial and goal state to int
-    si_bitwise_repr = convert_to_bitwise(model, model.initial_state)
-    sf_bitwise_repr = convert_to_bitwise(model, model.goals)
-    model.initial_state = si_bitwise_repr
-    model._goal_bit_pos = [model._explicit_to_int[g] for g in model.goals]
-    model.goals = sf_bitwise_repr
-    
-    # convert preconditions and effects to integers for bitwise operations
+    flat = Decomposition(name, d.global_id, d.local_id, pos_precons, neg_precons, d.compound_task, task_network)
+    flat.source = (d.source or [(d.compound_task, d)]) + (inlined.source or [(inlined.compound_task, inlined)])
+    return flat
+
+def _signatures(decompositions):
+    """Task networks and preconditions of decompositions, to tell whether a rewrite changed anything."""
+    return sorted((tuple(t.global_id for t in d.task_network), d.pos_precons, d.neg_precons) for d in decompositions)
+
+def flatten_hierarchy(model, max_chain_methods=8, max_network_size=16):
+    """
+    Compile away decomposition layers that always cost a search node:
+        abstract tasks with a single (non recursive) method are inlined in the task networks using them,
+            at the front (its preconditions join the parent's) or anywhere if the method has no preconditions,
+            unless a method with several subtasks makes the task network longer than max_network_size
+            (nested single method tasks would multiply the size of task networks, copied and hashed by every node);
+        methods whose task network is a single abstract task are replaced by one method per decomposition
+            of that task (if it has at most max_chain_methods and isn't recursive), except those leading
+            back to a task of the chain (cycles of single subtask methods);
+        decompositions of a task with the same task network as another one and stronger preconditions are removed.
+    Repeated until nothing changes. Flattened decompositions keep the original ones they stand for in
+    source, so solutions still report the original decomposition tree.
+    Returns the number of inlined tasks, replaced chains and removed duplicates.
+    """
+    count_inlined = 0
+    count_chains = 0
+    count_duplicates = 0
+    initial_tasks = {t.global_id for t in model.initial_tn}
+    changed = True
+    while changed:
+        changed = False
+        # (1) inline single method tasks
+        single_method = {}
+        for t in model.abstract_tasks:
+            if len(t.decompositions) == 1 and t.global_id not in initial_tasks:
+                m = t.decompositions[0]
+                if all(subtask.global_id != t.global_id for subtask in m.task_network):
+                    single_method[t.global_id] = m
+        for t in model.abstract_tasks:
+            decompositions = []
+            for d in t.decompositions:
+                for i, subtask in enumerate(d.task_network):
+                    m = single_method.get(subtask.global_id)
+                    if m is None or (i > 0 and (m.pos_precons or m.neg_precons)) or \
+                            (len(m.task_network) > 1 and len(d.task_network) + len(m.task_network) - 1 > max_network_size):
+                        continue
+                    task_network = d.task_network[:i] + m.task_network + d.task_network[i+1:]
+                    d = _flattened(d, d.name_id, d.pos_precons | m.pos_precons, d.neg_precons | m.neg_precons, task_network, m)
+                    count_inlined += 1
+                    changed = True
+                    break # one per pass, the others at the next one
+                decompositions.append(d)
+            t.decompositions = decompositions
+
+        # (2) replace chains: methods whose task network is a single abstract task
+        for t in model.abstract_tasks:
+            decompositions = []
+            for d in t.decompositions:
+                u = d.task_network[0] if len(d.task_network) == 1 else None
+                if not isinstance(u, AbstractTask) or u.global_id == t.global_id or \
+                        len(u.decompositions) > max_chain_methods or \
+                        any(subtask.global_id == u.global_id for m in u.decompositions for subtask in m.task_network):
+                    decompositions.append(d)
+                    continue
+                # tasks the chain went through: a method back to one of them only repeats the chain
+                chain = {t.global_id, u.global_id}
+                chain.update(task.global_id for task, _ in d.source or [])
+                for m in u.decompositions:
+                    if len(m.task_network) == 1 and m.task_network[0].global_id in chain:
+                        continue
+                    decompositions.append(_flattened(d, f'{d.name}+{m.name}', d.pos_precons | m.pos_precons,
+                                                     d.neg_precons | m.neg_precons, m.task_network[:], m))
+                count_chains += 1
+            if _signatures(decompositions) != _signatures(t.decompositions):
+                changed = True
+            t.decompositions = decompositions
+
+        # (3) remove duplicate decompositions, keeping the weakest preconditions (the first of equal ones)
+        for t in model.abstract_tasks:
+            by_network = defaultdict(list)
+            for d in t.decompositions:
+                by_network[tuple(subtask.global_id for subtask in d.task_network)].append(d)
+            removed = set() # flattened copies share global ids until the end of the pass
+            for group in by_network.values():
+                for i, d in enumerate(group):
+                    for j, other in enumerate(group):
+                        if j == i or id(other) in removed:
+                            continue
+                        weaker = (other.pos_precons & ~d.pos_precons) == 0 and (other.neg_precons & ~d.neg_precons) == 0
+                        equal = other.pos_precons == d.pos_precons and other.neg_precons == d.neg_precons
+                        if weaker and (j < i or not equal):
+                            removed.add(id(d))
+                            break
+            if removed:
+                t.decompositions = [d for d in t.decompositions if id(d) not in removed]
+                count_duplicates += len(removed)
+                changed = True
+
+        model.decompositions = [d for t in model.abstract_tasks for d in t.decompositions]
+        model.assign_global_ids()
+        clean_tdg(model)
+        model.assign_global_ids()
+
+    if FLAGS.LOG_GROUNDER:
+        print(f"flattening: {count_inlined} inlined tasks, {count_chains} chains, {count_duplicates} duplicates")
+    return count_inlined, count_chains, count_duplicates
+
+def compact_model(model):
+    """
+    Drop facts that no operator, decomposition or goal mentions, and renumber
+    facts, operators, abstract tasks and decompositions to dense global ids.
+    """
+    used_facts = model.goals
     for o in model.operators:
-        o.pos_precons_bitwise = convert_to_bitwise(model, o.pos_precons)
-        o.neg_precons_bitwise = convert_to_bitwise(model, o.neg_precons)
-        o.add_effects_bitwise = convert_to_bitwise(model, o.add_effects)
-        o.del_effects_bitwise = convert_to_bitwise(model, o.del_effects)
-        o.pos_precons = frozenset()
-        o.neg_precons = frozenset()
-        o.add_effects = frozenset()
-        o.del_effects = frozenset()
+        used_facts |= o.pos_precons | o.neg_precons | o.add_effects | o.del_effects
     for d in model.decompositions:
-        d.pos_precons_bitwise = convert_to_bitwise(model, d.pos_precons)
-        d.neg_precons_bitwise = convert_to_bitwise(model, d.neg_precons)
-        d.pos_precons = frozenset()
-        d.neg_precons = frozenset()
+        used_facts |= d.pos_precons | d.neg_precons
+
+    kept = bit_positions(used_facts)
+    if len(kept) != len(model.facts):
+        position = {f: new_f for new_f, f in enumerate(kept)}
+        def remap(bits):
+            result = 0
+            for f in bit_positions(bits & used_facts):
+                result |= 1 << position[f]
+            return result
 
+        for o in model.operators:
+            o.pos_precons = remap(o.pos_precons)
+            o.neg_precons = remap(o.neg_precons)
+            o.add_effects = remap(o.add_effects)
+            o.del_effects = remap(o.del_effects)
+        for d in model.decompositions:
+            d.pos_precons = remap(d.pos_precons)
+            d.neg_precons = remap(d.neg_precons)
+        model.initial_state = remap(model.initial_state)
+        model.goals = remap(model.goals)
+        model.facts = [model.facts[f] for f in kept]
+        mutex_groups = (tuple(position[f] for f in group if f in position) for group in model.mutex_groups)
+        model.mutex_groups = [group for group in mutex_groups if group]
+    model.assign_global_ids()
 
-    
+    if FLAGS.LOG_GROUNDER:
+        print(f"compaction: {len(model.facts)} facts, {len(model.operators)} operators, "
+              f"{len(model.abstract_tasks)} abstract tasks, {len(model.decompositions)} decompositions")
 
-#TODO:  Need code refactoring for efficiency and readability
 def del_relax_reachability(model):
     """
     Performs delete relaxation to identify reachable operators, tasks, and decompositions.
-    It iteratively prunes elements not reachable from the task decomposition graph.
+    Alternates relaxed executability (operators applicable ignoring deletes and negative preconditions),
+    bottom-up removal (decompositions with unreachable preconditions or pruned subtasks, tasks without decompositions)
+    and TDG cleaning, until nothing is pruned.
 
     Args:
         model (Model): The planning model to optimize.
@@ -190,162 +292,162 @@ def del_relax_reachability(model):
     initial_decomp_len = len(model.decompositions)
     initial_task_len = len(model.abstract_tasks)
 
-    removed_tasks     = set()
-    removed_operators = set()
-    initial_operators = {op for op in model.initial_tn if isinstance(op, Operator)} #in case there are operators into the initial task network
-    # TODO: problem here is to updated used_operators based on TDG, it generates invalid plans
     changed=True
     while changed:
-        changed=False
-        reachable_ops, positive_facts = _applicable_operators(model, model.initial_state)
-        
-        htn_reachable_operators = set(initial_operators)
-        removed_operators |= set(model.operators) - reachable_ops
-        for t in model.abstract_tasks[:]:
-            if t in removed_tasks:
-                continue
-
-            
-            # NOTE: remove decompositions: (1) not applicable (2) containing removed subtask
-            d_removal = False  # indicate if at least one decomposition 'd' was removed from task 't' 
-            for d in t.decompositions:
-                if not model.applicable(d, positive_facts) or any(subtask in removed_operators or subtask in removed_tasks for subtask in d.task_network):
-                # if not model.applicable(d, positive_facts):
-                   t.decompositions.remove(d)
-                   d_removal=True
-            
-            if d_removal and len(t.decompositions) == 0:
-                removed_tasks.add(t)
-                model.abstract_tasks.remove(t)
-            
-        reachable_decompositions = set()
-        for t in model.abstract_tasks:
-            if t in removed_tasks:
-               continue
-            for d in t.decompositions:
-                reachable_decompositions.add(d)
-                for subt in d.task_network:
-                    if isinstance(subt, Operator) and not subt in removed_operators:
-                        htn_reachable_operators.add(subt)
-                    
-        reachable_tasks = set(model.abstract_tasks) -  removed_tasks
+        count_before = len(model.operators) + len(model.abstract_tasks) + len(model.decompositions)
+        clean_tdg(model)
+        reachable_ops, positive_facts = _applicable_operators(model.operators, model.initial_state)
+        _bottom_up_removal(model, reachable_ops, positive_facts)
+        clean_tdg(model)
+        changed = len(model.operators) + len(model.abstract_tasks) + len(model.decompositions) != count_before
         if FLAGS.LOG_GROUNDER:
-            print(f" op ({len(model.operators)}=>{len(htn_reachable_operators)})|tsks ({len(model.abstract_tasks)}=>{len(reachable_tasks)})|decompo ({len(model.decompositions)}=>{len(reachable_decompositions)})")
-        if len(reachable_tasks) != len(model.abstract_tasks) or len(htn_reachable_operators) != len(model.operators) or len(model.decompositions) != len(reachable_decompositions):
-            model.operators = list(htn_reachable_operators)  
-            model.decompositions = list(reachable_decompositions)
-            model.abstract_tasks = list(reachable_tasks) 
-            changed=True
-    
-    if FLAGS.LOG_GROUNDER:   
+            print(f" op ({len(model.operators)})|tsks ({len(model.abstract_tasks)})|decompo ({len(model.decompositions)})")
+
+    if FLAGS.LOG_GROUNDER:
         print(f"Delete Relaxation Reachability: Operators {initial_op_len} to {len(model.operators)}, Decompositions {initial_decomp_len} to {len(model.decompositions)}, Tasks {initial_task_len} to {len(model.abstract_tasks)}")    #correctness_check(model)
-    
 
-def _applicable_operators(model, initial_facts):
-    reachable_operators = set()
+
+def _applicable_operators(operators, initial_facts):
+    """
+    Relaxed exploration: global ids of the operators applicable ignoring delete effects
+    and negative preconditions, and the facts they reach.
+    Each operator waits on its missing preconditions, and is applied once when the last one is reached.
+    """
     reachable_facts = initial_facts
-    
-    changed = True
-    while changed:
-        changed = False
-        valid_operators =  set(model.operators) - reachable_operators
-        for op in valid_operators:
-            if not op in reachable_operators and model.applicable(op, reachable_facts):
-                reachable_operators.add(op)
-                reachable_facts = op.relaxed_apply_bitwise(reachable_facts)
-                changed = True
+    missing = {}
+    waiting = defaultdict(list)
+    queue = []
+    for op in operators:
+        needed = bit_positions(op.pos_precons & ~reachable_facts)
+        if needed:
+            missing[op.global_id] = len(needed)
+            for f in needed:
+                waiting[f].append(op)
+        else:
+            queue.append(op)
+
+    reachable_operators = set()
+    while queue:
+        op = queue.pop()
+        reachable_operators.add(op.global_id)
+        new_facts = op.add_effects & ~reachable_facts
+        reachable_facts |= new_facts
+        for f in bit_positions(new_facts):
+            for waiting_op in waiting.pop(f, ()):
+                missing[waiting_op.global_id] -= 1
+                if missing[waiting_op.global_id] == 0:
+                    queue.append(waiting_op)
     return reachable_operators, reachable_facts
 
+def _bottom_up_removal(model, reachable_operators, reachable_facts):
+    """
+    Removes decompositions not applicable in the relaxed reachable facts or with a pruned subtask,
+    and abstract tasks left without decompositions, propagating upwards through the decompositions containing them.
+    Tasks of the initial task network are kept (without decompositions, the problem is unsolvable).
+    """
+    containing = defaultdict(list) # task global id -> decompositions containing it
+    for d in model.decompositions:
+        for t_id in {t.global_id for t in d.task_network}:
+            containing[t_id].append(d)
+    methods_left = {t.global_id: len(t.decompositions) for t in model.abstract_tasks}
+
+    removed_decompositions = set()
+    removed_tasks = [o.global_id for o in model.operators if o.global_id not in reachable_operators]
+    def remove_decomposition(d):
+        removed_decompositions.add(d.global_id)
+        task_id = d.compound_task.global_id
+        methods_left[task_id] -= 1
+        if methods_left[task_id] == 0:
+            removed_tasks.append(task_id)
+
+    for d in model.decompositions:
+        if d.pos_precons & ~reachable_facts:
+            remove_decomposition(d)
+    pruned_tasks = set()
+    while removed_tasks:
+        t_id = removed_tasks.pop()
+        pruned_tasks.add(t_id)
+        for d in containing[t_id]:
+            if d.global_id not in removed_decompositions:
+                remove_decomposition(d)
+
+    initial_tasks = {t.global_id for t in model.initial_tn}
+    pruned_tasks -= initial_tasks
+    for t in model.abstract_tasks:
+        t.decompositions = [d for d in t.decompositions if d.global_id not in removed_decompositions]
+    model.operators = [o for o in model.operators if o.global_id not in pruned_tasks]
+    model.abstract_tasks = [t for t in model.abstract_tasks if t.global_id not in pruned_tasks]
+    model.decompositions = [d for d in model.decompositions if d.global_id not in removed_decompositions]
+
 def correctness_check(model):
-    ab_set = set(model.abstract_tasks)
-    op_set = set(model.operators)
+    ab_set = {t.global_id for t in model.abstract_tasks}
+    op_set = {o.global_id for o in model.operators}
 
     tn_errors=[]
     for d in model.decompositions:
         for t in d.task_network:
-            if type(t) is AbstractTask and not t in ab_set:
+            if type(t) is AbstractTask and not t.global_id in ab_set:
                 tn_errors.append(f"ABTASK {d.name} -> {t.name}")
-            elif type(t) is Operator and not t in op_set:
+            elif type(t) is Operator and not t.global_id in op_set:
                 tn_errors.append(f"OPERATOR {d.name} -> {t.name}")
 
     if len(tn_errors)>0:
         print("MODEL INCONSISTENCIES FOUND")
         print(tn_errors)
         exit(0)
-    
+
 
 def pullup(model):
+    """
+    Adds to each decomposition's preconditions the facts its subtasks need before any earlier subtask can add them
+    (the task network is totally ordered, so they must hold when decomposing).
+    A primitive subtask needs its preconditions, an abstract one the preconditions shared by all its decompositions,
+    and may add the effects of any operator reachable from it. Iterated until no precondition changes.
+    """
     if FLAGS.LOG_GROUNDER:
         print('initializing pullup')
-    ctask_map = {} # map each decomposition to its compound task
-    for abtask_idx, ab_task in enumerate(model.abstract_tasks):
-        for decomp in ab_task.decompositions:
-            ctask_map[decomp] = abtask_idx
-
-    # Progression and done pullup control
-    decomp_progression = [0] * len(model.decompositions)
-    task_progression   = [0] * len(model.abstract_tasks)
-    decomp_done = [False] * len(model.decompositions)
-    task_done   = [False] * len(model.abstract_tasks)
-
-    #check for empty decompositions:
-    for m_idx, decomp in enumerate(model.decompositions):
-        if len(decomp.task_network) == 0:
-            decomp_done[m_idx] = True
-    
-    decomp_pullup_eff = [0] * len(model.decompositions)
-    changed=True
-    iterations=0
+    # effects any operator reachable from each task can add
+    task_adds = {o.global_id: o.add_effects for o in model.operators}
+    task_adds.update((t.global_id, 0) for t in model.abstract_tasks)
+    changed = True
+    while changed:
+        changed = False
+        for d in model.decompositions:
+            adds = task_adds[d.compound_task.global_id]
+            for t in d.task_network:
+                adds |= task_adds[t.global_id]
+            if adds != task_adds[d.compound_task.global_id]:
+                task_adds[d.compound_task.global_id] = adds
+                changed = True
+
+    # preconditions each task needs when it is the next task
+    task_precons = {o.global_id: o.pos_precons for o in model.operators}
+    task_precons.update((t.global_id, 0) for t in model.abstract_tasks)
+    iterations = 0
+    changed = True
     while changed:
         iterations += 1
-        count_op_pus = 0
         count_m_pus = 0
-        count_t_pus = 0
-        changed=False
-        for m_idx, decomp in enumerate(model.decompositions):
-            if decomp_done[m_idx]:
+        changed = False
+        for d in model.decompositions:
+            pullup_precons = 0
+            previous_adds = 0
+            for t in d.task_network:
+                pullup_precons |= task_precons[t.global_id] & ~previous_adds
+                previous_adds |= task_adds[t.global_id]
+            if pullup_precons & ~d.pos_precons:
+                d.pos_precons |= pullup_precons
+                count_m_pus += 1
+                changed = True
+        for t in model.abstract_tasks:
+            if not t.decompositions:
                 continue
-            
-            next_task = decomp.task_network[decomp_progression[m_idx]]
-            # if operator, pullup facts that are not effects of some previous task
-            if type(next_task) is Operator:
-                pullup_precons = next_task.pos_precons_bitwise & ~decomp_pullup_eff[m_idx]
-                decomp_pullup_eff[m_idx] |= next_task.add_effects_bitwise
-                decomp.pos_precons_bitwise |= pullup_precons
-                count_op_pus+=1
-                
-            # if abstract task and its done, pullup common facts from task's decompositions
-            else:
-                ctask_idx = ctask_map[decomp]
-                if not task_done[ctask_idx]:
-                    continue
-                precons_intersec = next_task.decompositions[0]
-                for d in next_task.decompositions:
-                    precons_intersec &= d.pos_precons_bitwise
-                pullup_precons = precons_intersec & ~decomp_pullup_eff[m_idx]
-                decomp.pos_precons_bitwise |= pullup_precons
-                count_t_pus+=1
-                #print(f'>>> ABSTRACT task pullup {decomp.name}')
-
-
-            # check if decomposition and task are done
-                # decomposition pullup over all task network
-                # abstract task pullup over all decompositions
-            decomp_progression[m_idx]+=1
-            if decomp_progression[m_idx] >= len(decomp.task_network):
-                decomp_done[m_idx]=True
-                #print(f'({decomp_progression[m_idx]}) decomposition pullup {decomp.name}')
-                count_m_pus+=1
-                ctask_idx = ctask_map[decomp]
-                task_progression[ctask_idx]+=1
-                compound_task = model.abstract_tasks[ctask_idx]
-                if task_progression[ctask_idx] >= len(compound_task.decompositions):
-                    task_done[ctask_idx] = True
-            changed=True    
+            precons_intersec = t.decompositions[0].pos_precons
+            for d in t.decompositions:
+                precons_intersec &= d.pos_precons
+            task_precons[t.global_id] = precons_intersec
         if FLAGS.LOG_GROUNDER:
-            print(f"it ({iterations}) Pullup Op {count_op_pus} Pullup Methods {count_m_pus} Pullup Tasks {count_t_pus}")
-    
+            print(f"it ({iterations}) Pullup Methods {count_m_pus}")
+
     if FLAGS.LOG_GROUNDER:
         print(f'Pullup ended')
-    
-        
@@ -1,229 +1,246 @@
 
-from copy import copy, deepcopy
 import time
-from typing import List, Set, Dict, NewType, Tuple, Union
+from typing import List, Optional, NewType, Set, Tuple
 
 from Pytrich.DESCRIPTIONS import Descriptions
 import Pytrich.FLAGS as FLAGS
-from Pytrich.model import Decomposition, Model, Operator, AbstractTask
+from Pytrich.model import Decomposition, Model, Operator, AbstractTask, bit_positions
+from Pytrich.PostProcessing.postprocessing_model import _applicable_operators
 
 GlobalID = NewType('GlobalID', int)
 LocalID  = NewType('LocalID', int)
 
-def _calculate_TO_achievers(model: Model, reachable: List[Set[int]]) -> Dict[int, Set[int]]:
-    """
-    Calculate the achievers for each operator.
-    The achievers are those that came before (predecessors) based on Total-Order reachability
-        and enable an operator (have at least one of its preconditions as effect).
+def _relaxed_applicable(o: Operator, state: int) -> bool:
+    # negative preconditions are ignored, as in the relaxed exploration
+    return (state & o.pos_precons) == o.pos_precons
 
-    NOTE: shift_offset_id (int): The offset used to map global task IDs to local task IDs.
-    NOTE: predecessors (List[Set[int]]): A list where each index corresponds to a local operator ID, 
-        and each element is a set of local IDs that can achieve the operator based on TO constraints.
-    NOTE: achivers_group (Dict[int, Set[int]]): A dictionary mapping each operator's global ID to a set of 
-        global IDs of operators that can achieve it.
+def _bitset(positions: List[int]) -> int:
+    """
+    Bitset of the given positions, built in one go (or-ing bits one by one into a growing int is quadratic).
+    """
+    if not positions:
+        return 0
+    bits = bytearray((max(positions) >> 3) + 1)
+    for p in positions:
+        bits[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(bits, 'little')
 
+def _task_sccs(model: Model) -> List[List[LocalID]]:
+    """
+    Strongly connected components of the task hierarchy: abstract tasks (by local ID),
+    with an edge to each abstract subtask of their decompositions.
+    Iterative Tarjan, so components come out in reverse topological order (subtasks first).
     """
-        
     shift_offset_id: int = model.ifacts_end + 1
-    predecessors: List[Set[LocalID]] = [set() for _ in range(len(model.operators))]
-    
-    # compute predecessors mapping global->local ids
-    for decomposition in model.decompositions:
-        subtasks = decomposition.task_network
-        
-        for sub_i, subtask in enumerate(subtasks, start=1):
-            taski_id: GlobalID = subtask.global_id
-            taski_local_id: LocalID = taski_id - shift_offset_id  # shift left: global->local
-            for operator_local_id in reachable[taski_local_id]:
-                for j in range(sub_i - 1, -1, -1):
-                    taskj_id: GlobalID = subtasks[j].global_id
-                    taskj_local_id: LocalID = taskj_id - shift_offset_id  # shift left: global->local
-                    r: Set[int] = reachable[taskj_local_id]
-                    predecessors[operator_local_id].update(r)
-    
-    subtasks = model.initial_tn
-    for sub_i, subtask in enumerate(subtasks):
-        taski_id: GlobalID = subtask.global_id
-        taski_local_id: LocalID = taski_id - shift_offset_id  # shift left: global->local
-        for operator_local_id in reachable[taski_local_id]:
-            for j in range(sub_i - 1, -1, -1):
-                taskj_id: GlobalID = subtasks[j].global_id
-                taskj_local_id: LocalID = taskj_id - shift_offset_id  # shift left: global->local
-                predecessors[operator_local_id].update(reachable[taskj_local_id])
-                
-    # compute achievers mappping local->global ids
-    achivers_group: Dict[GlobalID, Set[GlobalID]] = {a.global_id: set() for a in model.operators}
-    for o in model.operators:
-        if o.applicable_bitwise(model.initial_state):
-            achivers_group[o.global_id] = {-1}  # mark trivial applicable operators
-            continue
-        
-        o_achievers: Set[GlobalID] = set()
-        o_local_id: LocalID = o.global_id - shift_offset_id
-        o_predecessors: Set[LocalID] = predecessors[o_local_id]
-        
-        for pred_loc_id in o_predecessors:
-            pred_global_id: GlobalID = pred_loc_id + shift_offset_id  # shift RIGHT: local -> global
-            pred_instance: Operator = model.get_component(pred_global_id)
-            if pred_instance.add_effects_bitwise & o.pos_precons_bitwise != 0:
-                o_achievers.add(pred_global_id)
-        achivers_group[o.global_id] = o_achievers
+    len_operators = len(model.operators)
+    successors: List[List[LocalID]] = []
+    for task in model.abstract_tasks:
+        subtasks = {subtask.global_id - shift_offset_id - len_operators
+                    for d in task.decompositions for subtask in d.task_network
+                    if isinstance(subtask, AbstractTask)}
+        successors.append(sorted(subtasks))
 
-    return achivers_group
+    len_abstract_tasks = len(successors)
+    index: List[int] = [-1] * len_abstract_tasks
+    lowlink: List[int] = [0] * len_abstract_tasks
+    on_stack: List[bool] = [False] * len_abstract_tasks
+    stack: List[LocalID] = []
+    sccs: List[List[LocalID]] = []
+    counter = 0
+    for root in range(len_abstract_tasks):
+        if index[root] != -1:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i < len(successors[v]):
+                work[-1] = (v, i + 1)
+                w = successors[v][i]
+                if index[w] == -1:
+                    index[w] = lowlink[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    lowlink[v] = min(lowlink[v], index[w])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[v])
+            if lowlink[v] == index[v]:
+                scc: List[LocalID] = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    scc.append(w)
+                    if w == v:
+                        break
+                sccs.append(scc)
+    return sccs
 
-def _calculate_TO_reachable(model: Model) -> List[Set[int]]:
+def _calculate_TO_reachable(model: Model, sccs: List[List[LocalID]]) -> List[int]:
     """
-    Calculate the reachable set of operators for each task.
-
-    NOTE: R_set : A list where each index corresponds to a task's local ID, 
-         and each element is a set of reachable task local IDs.
-    NOTE: visited : A list to track which tasks have been 
-        visited during the depth-first search (DFS).
-    NOTE: v_it : A visit marker that increments with each DFS 
-        run to avoid resetting the `visited` list.
-    NOTE: shift_offset_ids: The offset used to map global task IDs to local task IDs.
-    
-    TODO: Use Dijkstra for updating nodes instead of DFS; not sure if it compensates.
+    Calculate the reachable set of operators for each abstract task.
+
+    NOTE: R : A list where each index corresponds to an abstract task's local ID,
+        and each element is a bitset of reachable operator local IDs
+        (operators trivially reach themselves, see _task_reachable).
+    NOTE: Components are visited subtasks first, so every subtask outside the component is already done
+        and all tasks of a component (which reach each other) share the same set.
     """
-    
     len_operators = len(model.operators)
-    len_abstract_tasks = len(model.abstract_tasks)
-    shift_offset_ids = model.ifacts_end + 1
-    
-    R_set: List[Set[LocalID]] = [set() for _ in range(len_operators + len_abstract_tasks)]
-    visited: List[LocalID] = [0] * (len_operators + len_abstract_tasks)
-    v_it: int = 1
+    shift_offset_id: int = model.ifacts_end + 1
 
-    # Operators are trivially reachable
-    for i in range(len_operators):
-        R_set[i] = {i}
+    R: List[int] = [0] * len(model.abstract_tasks)
 
-    for task in model.abstract_tasks:
-        r_task: Set[LocalID] = set()
-        _dfs_iterative(model, task, R_set, r_task, v_it, visited, shift_offset_ids)
-        
-        # Shift left to get task local IDs
-        task_local_id: LocalID = task.global_id - shift_offset_ids
-        R_set[task_local_id] = r_task
-        v_it += 1
+    for scc in sccs:
+        r_scc = 0
+        subtask_ops: List[LocalID] = []
+        for abt_local_id in scc:
+            for decomposition in model.abstract_tasks[abt_local_id].decompositions:
+                for subtask in decomposition.task_network:
+                    task_local_id: LocalID = subtask.global_id - shift_offset_id
+                    if task_local_id < len_operators:
+                        subtask_ops.append(task_local_id)
+                    else:
+                        r_scc |= R[task_local_id - len_operators]
+        r_scc |= _bitset(subtask_ops)
+        for abt_local_id in scc:
+            R[abt_local_id] = r_scc
+    return R
 
-    return R_set
-        
+def _task_reachable(reachable: List[int], len_operators: int, task_local_id: LocalID) -> int:
+    if task_local_id < len_operators:
+        return 1 << task_local_id
+    return reachable[task_local_id - len_operators]
 
-def _dfs_iterative(model: Model, task: AbstractTask, R: List[Set[LocalID]], 
-                   r: Set[LocalID], v_it: int, visited: List[LocalID], soid: int) -> None:
-    stack = [task]
-    
-    while stack:
-        current_task = stack.pop()
-        task_id = current_task.global_id
-        
-        # Shift left to get task local IDs
-        task_local_id: LocalID = LocalID(task_id - soid)
-        
-        if visited[task_local_id] == v_it:
+def _calculate_TO_predecessors(model: Model, reachable: List[int], sccs: List[List[LocalID]]) -> List[int]:
+    """
+    Calculate the predecessors of each operator: the operators reachable from the subtasks
+    ordered before any task it is reachable from, in a decomposition or the initial task network.
+
+    Each task position first collects the operators reachable from its preceding subtasks,
+    then these are propagated down the hierarchy (components parents first).
+
+    NOTE: P : A list indexed by task local IDs, with bitsets of operator local IDs.
+    NOTE: Within decompositions a subtask also counts its own reachable operators
+        (they may precede each other deeper in the hierarchy), the initial task network does not.
+    """
+    len_operators = len(model.operators)
+    shift_offset_id: int = model.ifacts_end + 1
+    P: List[int] = [0] * (len_operators + len(model.abstract_tasks))
+
+    def _add_positions(subtasks, include_self):
+        before = 0
+        for subtask in subtasks:
+            task_local_id: LocalID = subtask.global_id - shift_offset_id
+            if include_self:
+                before |= _task_reachable(reachable, len_operators, task_local_id)
+                P[task_local_id] |= before
+            else:
+                P[task_local_id] |= before
+                before |= _task_reachable(reachable, len_operators, task_local_id)
+
+    for decomposition in model.decompositions:
+        _add_positions(decomposition.task_network, include_self=True)
+    _add_positions(model.initial_tn, include_self=False)
+
+    for scc in reversed(sccs):
+        p_scc = 0
+        for abt_local_id in scc:
+            p_scc |= P[len_operators + abt_local_id]
+        if not p_scc:
             continue
-        
-        visited[task_local_id] = v_it
-        r_task = R[task_local_id]
-        if r_task:
-            r.update(r_task)
+        for abt_local_id in scc:
+            for decomposition in model.abstract_tasks[abt_local_id].decompositions:
+                for subtask in decomposition.task_network:
+                    P[subtask.global_id - shift_offset_id] |= p_scc
+    return P[:len_operators]
+
+def _calculate_TO_achievers(model: Model, predecessors: List[int]) -> List[Optional[int]]:
+    """
+    Calculate the achievers for each operator.
+    The achievers are those that came before (predecessors) based on Total-Order reachability
+        and enable an operator (have at least one of its preconditions as effect).
 
-        for decomposition in current_task.decompositions:
-            for subtask in decomposition.task_network:
-                if subtask in model.operators:
-                    r.add(LocalID(subtask.global_id - soid))  # use local ID
-                else:
-                    stack.append(subtask)
+    NOTE: achievers: A list indexed by operator local IDs, with a bitset of the local IDs
+        of the operators that can achieve it, or None if it is applicable in the initial state.
+    """
+    adders_ids: List[List[LocalID]] = [[] for _ in range(len(model.facts))]
+    for o_local_id, o in enumerate(model.operators):
+        for fact in bit_positions(o.add_effects):
+            adders_ids[fact].append(o_local_id)
+    adders: List[int] = [_bitset(ids) for ids in adders_ids]
 
+    achievers: List[Optional[int]] = []
+    for o_local_id, o in enumerate(model.operators):
+        if _relaxed_applicable(o, model.initial_state):
+            achievers.append(None)  # mark trivial applicable operators
+            continue
+        o_predecessors = predecessors[o_local_id]
+        o_achievers = 0
+        if o_predecessors:
+            for fact in bit_positions(o.pos_precons):
+                o_achievers |= o_predecessors & adders[fact]
+        achievers.append(o_achievers)
+    return achievers
 
-def _TOreachable_operators(model: Model, O: List[Operator], achievers: Dict[GlobalID, Set[GlobalID]]) -> List[Operator]:
+def _TOreachable_operators(model: Model, O: List[Operator], achievers: List[Optional[int]]) -> List[Operator]:
     """
     Get Total-Order achievers and remove those that cannot be reachable (not available).
     
     @param model: Model class
     @param O: List of available operators
-    @param achievers: Dict mapping operator global IDs to sets of global IDs of operators that can achieve it.
+    @param achievers: Achievers bitset of each operator local ID (None if trivially applicable).
     
-    NOTE: shift_offset_id maps global IDs to local IDs for indexing them into an array.
-    NOTE: Instead of checking whether an operator is in the 'achievers' set, we verify in the 'available' set.
+    NOTE: shift_offset_id maps global IDs to local IDs for indexing them into the bitsets.
     """
-    achievable_op: Set[Operator] = set()
-    available: List[int] = [0] * len(model.operators)
     shift_offset_id: int = len(model.facts)
-
-    # mark available operators in the 'available' array
+    available = 0
     for o in O:
-        available[o.global_id - shift_offset_id] = 1  # shift left operators IDs
+        available |= 1 << (o.global_id - shift_offset_id)  # shift left operators IDs
 
-    # check if each operator is applicable (achievers satisfy all operator preconditions)
+    # check if each operator is applicable (available achievers satisfy all operator preconditions)
+    achievable_op: List[Operator] = []
     for o in O:
-        achiever_state = model.initial_state
-        removed_achievers: Set[GlobalID] = set()
-        op_achievers = achievers[o.global_id]
-        
-        for a_id in op_achievers:
-            if a_id == GlobalID(-1):  # Skip trivial achievers
-                continue
-            if available[a_id - shift_offset_id] == 0:
-                removed_achievers.add(a_id)
-                continue
-            o_a = model.get_component(a_id)
-            achiever_state = o_a.relaxed_apply_bitwise(achiever_state)
-        
-        op_achievers -= removed_achievers
-        if o.applicable_bitwise(achiever_state):  # Check if the operator is achievable
-            achievable_op.add(o)
-        
-    return list(achievable_op)
-
-def _Dreachable_operators(initial_task_network: List[Union[AbstractTask, Operator]]) -> Set[Operator]:
-    def _dfs_reachable(task_node: Union[AbstractTask, Operator],
-                       R: Set[Operator],
-                       visited: Set[Union[AbstractTask, Operator]]) -> None:
-        visited.add(task_node)
-        for d in task_node.decompositions:
-            for t in d.task_network:
-                if isinstance(t, Operator):
-                    R.add(t)
-                else:
-                    if t not in visited:
-                        _dfs_reachable(t, R, visited)
-                
-    visited: Set[Union[AbstractTask, Operator]] = set()
-    tdg_reachable_operators: Set[Operator] = set()
-    
-    for t in initial_task_network:
-        if isinstance(t, Operator):
-            tdg_reachable_operators.add(t)
+        op_achievers = achievers[o.global_id - shift_offset_id]
+        if op_achievers is None:
+            achievable_op.append(o)
             continue
-        _dfs_reachable(t, tdg_reachable_operators, visited)
-    
-    return tdg_reachable_operators
+        achiever_state = model.initial_state
+        for a_local_id in bit_positions(op_achievers & available):
+            achiever_state |= model.operators[a_local_id].add_effects
+        if _relaxed_applicable(o, achiever_state):  # Check if the operator is achievable
+            achievable_op.append(o)
+    return achievable_op
+
+def _Dreachable_operators(model: Model, reachable: List[int]) -> List[Operator]:
+    """
+    Operators reachable by decomposition from the initial task network, in model order.
+    """
+    shift_offset_id: int = model.ifacts_end + 1
+    len_operators = len(model.operators)
+    r = 0
+    for t in model.initial_tn:
+        r |= _task_reachable(reachable, len_operators, t.global_id - shift_offset_id)
+    return [model.operators[o_local_id] for o_local_id in bit_positions(r)]
 
 def _Ereachable_operators(operators: List[Operator], initial_state: int) -> Tuple[List[Operator], int]:
-    reachable_operators: List[Operator] = []
-    reachable_facts: int = initial_state
-    O: Set[Operator] = set(operators)
-    
-    changed: bool = True
-    while changed:
-        changed = False
-        remove_op: Set[Operator] = set()
-        for op in O:
-            if op not in reachable_operators and op.applicable_bitwise(reachable_facts):
-                reachable_operators.append(op)
-                reachable_facts = op.relaxed_apply_bitwise(reachable_facts)
-                remove_op.add(op)
-                changed = True
-        O -= remove_op
-    
+    reachable_ids, reachable_facts = _applicable_operators(operators, initial_state)
+    reachable_operators: List[Operator] = [op for op in operators if op.global_id in reachable_ids]
     return reachable_operators, reachable_facts
 
-def _compute_achievers_set(model: Model) -> Dict[int, Set[int]]:
-    reachable: List[Set[int]] = _calculate_TO_reachable(model)
-    achievers: Dict[int, Set[int]] = _calculate_TO_achievers(model, reachable)
-    return achievers
+def _compute_achievers_set(model: Model) -> List[Optional[int]]:
+    sccs = _task_sccs(model)
+    reachable = _calculate_TO_reachable(model, sccs)
+    predecessors = _calculate_TO_predecessors(model, reachable, sccs)
+    return _calculate_TO_achievers(model, predecessors)
 
 def _bottom_up_removal(R_decompositions: List[Decomposition],
                        R_operators: List[Operator], 
@@ -247,6 +264,8 @@ def _bottom_up_removal(R_decompositions: List[Decomposition],
     @param reachable_facts: Set of facts that are currently reachable.
     """
     
+    R_task_ids: Set[GlobalID] = {o.global_id for o in R_operators}
+    R_task_ids.update(t.global_id for t in R_abstract_tasks)
     cleaned: bool = True
     while cleaned:
         cleaned = False
@@ -256,14 +275,11 @@ def _bottom_up_removal(R_decompositions: List[Decomposition],
         # Remove decompositions
         for d in R_decompositions:
             valid: bool = True
-            if not d.applicable_bitwise(reachable_facts):
+            if (reachable_facts & d.pos_precons) != d.pos_precons:
                 valid = False
             else:
                 for t in d.task_network:
-                    if isinstance(t, Operator) and t not in R_operators:
-                        valid = False
-                        break
-                    elif isinstance(t, AbstractTask) and t not in R_abstract_tasks:
+                    if t.global_id not in R_task_ids:
                         valid = False
                         break
             if valid:
@@ -277,6 +293,7 @@ def _bottom_up_removal(R_decompositions: List[Decomposition],
             if len(abt.decompositions) > 0:
                 abstract_tasks.append(abt)
             else:
+                R_task_ids.discard(abt.global_id)
                 cleaned = True
         
         R_decompositions.clear()
@@ -295,10 +312,27 @@ def TO_relax_reachability(model: Model) -> None:
     R_operators: List[Operator] = model.operators[:]
     R_decompositions: List[Decomposition] = model.decompositions[:]
     
+    start_sccs = time.time()
+    sccs = _task_sccs(model)
+    elapsed_sccs = time.time() - start_sccs
+    if FLAGS.LOG_GROUNDER:   
+        print(f'TO task hierarchy components ({len(sccs)}) after {elapsed_sccs:.2f} seconds.')
+
+    start_reachable = time.time()
+    reachable = _calculate_TO_reachable(model, sccs)
+    elapsed_reachable = time.time() - start_reachable
+    if FLAGS.LOG_GROUNDER:   
+        print(f'TO reachable operators after {elapsed_reachable:.2f} seconds.')
+
+    start_predecessors = time.time()
+    predecessors = _calculate_TO_predecessors(model, reachable, sccs)
+    elapsed_predecessors = time.time() - start_predecessors
+    if FLAGS.LOG_GROUNDER:   
+        print(f'TO predecessors after {elapsed_predecessors:.2f} seconds.')
+
     start_achievers = time.time()
-    achiever_set = _compute_achievers_set(model)
+    achiever_set = _calculate_TO_achievers(model, predecessors)
     elapsed_achievers = time.time() - start_achievers
-
     if FLAGS.LOG_GROUNDER:   
         print(f'TO achievers after {elapsed_achievers:.2f} seconds.')
     
@@ -310,7 +344,7 @@ def TO_relax_reachability(model: Model) -> None:
         
         # Measure time for _Dreachable_operators
         start_D_reachable = time.time()
-        D_Rops_set = _Dreachable_operators(model.initial_tn)  # operators reachable by decomposition space
+        D_Rops_set = _Dreachable_operators(model, reachable)  # operators reachable by decomposition space
         elapsed_D_reachable = time.time() - start_D_reachable
         if FLAGS.LOG_GROUNDER:   
             print(f'\t({i}) Decomposition reachability after {elapsed_D_reachable:.2f} seconds.')
@@ -350,7 +384,8 @@ def TO_relax_reachability(model: Model) -> None:
     
     model.decompositions = R_decompositions
     model.abstract_tasks = R_abstract_tasks
-    model.operators = R_operators
+    R_operator_ids = {o.global_id for o in R_operators}
+    model.operators = [o for o in model.operators if o.global_id in R_operator_ids]
     
     if FLAGS.LOG_GROUNDER:   
         print(f'number of abstract tasks removed {number_abt_before - len(model.abstract_tasks)} of {number_abt_before}')
@@ -1,8 +1,10 @@
+from array import array
 from enum import Enum, auto
 from collections import deque
 
 from Pytrich.PostProcessing.total_order_reachability import _compute_achievers_set
 from Pytrich.model import Operator
+from Pytrich.ProblemRepresentation.name_table import NAMES
 
 class NodeType(Enum):
     AND = auto()
@@ -18,9 +20,17 @@ class ContentType(Enum):
     RECOMPOSITION = auto()
     Nan = auto()
 
+# node and content types as stored in CompactAndOrGraph (0: no node)
+AND_NODE  = NodeType.AND.value
+OR_NODE   = NodeType.OR.value
+INIT_NODE = NodeType.INIT.value
+
 
 class AndOrNode:
-    def __init__(self, ID, LOCALID, node_type, content_type=ContentType.Nan, weight=0, str_name=''):
+    __slots__ = ('ID', 'LOCALID', 'type', 'content_type', 'successors', 'predecessors',
+                 'forced_true', 'num_forced_predecessors', 'weight', 'value', 'name_id')
+
+    def __init__(self, ID, LOCALID, node_type, content_type=ContentType.Nan, weight=0, name_id=-1):
         self.ID = ID # node's global id
         self.LOCALID = LOCALID # component's position in model
         self.type  = node_type
@@ -33,8 +43,16 @@ class AndOrNode:
         self.num_forced_predecessors = 0
         self.weight    = weight
         self.value     = 0
-        # for output
-        self.str_name = str_name
+        # for output, id of the component's name in NAMES (-1: none)
+        self.name_id = name_id
+
+    @property
+    def str_name(self):
+        if self.name_id < 0:
+            return ''
+        if self.content_type == ContentType.RECOMPOSITION:
+            return f'R-{NAMES[self.name_id]}'
+        return NAMES[self.name_id]
         
     def __str__(self):
         return F"Node ID={self.ID}:{self.str_name}"
@@ -45,8 +63,12 @@ class AndOrGraph:
     def __init__(self, model, graph_type = 0):
         self.model = model
         self.nodes = None
+        self.graph_type = graph_type
+        self._compact = None
         self.components_count = len(model.facts) + len(model.operators) + len(model.abstract_tasks) + len(model.decompositions)
         self.init_nodes = set()
+        if not model.compiled:
+            model.compile()
         if graph_type == 0:
             self.bu_initialize(model)
         elif graph_type == 1:
@@ -65,22 +87,22 @@ class AndOrGraph:
         '''
         self.nodes = [None] * self.components_count # should ignore facts
         for f_i, f in enumerate(self.model.facts):
-            fact_node = AndOrNode(f.global_id, f_i, NodeType.OR, content_type=ContentType.FACT, str_name=f_i)
+            fact_node = AndOrNode(f.global_id, f_i, NodeType.OR, content_type=ContentType.FACT, name_id=f.name_id)
             self.nodes[f.global_id]=fact_node
 
         # set abstract task
         for t_i, t in enumerate(model.abstract_tasks):
-            task_node = AndOrNode(t.global_id, t_i, NodeType.OR, content_type=ContentType.ABSTRACT_TASK, str_name=t.name)
+            task_node = AndOrNode(t.global_id, t_i, NodeType.OR, content_type=ContentType.ABSTRACT_TASK, name_id=t.name_id)
             self.nodes[t.global_id]=task_node
             
         # set primitive tasks -operators
         for op_i, op in enumerate(model.operators):
-            operator_node = AndOrNode(op.global_id, op_i, NodeType.AND, content_type=ContentType.OPERATOR, weight=op.cost, str_name=op.name)
+            operator_node = AndOrNode(op.global_id, op_i, NodeType.AND, content_type=ContentType.OPERATOR, weight=op.cost, name_id=op.name_id)
             self.nodes[op.global_id] = operator_node
             
         # set methods
         for d_i, d in enumerate(model.decompositions):
-            decomposition_node = AndOrNode(d.global_id, d_i, NodeType.AND, content_type=ContentType.METHOD, str_name=d.name)
+            decomposition_node = AndOrNode(d.global_id, d_i, NodeType.AND, content_type=ContentType.METHOD, name_id=d.name_id)
             self.nodes[d.global_id] = decomposition_node
             task_head_id = d.compound_task.global_id
             self.add_edge(decomposition_node, self.nodes[task_head_id])
@@ -98,7 +120,7 @@ class AndOrGraph:
         self.nodes = [None] * self.components_count
         # set facts
         for fact in self.model.facts:
-            fact_node = AndOrNode(fact.local_id, fact.local_id, NodeType.OR, content_type=ContentType.FACT, str_name=fact.name)
+            fact_node = AndOrNode(fact.local_id, fact.local_id, NodeType.OR, content_type=ContentType.FACT, name_id=fact.name_id)
             self.nodes[fact.local_id]  = fact_node
             if model.initial_state & (1 << fact.local_id):
                 fact_node.type = NodeType.INIT
@@ -106,35 +128,32 @@ class AndOrGraph:
         
         # set abstract task
         for t_i, t in enumerate(model.abstract_tasks):
-            task_node = AndOrNode(t.global_id, t_i, NodeType.OR, content_type=ContentType.ABSTRACT_TASK, str_name=t.name)
+            task_node = AndOrNode(t.global_id, t_i, NodeType.OR, content_type=ContentType.ABSTRACT_TASK, name_id=t.name_id)
             self.nodes[t.global_id]=task_node
             
         # set primitive tasks -operators
         for op_i, op in enumerate(model.operators):
-            operator_node = AndOrNode(op.global_id, op_i, NodeType.AND, content_type=ContentType.OPERATOR, str_name=op.name)
+            operator_node = AndOrNode(op.global_id, op_i, NodeType.AND, content_type=ContentType.OPERATOR, name_id=op.name_id)
             self.nodes[op.global_id] = operator_node
-            for fact_pos in range(max(op.pos_precons.bit_length(), op.add_effects.bit_length())):
-                if op.pos_precons & (1 << fact_pos):
-                    var_node:AndOrNode = self.nodes[fact_pos]
-                    self.add_edge(var_node, operator_node)
-                if op.add_effects & (1 << fact_pos):
-                    var_node:AndOrNode = self.nodes[fact_pos]
-                    self.add_edge(operator_node, var_node)
+            for fact_pos in op.pre_idx:
+                var_node:AndOrNode = self.nodes[fact_pos]
+                self.add_edge(var_node, operator_node)
+            for fact_pos in op.add_idx:
+                var_node:AndOrNode = self.nodes[fact_pos]
+                self.add_edge(operator_node, var_node)
                     
         # set methods
         for d_i, d in enumerate(model.decompositions):
-            decomposition_node = AndOrNode(d.global_id, d_i, NodeType.AND, content_type=ContentType.METHOD, str_name=d.name)
+            decomposition_node = AndOrNode(d.global_id, d_i, NodeType.AND, content_type=ContentType.METHOD, name_id=d.name_id)
             self.nodes[d.global_id] = decomposition_node
             task_head_id = d.compound_task.global_id
             self.add_edge(decomposition_node, self.nodes[task_head_id])
             for subt in d.task_network:
                 subt_node:AndOrNode = self.nodes[subt.global_id]
                 self.add_edge(subt_node, decomposition_node)
-                # NOTE: removing it for know, since we are using panda grounding
-                # for fact_pos in range(facts_count): 
-                #     if d.pos_precons & (1 << fact_pos):
-                #         fact_node = self.nodes[fact_pos]
-                #         self.add_edge(fact_node, decomposition_node)
+            # method preconditions (pandaPI puts them in actions, unless lifted or pulled up)
+            for fact_pos in d.pre_idx:
+                self.add_edge(self.nodes[fact_pos], decomposition_node)
 
     def td_initialize(self, model):
         '''
@@ -147,34 +166,33 @@ class AndOrGraph:
         self.nodes = [None] * (self.components_count + len(model.operators))
         # set facts
         for fact in self.model.facts:
-            fact_node = AndOrNode(fact.local_id, fact.local_id, NodeType.OR, content_type=ContentType.FACT, str_name=fact.name)
+            fact_node = AndOrNode(fact.local_id, fact.local_id, NodeType.OR, content_type=ContentType.FACT, name_id=fact.name_id)
             self.nodes[fact.local_id]  = fact_node
             if model.initial_state & (1 << fact.local_id):
                 fact_node.type = NodeType.INIT
         # set abstract task
         for t_i, t in enumerate(model.abstract_tasks):
-            task_node = AndOrNode(t.global_id, t_i, NodeType.OR, content_type=ContentType.ABSTRACT_TASK, str_name=t.name)
+            task_node = AndOrNode(t.global_id, t_i, NodeType.OR, content_type=ContentType.ABSTRACT_TASK, name_id=t.name_id)
             self.nodes[t.global_id]=task_node
         # NOTE: Recomposition Graph defines tnI as INIT node
         for task in model.initial_tn:
             self.nodes[task.global_id].type= NodeType.INIT
         # set primitive tasks -operators
         for op_i, op in enumerate(model.operators):
-            operator_node = AndOrNode(op.global_id, op_i, NodeType.AND, content_type=ContentType.OPERATOR, str_name=op.name)
-            recomposition_node = AndOrNode(self.components_count + op_i, op_i, NodeType.OR, content_type=ContentType.RECOMPOSITION, str_name=f'R-{op.name}')
+            operator_node = AndOrNode(op.global_id, op_i, NodeType.AND, content_type=ContentType.OPERATOR, name_id=op.name_id)
+            recomposition_node = AndOrNode(self.components_count + op_i, op_i, NodeType.OR, content_type=ContentType.RECOMPOSITION, name_id=op.name_id)
             self.nodes[operator_node.ID] = operator_node
             self.nodes[recomposition_node.ID] = recomposition_node
             self.add_edge(recomposition_node, operator_node)
-            for fact_pos in range(max(op.pos_precons.bit_length(), op.add_effects.bit_length())):
-                if op.pos_precons & (1 << fact_pos):
-                    var_node = self.nodes[fact_pos]
-                    self.add_edge(var_node, operator_node)
-                if op.add_effects & (1 << fact_pos):
-                    var_node = self.nodes[fact_pos]
-                    self.add_edge(operator_node, var_node)
+            for fact_pos in op.pre_idx:
+                var_node = self.nodes[fact_pos]
+                self.add_edge(var_node, operator_node)
+            for fact_pos in op.add_idx:
+                var_node = self.nodes[fact_pos]
+                self.add_edge(operator_node, var_node)
         # set methods
         for d_i, d in enumerate(model.decompositions):
-            decomposition_node = AndOrNode(d.global_id, d_i, NodeType.AND, content_type=ContentType.METHOD, str_name=d.name)
+            decomposition_node = AndOrNode(d.global_id, d_i, NodeType.AND, content_type=ContentType.METHOD, name_id=d.name_id)
             self.nodes[d.global_id] = decomposition_node
             task_head_id = d.compound_task.global_id
             self.add_edge(self.nodes[task_head_id], decomposition_node)
@@ -186,11 +204,8 @@ class AndOrGraph:
                     self.add_edge(decomposition_node, rec_node) # if operator, connect decomposition to recomposition node
                 else:
                     self.add_edge(decomposition_node, subt_node)
-                
-                # for fact_pos in range(facts_count):
-                #     if d.pos_precons_bitwise & (1 << fact_pos):
-                #         fact_node = self.nodes[fact_pos]
-                #         self.add_edge(fact_node, decomposition_node)
+            for fact_pos in d.pre_idx:
+                self.add_edge(self.nodes[fact_pos], decomposition_node)
 
     # Relaxed Composition Graph (required to compute hmax and lmcut in DOF+TI HTN planning)
     def rc_initialize(self, model):
@@ -210,7 +225,7 @@ class AndOrGraph:
                 f.local_id, f.local_id,
                 NodeType.OR,
                 content_type=ContentType.FACT,
-                str_name=f.name
+                name_id=f.name_id
             )
             self.nodes[f.local_id] = fact_node
             if model.initial_state & (1 << f.local_id):
@@ -222,7 +237,7 @@ class AndOrGraph:
                 at.global_id, abti,
                 NodeType.OR,
                 content_type=ContentType.ABSTRACT_TASK,
-                str_name=at.name
+                name_id=at.name_id
             )
             self.nodes[at.global_id] = tnode
 
@@ -235,7 +250,7 @@ class AndOrGraph:
                 NodeType.AND,
                 content_type=ContentType.OPERATOR,
                 weight=op.cost,
-                str_name=op.name
+                name_id=op.name_id
             )
             self.nodes[op.global_id] = onode
 
@@ -245,22 +260,20 @@ class AndOrGraph:
                 cnid, oi,
                 NodeType.OR,
                 content_type=ContentType.RECOMPOSITION,
-                str_name=f'R-{op.name}'
+                name_id=op.name_id
             )
             self.nodes[cnid] = cnode
             self.add_edge(onode, cnode)
 
-            if op.pos_precons.bit_length() == 0:
+            if not op.pre_idx:
                 onode.type = NodeType.INIT
 
-            max_bit = max(op.pos_precons.bit_length(), op.add_effects.bit_length())
-            for fact_pos in range(max_bit):
-                if op.pos_precons & (1 << fact_pos):
-                    var_node = self.nodes[fact_pos]
-                    self.add_edge(var_node, onode)  # fact -> operator
-                if op.add_effects & (1 << fact_pos):
-                    var_node = self.nodes[fact_pos]
-                    self.add_edge(onode, var_node)  # operator -> fact
+            for fact_pos in op.pre_idx:
+                var_node = self.nodes[fact_pos]
+                self.add_edge(var_node, onode)  # fact -> operator
+            for fact_pos in op.add_idx:
+                var_node = self.nodes[fact_pos]
+                self.add_edge(onode, var_node)  # operator -> fact
 
         # set methods
         for d_i, d in enumerate(model.decompositions):
@@ -269,7 +282,7 @@ class AndOrGraph:
                 NodeType.AND,
                 weight=1,
                 content_type=ContentType.METHOD,
-                str_name=d.name
+                name_id=d.name_id
             )
             self.nodes[d.global_id] = dnode
 
@@ -287,6 +300,8 @@ class AndOrGraph:
                 else:
                     # if abstract subtask, connect directly
                     self.add_edge(subtnode, dnode)
+            for fact_pos in d.pre_idx:
+                self.add_edge(self.nodes[fact_pos], dnode)  # fact -> method
         
     def to_initialize(self, model):
         pass
@@ -318,7 +333,16 @@ class AndOrGraph:
         #             to_no.predecessors.append(p)
         #             self.add_edge(p, to_no)
 
+    def compact(self):
+        """
+        Array form of the graph (see CompactAndOrGraph), built once.
+        """
+        if self._compact is None:
+            self._compact = CompactAndOrGraph(self)
+        return self._compact
+
     def update_bu_graph(self, state):
+        self._compact = None
         for fact in self.model.facts:
             fact_ao_node = self.nodes[fact.global_id]
             if fact_ao_node.type==NodeType.INIT and ~state & (1 << fact.global_id):
@@ -333,4 +357,92 @@ class AndOrGraph:
     def remove_edge(self, nodeA, nodeB):
         nodeA.successors.remove(nodeB)
         nodeB.predecessors.remove(nodeA)
+
+class CompactAndOrGraph:
+    """
+    AND/OR graph as arrays indexed by node ID, instead of one AndOrNode object per node:
+        node_type[n], content_type[n]: NodeType/ContentType values (0 if there is no node n)
+        weight[n], local_id[n]
+        predecessors of n: pred[pred_start[n]:pred_start[n+1]] (CSR, same for succ/succ_start)
+    """
+    __slots__ = ('n_nodes', 'components_count', 'node_type', 'content_type', 'weight', 'local_id',
+                 'pred_start', 'pred', 'succ_start', 'succ')
+
+    def __init__(self, and_or_graph):
+        nodes = and_or_graph.nodes
+        n_nodes = len(nodes)
+        self.n_nodes = n_nodes
+        self.components_count = and_or_graph.components_count
+        type_code = {t: t.value for t in NodeType}
+        content_code = {c: c.value for c in ContentType}
+        node_type    = bytearray(n_nodes)
+        content_type = bytearray(n_nodes)
+        weight       = [0] * n_nodes
+        local_id     = [0] * n_nodes
+        pred_start   = [0] * (n_nodes + 1)
+        succ_start   = [0] * (n_nodes + 1)
+        pred = []
+        succ = []
+        for n_id, node in enumerate(nodes):
+            if node is not None:
+                node_type[n_id] = type_code[node.type]
+                content_type[n_id] = content_code[node.content_type]
+                weight[n_id] = node.weight
+                local_id[n_id] = node.LOCALID
+                pred += [p.ID for p in node.predecessors]
+                succ += [s.ID for s in node.successors]
+            pred_start[n_id + 1] = len(pred)
+            succ_start[n_id + 1] = len(succ)
+        self.node_type    = node_type
+        self.content_type = content_type
+        self.weight       = array('q', weight)
+        self.local_id     = array('l', local_id)
+        self.pred_start   = array('l', pred_start)
+        self.succ_start   = array('l', succ_start)
+        self.pred = array('l', pred)
+        self.succ = array('l', succ)
+
+    def __len__(self):
+        return self.n_nodes
+
+    def predecessors(self, n_id):
+        return self.pred[self.pred_start[n_id]:self.pred_start[n_id + 1]]
+
+    def successors(self, n_id):
+        return self.succ[self.succ_start[n_id]:self.succ_start[n_id + 1]]
+
+    def memory(self):
+        """Approximate size in bytes of the arrays."""
+        return sum(len(a) * a.itemsize for a in (self.weight, self.local_id, self.pred_start,
+                                                  self.pred, self.succ_start, self.succ)) \
+            + len(self.node_type) + len(self.content_type)
+
+class AndOrGraphCache:
+    """
+    AND/OR graphs of a model, one per graph type, built on first request.
+    Graphs are shared between heuristics and must not be modified (keep values in separate arrays).
+    release() drops the cache once heuristics are initialized: graphs still used
+    during search stay alive through the heuristics holding them, the others are freed.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.graphs = {}
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, graph_type):
+        graph = self.graphs.get(graph_type)
+        if graph is None:
+            graph = AndOrGraph(self.model, graph_type=graph_type)
+            self.graphs[graph_type] = graph
+            self.builds += 1
+        else:
+            self.hits += 1
+        return graph
+
+    def compact(self, graph_type):
+        return self.get(graph_type).compact()
+
+    def release(self):
+        self.graphs = {}
     
\ No newline at end of file
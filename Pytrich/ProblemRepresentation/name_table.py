@@ -0,0 +1,73 @@
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, Union
+
+class NameTable:
+    """
+    Append only table of the names of the model components, so they only keep an integer id
+    and names are decoded on demand (output, plan printing, cache writing).
+    Names are stored encoded in segments: a blob with the offsets of its names.
+    Added names go to a growing bytearray segment, add_blob registers a read only blob
+    (e.g. a slice of a memory mapped model cache file) without copying it.
+    """
+    def __init__(self):
+        self._starts = array('Q') # id of the first name of each segment
+        self._blobs = []
+        self._offsets = [] # per segment, offset of each name and the end of the last one
+        self._writable = False # the last segment is a bytearray names can be appended to
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the name bytes and offsets."""
+        return sum(len(blob) + offsets.itemsize * len(offsets) for blob, offsets in zip(self._blobs, self._offsets))
+
+    def add(self, name: Union[str, bytes]) -> int:
+        """Append a name (str, or utf-8 bytes e.g. straight from the SAS file), returns its id."""
+        if isinstance(name, str):
+            name = name.encode()
+        if not self._writable:
+            self._new_segment(bytearray(), array('Q', [0]))
+            self._writable = True
+        blob = self._blobs[-1]
+        blob += name
+        self._offsets[-1].append(len(blob))
+        self._count += 1
+        return self._count - 1
+
+    def add_blob(self, blob, lengths: Iterable[int]) -> int:
+        """
+        Register the concatenated utf-8 names of a bytes like blob, given their lengths,
+        returns the id of the first one (the others follow).
+        """
+        offsets = array('Q', [0])
+        offsets.extend(accumulate(lengths))
+        first_id = self._count
+        self._new_segment(blob, offsets)
+        self._writable = False
+        self._count += len(offsets) - 1
+        return first_id
+
+    def _new_segment(self, blob, offsets):
+        self._starts.append(self._count)
+        self._blobs.append(blob)
+        self._offsets.append(offsets)
+
+    def raw(self, name_id: int):
+        """Encoded name, as a slice of its segment's blob."""
+        if not 0 <= name_id < self._count:
+            raise IndexError(f'name id {name_id} out of range')
+        segment = bisect_right(self._starts, name_id) - 1
+        i = name_id - self._starts[segment]
+        offsets = self._offsets[segment]
+        return self._blobs[segment][offsets[i]:offsets[i + 1]]
+
+    def __getitem__(self, name_id: int) -> str:
+        return str(self.raw(name_id), 'utf-8')
+
+# names of all the model components (see Fact, Operator, AbstractTask and Decomposition)
+NAMES = NameTable()
@@ -0,0 +1,94 @@
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+from Pytrich.model import bit_positions
+
+class StateCodec:
+    """
+    Packed state encoding over the mutex groups (SAS+ variables) of the grounded model.
+    Each group of k facts becomes a field of k.bit_length() bits holding 0 (none of its facts)
+    or 1 + the position of its true fact; facts outside the groups get a 1 bit field each.
+
+    Relies on the groups being invariants (at most one of their facts holds in every
+    reachable state), as pandaPI's mutex groups are.
+    Conditions are (mask, value) pairs: a packed state satisfies them if state & mask == value.
+    """
+    def __init__(self, fact_count: int, mutex_groups: Sequence[Sequence[int]]):
+        self.fact_count = fact_count
+        self.var_facts: List[Tuple[int, ...]] = []
+        self.var_offset: List[int] = []
+        self.var_mask: List[int] = []
+        self.fact_var: List[int] = [-1] * fact_count
+        self.fact_field: List[int] = [0] * fact_count
+
+        variables = []
+        for group in mutex_groups:
+            facts = tuple(f for f in group if self.fact_var[f] == -1) # overlapping groups: first one wins
+            for f in facts:
+                self.fact_var[f] = len(variables)
+            if facts:
+                variables.append(facts)
+        for f in range(fact_count):
+            if self.fact_var[f] == -1:
+                self.fact_var[f] = len(variables)
+                variables.append((f,))
+
+        offset = 0
+        for facts in variables:
+            width = len(facts).bit_length()
+            self.var_facts.append(facts)
+            self.var_offset.append(offset)
+            self.var_mask.append(((1 << width) - 1) << offset)
+            for code, f in enumerate(facts, start=1):
+                self.fact_field[f] = code << offset
+            offset += width
+        self.bits = offset
+        self.unpack = lru_cache(maxsize=16)(self._unpack)
+
+    def pack(self, state: int) -> int:
+        packed = 0
+        for f in bit_positions(state):
+            packed |= self.fact_field[f]
+        return packed
+
+    def _unpack(self, packed: int) -> int:
+        """Fact bitset of a packed state (cached, heuristics decode the same few states repeatedly)."""
+        state = 0
+        for var, facts in enumerate(self.var_facts):
+            code = (packed & self.var_mask[var]) >> self.var_offset[var]
+            if code:
+                state |= 1 << facts[code - 1]
+        return state
+
+    def condition(self, facts: int) -> Tuple[int, int]:
+        """
+        (mask, value) of the packed states holding all the facts.
+        Two facts of the same variable can never hold together, that gives (0, -1), which no state matches.
+        """
+        mask = 0
+        value = 0
+        for f in bit_positions(facts):
+            var_mask = self.var_mask[self.fact_var[f]]
+            if mask & var_mask:
+                return 0, -1
+            mask |= var_mask
+            value |= self.fact_field[f]
+        return mask, value
+
+    def literals(self, facts: int) -> Tuple[Tuple[int, int], ...]:
+        """(mask, value) of each fact, e.g. to check negative preconditions one by one."""
+        return tuple((self.var_mask[self.fact_var[f]], self.fact_field[f]) for f in bit_positions(facts))
+
+    def effect(self, add_effects: int, del_effects: int) -> Tuple[int, int, Tuple[Tuple[int, int], ...]]:
+        """
+        Packed (add_mask, add_value, deletes) of an operator: variables with an add effect are overwritten,
+        deleted facts of the other variables are cleared only if they hold (deletes are (mask, value) pairs).
+        """
+        add_mask = 0
+        add_value = 0
+        for f in bit_positions(add_effects):
+            var_mask = self.var_mask[self.fact_var[f]]
+            add_mask |= var_mask
+            add_value = (add_value & ~var_mask) | self.fact_field[f]
+        deletes = tuple((mask, value) for mask, value in self.literals(del_effects) if not mask & add_mask)
+        return add_mask, add_value, deletes
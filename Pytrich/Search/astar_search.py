@@ -9,7 +9,7 @@ from Pytrich.DESCRIPTIONS import Descriptions
 from Pytrich.Heuristics.blind_heuristic import BlindHeuristic
 from Pytrich.Heuristics.heuristic import Heuristic
 from Pytrich.Heuristics.lmcount_heuristic import LandmarkCountHeuristic
-from Pytrich.Search.htn_node import AstarNode, GreedyNode, HTNNode
+from Pytrich.Search.htn_node import AstarNode, GreedyNode, HTNNode, packed_node_type
 from Pytrich.model import Operator, AbstractTask, Model
 import Pytrich.FLAGS as FLAGS
 
@@ -18,9 +18,16 @@ def search(
         heuristic: Type[BlindHeuristic] = BlindHeuristic,
         node_type: Type[AstarNode] = AstarNode,
         n_params: Optional[Dict] = None,
-        use_early=False
+        use_early=False,
+        use_packed=False
 
     ) -> None:
+    """
+    Options:
+        use_early: goal test when nodes are generated
+        use_packed: nodes keep packed states over the mutex groups (see StateCodec),
+                    heuristics still see fact bitsets
+    """
     print('Staring solver')
     start_time   = time.time()
     control_time = start_time
@@ -30,15 +37,25 @@ def search(
     seq_num        = 0
     
     closed_list = {}
+    initial_state = model.initial_state
+    goal_reached = model.goal_reached
+    if use_packed:
+        codec = model.state_codec()
+        node_type = packed_node_type(node_type, codec)
+        initial_state = codec.pack(model.initial_state)
+        goal_reached = model.goal_reached_packed
+        desc = Descriptions()
+        print(desc('packed_state_bits', f'{codec.bits} ({len(model.facts)} facts)'))
     node= None
     node = node_type(None, None, None,
-                     model.initial_state,
+                     initial_state,
                      model.initial_tn,
                      seq_num,
                      **n_params)
     
     print(node.__output__())
     node.update_g_h(0, heuristic.initialize(model, node))
+    model.graphs.release()
     print(heuristic.__output__())
     pq = []
     
@@ -80,7 +97,8 @@ def search(
                     STATUS = 'TIMEOUT'
                     break
                 
-        if model.goal_reached(node.state, node.task_network):
+        state = node.packed_state if use_packed else node.state
+        if goal_reached(state, node.task_network):
             STATUS = 'GOAL'
             psutil.cpu_percent()
             memory_usage = psutil.virtual_memory().percent
@@ -92,15 +110,20 @@ def search(
         # check if task is primitive
         if isinstance(task, Operator):
             #print(f'o', end= '  ')
-            if not task.applicable(node.state):
-                continue
+            if use_packed:
+                if not task.applicable_packed(state):
+                    continue
+                new_state    = task.apply_packed(state)
+            else:
+                if not task.applicable(state):
+                    continue
+                new_state    = task.apply(state)
             
             seq_num += 1
-            new_state        = task.apply(node.state)
             new_task_network = node.task_network[1:]
             new_node         = node_type(node, task, None, new_state, new_task_network, seq_num)
 
-            if use_early and model.goal_reached(new_node.state, new_node.task_network):
+            if use_early and goal_reached(new_state, new_task_network):
                 STATUS = 'GOAL'
                 psutil.cpu_percent()
                 memory_usage = psutil.virtual_memory().percent
@@ -117,12 +140,12 @@ def search(
         # otherwise its abstract
         else:
             for method in task.decompositions:
-                if not method.applicable(node.state):
+                if not (method.applicable_packed(state) if use_packed else method.applicable(state)):
                     continue
                 seq_num += 1
                 refined_task_network  = method.task_network+node.task_network[1:]
-                new_node          = node_type(node, task, method, node.state, refined_task_network, seq_num)
-                if use_early and model.goal_reached(new_node.state, new_node.task_network):
+                new_node          = node_type(node, task, method, state, refined_task_network, seq_num)
+                if use_early and goal_reached(state, refined_task_network):
                     STATUS = 'GOAL'
                     psutil.cpu_percent()
                     memory_usage = psutil.virtual_memory().percent
@@ -153,3 +176,7 @@ def search(
               f"{desc('fringe_size', len(pq))}\n"
               f"Revisits Avoided: {count_revisits}\n"
               f"Used Memory: {memory_usage}%")
+        if hasattr(heuristic, 'memory'):
+            print(desc('heuristic_memory', heuristic.memory() / 1024))
+        if hasattr(heuristic, 'statistics'):
+            print(heuristic.statistics())
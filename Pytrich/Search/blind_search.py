@@ -9,7 +9,7 @@ from Pytrich.Heuristics.blind_heuristic import BlindHeuristic
 from Pytrich.Heuristics.heuristic import Heuristic
 from Pytrich.Heuristics.novelty_heuristic import NoveltyHeuristic
 from Pytrich.model import Operator, AbstractTask, Model, Fact, Decomposition
-from Pytrich.Search.htn_node import HTNNode
+from Pytrich.Search.htn_node import HTNNode, packed_node_type
 from Pytrich.tools import parse_search_params
 import Pytrich.FLAGS as FLAGS
 
@@ -19,8 +19,13 @@ def search(
         node_type: Type[HTNNode] = HTNNode,
         heuristic: Heuristic = None,
         n_params: Optional[Dict] = None,
-        use_novelty=False
+        use_novelty=False,
+        use_packed=False
     ):
+    """
+    Options:
+        use_packed: nodes keep packed states over the mutex groups (see StateCodec)
+    """
     print('Starting blind search')
     start_time = time.time()
     control_time = start_time
@@ -30,7 +35,15 @@ def search(
     seq_num = 0
 
     closed_list = set()
-    node = node_type(None, None, None, model.initial_state, model.initial_tn, seq_num, 0)
+    initial_state = model.initial_state
+    goal_reached = model.goal_reached
+    if use_packed:
+        codec = model.state_codec()
+        node_type = packed_node_type(node_type, codec)
+        initial_state = codec.pack(model.initial_state)
+        goal_reached = model.goal_reached_packed
+        print(Descriptions()('packed_state_bits', f'{codec.bits} ({len(model.facts)} facts)'))
+    node = node_type(None, None, None, initial_state, model.initial_tn, seq_num, 0)
     
     novelty=None
     if use_novelty:
@@ -81,7 +94,8 @@ def search(
         closed_list.add(hash(node))
 
         # Check if the current node is the goal
-        if model.goal_reached(node.state, node.task_network):
+        state = node.packed_state if use_packed else node.state
+        if goal_reached(state, node.task_network):
             STATUS = 'GOAL'
             current_time = time.time()
             elapsed_time = current_time - start_time
@@ -92,16 +106,21 @@ def search(
         task = node.task_network[0]
         # Check if task is primitive
         if isinstance(task, Operator):
-            if not task.applicable(node.state):
-                continue
+            if use_packed:
+                if not task.applicable_packed(state):
+                    continue
+                new_state = task.apply_packed(state)
+            else:
+                if not task.applicable(state):
+                    continue
+                new_state = task.apply(state)
 
             seq_num += 1
-            new_state = task.apply(node.state)
             new_task_network = node.task_network[1:]
             new_node = node_type(node, task, None, new_state, new_task_network, seq_num, node.g_value + 1)
 
             # Eager goal detection
-            if model.goal_reached(new_node.state, new_node.task_network):
+            if goal_reached(new_state, new_task_network):
                 node = new_node  # Update node to the goal node
                 STATUS = 'GOAL'
                 current_time = time.time()
@@ -119,14 +138,14 @@ def search(
         # Otherwise, it's abstract
         else:
             for method in task.decompositions:
-                if not method.applicable(node.state):
+                if not (method.applicable_packed(state) if use_packed else method.applicable(state)):
                     continue
                 seq_num += 1
                 refined_task_network = method.task_network + node.task_network[1:]
-                new_node = node_type(node, task, method, node.state, refined_task_network, seq_num, node.g_value)
+                new_node = node_type(node, task, method, state, refined_task_network, seq_num, node.g_value)
 
                 # Eager goal detection
-                if model.goal_reached(new_node.state, new_node.task_network):
+                if goal_reached(state, refined_task_network):
                     node = new_node  # Update node to the goal node
                     STATUS = 'GOAL'
                     current_time = time.time()
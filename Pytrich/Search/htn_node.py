@@ -30,8 +30,9 @@ class HTNNode:
             HTNNode.H = H
         # Heursitics info
         self.lm_node = None # for landmarks
+        self.tn_values = {} # task network heuristics: incremental values keyed by heuristic, h-values by heuristic.value_key, component values by aggregation
         # NOTE: only use if we search considering visited nodes -high computational cost
-        self.hash_node = hash((self.state, tuple(task_network)))
+        self.hash_node = hash((state, tuple(task_network)))
 
         
     def update_g_h(self, g_value, h_value):
@@ -42,17 +43,24 @@ class HTNNode:
         """
         Returns the list of actions that were applied from the initial node to
         the goal node.
+        Flattened decompositions (see flatten_hierarchy) are reported as the
+        original tasks and decompositions they stand for.
         """
         plan_path = []
         goal_dist = []
         operators = []
         while self.parent is not None:
             goal_dist.append(self.task)
-            plan_path.append(self.task)
-            if isinstance(self.task, Operator) and self.task.cost!=0:
-                operators.append(self.task)
+            if self.decomposition is not None and self.decomposition.source:
+                for task, decomposition in reversed(self.decomposition.source):
+                    plan_path.append(task)
+                    plan_path.append(decomposition)
             else:
-                plan_path.append(self.decomposition)
+                plan_path.append(self.task)
+                if isinstance(self.task, Operator) and self.task.cost!=0:
+                    operators.append(self.task)
+                else:
+                    plan_path.append(self.decomposition)
 
             self = self.parent
         plan_path.reverse()
@@ -119,4 +127,31 @@ class TiebreakingNode(HTNNode):
                 other.seq_num)
 
 
-    
\ No newline at end of file
+    
+
+
+class PackedStateNode:
+    """
+    Node mixin keeping the packed state (see StateCodec) instead of the fact bitset:
+    the search works on packed_state, state decodes it for the heuristics.
+    """
+    codec = None
+
+    @property
+    def state(self):
+        return self.codec.unpack(self.packed_state)
+
+    @state.setter
+    def state(self, state_packed):
+        self.packed_state = state_packed
+
+    def __hash__(self):
+        return self.hash_node
+
+    def __eq__(self, other):
+        return self.packed_state == other.packed_state and self.task_network == other.task_network
+
+
+def packed_node_type(node_type, codec):
+    """Subclass of node_type holding packed states of codec."""
+    return type(f'Packed{node_type.__name__}', (PackedStateNode, node_type), {'codec': codec})
@@ -1,22 +1,39 @@
 import sys
-from typing import List, Union
+from typing import List, Tuple, Union
 
 from Pytrich.DESCRIPTIONS import Descriptions
+from Pytrich.ProblemRepresentation.name_table import NAMES
+
+def bit_positions(bits):
+    """
+    Positions of the set bits of an int bitset, in increasing order.
+    Only visits the set bits (instead of testing every position up to bits.bit_length()).
+    """
+    positions = []
+    while bits:
+        low_bit = bits & -bits
+        positions.append(low_bit.bit_length() - 1)
+        bits ^= low_bit
+    return tuple(positions)
+
+# Components keep the id of their name in NAMES (the name can also be given as such an id),
+# compared and hashed by it: names are only decoded for output.
 
 class Fact:
     def __init__(self, name, local_id, global_id):
-        self.name = name
-        self.hash_name = hash(name)
+        self.name_id:int = name if isinstance(name, int) else NAMES.add(name)
         self.global_id:int = global_id
         self.local_id:int  = local_id
     
+    @property
+    def name(self) -> str:
+        return NAMES[self.name_id]
+
     def __eq__(self, other):
-        return (
-            self.name == other.name
-        )
+        return self.name_id == other.name_id
 
     def __hash__(self):
-        return  self.hash_name
+        return self.name_id
 
     def __str__(self):
         return f"F({self.name} ({self.global_id}))"
@@ -26,8 +43,7 @@ class Fact:
 
 class Operator:
     def __init__(self, global_id, local_id, name, cost, pos_precons, neg_precons, add_effects, del_effects):
-        self.name = name
-        self.hash_name = hash(name)
+        self.name_id:int = name if isinstance(name, int) else NAMES.add(name)
         self.global_id:int = global_id
         self.local_id:int  = local_id
 
@@ -36,7 +52,28 @@ class Operator:
         self.neg_precons:int = neg_precons
         self.del_effects:int = del_effects
         self.add_effects:int = add_effects
-        
+
+        # fact indexes of the bitsets, set by compile()
+        self.pre_idx = None
+        self.add_idx = None
+        self.del_idx = None
+
+        # packed state conditions and effects, set by compile_packed()
+        self.packed_pre = None
+        self.packed_neg = None
+        self.packed_add_mask = None
+        self.packed_add_value = None
+        self.packed_del = None
+
+    def compile(self):
+        self.pre_idx = bit_positions(self.pos_precons)
+        self.add_idx = bit_positions(self.add_effects)
+        self.del_idx = bit_positions(self.del_effects)
+
+    def compile_packed(self, codec):
+        self.packed_pre = codec.condition(self.pos_precons)
+        self.packed_neg = codec.literals(self.neg_precons)
+        self.packed_add_mask, self.packed_add_value, self.packed_del = codec.effect(self.add_effects, self.del_effects)
 
     def applicable(self, state_bitwise):
         return ((state_bitwise & self.pos_precons) == self.pos_precons) and \
@@ -44,35 +81,41 @@ class Operator:
     
     def apply(self, state_bitwise):
         return (state_bitwise & ~self.del_effects) | self.add_effects
+
+    def applicable_packed(self, state_packed):
+        mask, value = self.packed_pre
+        if (state_packed & mask) != value:
+            return False
+        for mask, value in self.packed_neg:
+            if (state_packed & mask) == value:
+                return False
+        return True
+
+    def apply_packed(self, state_packed):
+        state_packed = (state_packed & ~self.packed_add_mask) | self.packed_add_value
+        for mask, value in self.packed_del:
+            if (state_packed & mask) == value:
+                state_packed &= ~mask
+        return state_packed
     
     def relaxed_apply(self, state_bitwise):
         return state_bitwise | self.add_effects
         
     def get_add_effects(self):
-        bitwise_value = self.add_effects
-        i = 0
-        while bitwise_value:
-            if bitwise_value & 1:
-                yield i
-            bitwise_value >>= 1
-            i += 1
+        return self.add_idx if self.add_idx is not None else bit_positions(self.add_effects)
 
     def get_precons(self):
-        bitwise_value = self.pos_precons
-        i = 0
-        while bitwise_value:
-            if bitwise_value & 1:
-                yield i
-            bitwise_value >>= 1
-            i += 1
+        return self.pre_idx if self.pre_idx is not None else bit_positions(self.pos_precons)
+
+    @property
+    def name(self) -> str:
+        return NAMES[self.name_id]
 
     def __eq__(self, other):
-        return (
-            self.name == other.name
-        )
+        return self.name_id == other.name_id
 
     def __hash__(self):
-        return  self.hash_name
+        return self.name_id
 
     def __str__(self):
         return f"OP({self.name} {bin(self.pos_precons)} {bin(self.neg_precons)})"
@@ -82,26 +125,28 @@ class Operator:
 
 class AbstractTask:
     def __init__(self, global_id, local_id, decompositions, name):
-        self.name = name
-        self.hash_name = hash(name)
+        self.name_id:int = name if isinstance(name, int) else NAMES.add(name)
         self.decompositions: List[Decomposition] = decompositions
         self.global_id:int = global_id
         self.local_id:int  = local_id
         
+    @property
+    def name(self) -> str:
+        return NAMES[self.name_id]
+
     def __eq__(self, other):
-        return self.name == other.name
+        return self.name_id == other.name_id
     
     def __str__(self):
         return f'GT({self.name} arity {len(self.decompositions)})'
     def __repr__(self):
         return f'<Gt %s>' % self.name
     def __hash__(self):
-        return hash(self.hash_name)
+        return self.name_id
 
 class Decomposition:
     def __init__(self, name, global_id, local_id, pos_precons, neg_precons, compound_task, task_network):
-        self.name = name
-        self.hash_name = hash(name)
+        self.name_id:int = name if isinstance(name, int) else NAMES.add(name)
         self.global_id:int = global_id
         self.local_id:int  = local_id
 
@@ -110,15 +155,49 @@ class Decomposition:
         self.pos_precons:int = pos_precons
         self.neg_precons:int = neg_precons
 
+        # fact indexes of pos_precons, set by compile()
+        self.pre_idx = None
+
+        # packed state conditions, set by compile_packed()
+        self.packed_pre = None
+        self.packed_neg = None
+
+        # (abstract task, decomposition) pairs of the original model this one stands for, in order
+        # (set by flatten_hierarchy), None if it is an original decomposition
+        self.source = None
+
+    def compile(self):
+        self.pre_idx = bit_positions(self.pos_precons)
+
+    def compile_packed(self, codec):
+        self.packed_pre = codec.condition(self.pos_precons)
+        self.packed_neg = codec.literals(self.neg_precons)
+
+    def get_precons(self):
+        return self.pre_idx if self.pre_idx is not None else bit_positions(self.pos_precons)
+
     def applicable(self, state_bitwise):
         return ((state_bitwise & self.pos_precons) == self.pos_precons) and \
                ((state_bitwise & self.neg_precons) == 0)
 
+    def applicable_packed(self, state_packed):
+        mask, value = self.packed_pre
+        if (state_packed & mask) != value:
+            return False
+        for mask, value in self.packed_neg:
+            if (state_packed & mask) == value:
+                return False
+        return True
+
+    @property
+    def name(self) -> str:
+        return NAMES[self.name_id]
+
     def __eq__(self, other):
-        return self.name == other.name
+        return self.name_id == other.name_id
     
     def __hash__(self):
-        return self.hash_name
+        return self.name_id
     
     def __repr__(self):
         return f"<D {self.name} {self.task_network} >"
@@ -134,7 +213,7 @@ class Decomposition:
 class Model:
     def __init__(self, facts: set, initial_state: set, initial_tn: List[Union[Operator, AbstractTask]],
                  goals: set, operators: List[Operator], decompositions: List[Decomposition], 
-                 abstract_tasks: List[AbstractTask]):
+                 abstract_tasks: List[AbstractTask], mutex_groups: List[Tuple[int, ...]] = None):
         self.facts = facts
         self.initial_state = initial_state
         self.goals = goals
@@ -142,9 +221,31 @@ class Model:
         self.operators = operators
         self.decompositions = decompositions
         self.abstract_tasks = abstract_tasks
+        # facts (by position) of each mutex group, at most one of them holds in any reachable state
+        self.mutex_groups = mutex_groups if mutex_groups is not None else []
         
         self.desc = Descriptions()
 
+        self._set_id_ranges()
+
+        # AND/OR graphs shared between heuristics (see graphs)
+        self._graphs = None
+
+        # index views of the bitsets, set by compile()
+        self.compiled = False
+        self.goal_idx = None
+        self.op_pre_idx = None
+        self.op_add_idx = None
+        self.op_del_idx = None
+        self.dec_pre_idx = None
+
+        # packed state encoding, set by state_codec()
+        self.codec = None
+        self.packed_goal = None
+        
+        #self._remove_panda_top()
+    
+    def _set_id_ranges(self):
         # Global ID info: initial (init) and final (end) global indixes for facts, operators, abstract_tasks, and decompositions
         self.ifacts_init = 0
         self.ifacts_end  = len(self.facts) - 1
@@ -154,9 +255,54 @@ class Model:
         self.iabt_end  = self.iabt_init + len(self.abstract_tasks)-1
         self.idec_init = self.iabt_end+1
         self.idec_end  = self.idec_init + len(self.decompositions)-1
-        
-        #self._remove_panda_top()
-    
+
+    @property
+    def graphs(self):
+        """
+        AND/OR graphs of the model by graph type, built once and shared read-only between heuristics.
+        """
+        if self._graphs is None:
+            # imported here: and_or_graph depends on this module
+            from Pytrich.ProblemRepresentation.and_or_graph import AndOrGraphCache
+            self._graphs = AndOrGraphCache(self)
+        return self._graphs
+
+    def compile(self):
+        """
+        Precompute the fact indexes of the precondition and effect bitsets, once after grounding,
+        so hot loops iterate the set facts only instead of every bit position.
+        Besides op.pre_idx/add_idx/del_idx and d.pre_idx, keeps struct-of-arrays views
+        indexed by local id: op_pre_idx, op_add_idx, op_del_idx and dec_pre_idx.
+        Call it again if the operators or decompositions change (e.g. postprocessing).
+        """
+        for op in self.operators:
+            op.compile()
+        for d in self.decompositions:
+            d.compile()
+        self.goal_idx = bit_positions(self.goals)
+        self.op_pre_idx = [op.pre_idx for op in self.operators]
+        self.op_add_idx = [op.add_idx for op in self.operators]
+        self.op_del_idx = [op.del_idx for op in self.operators]
+        self.dec_pre_idx = [d.pre_idx for d in self.decompositions]
+        self.compiled = True
+        return self
+
+    def state_codec(self):
+        """
+        Packed state encoding over the mutex groups (see StateCodec), built on first use,
+        compiling the packed conditions and effects of operators, decompositions and goals.
+        """
+        if self.codec is None:
+            # imported here: state_codec depends on this module
+            from Pytrich.ProblemRepresentation.state_codec import StateCodec
+            self.codec = StateCodec(len(self.facts), self.mutex_groups)
+            for op in self.operators:
+                op.compile_packed(self.codec)
+            for d in self.decompositions:
+                d.compile_packed(self.codec)
+            self.packed_goal = self.codec.condition(self.goals)
+        return self.codec
+
     def get_component(self, component_id):
         if component_id <= self.ifacts_end:
             fact=self.facts[component_id]
@@ -201,53 +347,35 @@ class Model:
     #             self.abstract_tasks.remove(t)
     #             break
         
-    # def assign_global_ids(self):
-    #     next_id = len(self.facts)
-        
-    #     # Assign global IDs to operators
-    #     for o in self.operators:
-    #         o.global_id = next_id
-    #         next_id += 1
-        
-    #     self.iop_init = self.operators[0].global_id
-    #     self.iop_end = self.operators[-1].global_id
-
-    #     # Check for overlap with facts
-    #     assert self.iop_init not in self._int_to_explicit, (
-    #         'Operator index overlapped with fact index'
-    #     )
-
-    #     # Assign global IDs to abstract tasks
-    #     for ab_t in self.abstract_tasks:
-    #         ab_t.global_id = next_id
-    #         next_id += 1
-        
-    #     self.iabt_init = self.abstract_tasks[0].global_id
-    #     self.iabt_end = self.abstract_tasks[-1].global_id
-
-    #     # Check for overlap with operators
-    #     assert self.iabt_init > self.iop_end, (
-    #         'Abstract task index overlapped with operator index'
-    #     )
-
-    #     # Assign global IDs to decompositions
-    #     for d in self.decompositions:
-    #         d.global_id = next_id
-    #         next_id += 1
-        
-    #     self.idec_init = self.decompositions[0].global_id
-    #     self.idec_end = self.decompositions[-1].global_id
-
-    #     # Check for overlap with abstract tasks
-    #     assert self.idec_init > self.iabt_end, (
-    #         'Decomposition index overlapped with abstract task index'
-    #     )
+    def assign_global_ids(self):
+        """
+        Renumber facts, operators, abstract tasks and decompositions to dense global ids, in list order
+        (e.g. after pruning, see PostProcessing). Bitsets must already index facts by their new position.
+        AND/OR graphs, compiled indexes and the packed state encoding of the old numbering are dropped.
+        """
+        for f_i, f in enumerate(self.facts):
+            f.local_id = f_i
+            f.global_id = f_i
+        next_id = len(self.facts)
+        for tasks in (self.operators, self.abstract_tasks, self.decompositions):
+            for t_i, t in enumerate(tasks):
+                t.local_id = t_i
+                t.global_id = next_id + t_i
+            next_id += len(tasks)
+        self._set_id_ranges()
+        self._graphs = None
+        self.compiled = False
+        self.codec = None
 
     def state_explicit_repr(self, state):
-        return [self.facts[bit_pos].name for bit_pos in range(state.bit_length()) if state & 1<<bit_pos]
+        return [self.facts[bit_pos].name for bit_pos in bit_positions(state)]
 
     def goal_reached(self, state, task_network=[]):
-        return self.goals <= state and len(task_network) == 0
+        return (state & self.goals) == self.goals and len(task_network) == 0
+
+    def goal_reached_packed(self, state_packed, task_network=[]):
+        mask, value = self.packed_goal
+        return (state_packed & mask) == value and len(task_network) == 0
     
     def problem_info(self):
         model_info = (
@@ -2,6 +2,7 @@ import logging
 import re
 import time
 
+from Pytrich.DESCRIPTIONS import Descriptions
 # grounder
 from Pytrich.Grounder.panda_ground import PandaGrounder
 from Pytrich.Heuristics.aggregation import Max, Tiebreaking
@@ -11,6 +12,7 @@ from Pytrich.Search.htn_node import AstarNode, HTNNode, TiebreakingNode
 from .Heuristics.blind_heuristic import BlindHeuristic
 from .Heuristics.tdg_heuristic import TaskDecompositionHeuristic
 from .Heuristics.lmcount_heuristic import LandmarkCountHeuristic
+from .Heuristics.lmcut_heuristic import LMCutHeuristic
 from .Heuristics.novelty_heuristic import NoveltyHeuristic
 from .Heuristics.hmax_heuristic import HmaxHeuristic
 from .Heuristics.del_relax_heuristic import DeleteRelaxationHeuristic 
@@ -30,6 +32,7 @@ SEARCHES = {
 HEURISTICS = {
     "Blind"    : BlindHeuristic,
     "LMCOUNT"  : LandmarkCountHeuristic,
+    "LMCUT"    : LMCutHeuristic,
     "TDG"      : TaskDecompositionHeuristic,
     "NOVELTY"  : NoveltyHeuristic,
     "HMAX"     : HmaxHeuristic,
@@ -56,6 +59,11 @@ def search_plan(
 ):
     grounder = PandaGrounder(sas_file=sas_file, domain_file=domain_file, problem_file=problem_file)
     model = grounder()
+    if model is None:
+        # grounding failed or hit its limits, the stages' usage was already reported (grounding_stats)
+        print(Descriptions()('grounder_status', grounder.grounder_status))
+        return None
+    model.compile()
     result = search(model, heuristic=heuristic_function, node_type=node, n_params=n_params, **s_params)
     
     return result
@@ -8,6 +8,7 @@ import traceback
 
 from Pytrich.Heuristics.aggregation import Max, Tiebreaking
 from Pytrich.constants import AGGREGATIONS, HEURISTICS
+from Pytrich.Heuristics.registry import SHARED_HEURISTICS
 
 
 def command_available(command):
@@ -72,6 +73,37 @@ def parse_search_params(params_str):
 
 import re
 
+def split_arguments(params):
+    """
+    Split a parameter string on the commas that are not nested in parentheses or brackets.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(params):
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(params[start:i].strip())
+            start = i + 1
+    if params[start:].strip():
+        parts.append(params[start:].strip())
+    return parts
+
+def parse_argument_list(params):
+    """
+    Parse a list of heuristics "[Heuristic1(), Heuristic2()]" into (name, params) pairs.
+    Returns None if params is not such a list.
+    """
+    if not (params.startswith('[') and params.endswith(']')):
+        return None
+    elements = split_arguments(params[1:-1])
+    if not elements or not all(re.fullmatch(r"\w+\(.*\)", element) for element in elements):
+        return None
+    return [parse_argument_string(element) for element in elements]
+
 def parse_argument_string(argument_string):
     """
     Parse heuristic or aggregation arguments.
@@ -79,7 +111,9 @@ def parse_argument_string(argument_string):
         - SearchName(param1=value1, param2=value2)
         - NodeName(param1=value1, param2=value2)
         - HeuristicName(param1=value1, param2=value2)
+        - HeuristicName(param1=[Heuristic1(), Heuristic2()])
         - AggregationName([Heuristic1(), Heuristic2()])
+        - AggregationName([Heuristic1(), Heuristic2()], param1=value1)
     """
     #pattern = r"(\w+)\((.*?)\)"
     pattern = r"(\w+)\((.*)\)"
@@ -92,17 +126,20 @@ def parse_argument_string(argument_string):
     param_dict = {}
     if params:
         # Handle list arguments or key-value pairs
-        if params.startswith('[') and params.endswith(']'):  # It's a list
-            elements_pattern = r"([^,]+\(.*?\))|([^,]+)"
-            elements = re.findall(elements_pattern, params[1:-1])
-            parsed_elements = []
-            for element in elements:
-                element_str = element[0] or element[1]  # Get the matched element
-                parsed_elements.append(parse_argument_string(element_str.strip()))
+        params = split_arguments(params)
+        parsed_elements = parse_argument_list(params[0])
+        if parsed_elements is not None and len(params) == 1:  # It's a list
             param_dict = parsed_elements
-        else:  # Key-value pairs
-            for param in params.split(','):
-                key, value = param.split('=')
+        else:  # Key-value pairs, possibly after a list
+            if parsed_elements is not None:
+                param_dict['params'] = parsed_elements
+                params = params[1:]
+            for param in params:
+                key, value = param.split('=', 1)
+                parsed_elements = parse_argument_list(value.strip())
+                if parsed_elements is not None:
+                    param_dict[key.strip()] = parsed_elements
+                    continue
                 try:
                     param_dict[key.strip()] = eval(value.strip())
                 except NameError:
@@ -110,15 +147,23 @@ def parse_argument_string(argument_string):
     
     return argument_name, param_dict
 
-def parse_aggregation_function(name, parameters):
+def parse_aggregation_function(name, parameters, registry=SHARED_HEURISTICS):
     """
     Parse an aggregation function string and create the corresponding aggregation or heuristic objects.
-    Aggregation format: AggregationName([Heuristic1(), Heuristic2()])
+    Aggregation format: AggregationName([Heuristic1(), Heuristic2()], param1=value1)
+    Heuristics come from the registry, one instance per configuration, so the same heuristic
+    used in several places (e.g. Tiebreaking([NOVELTY(keys=[TDG()]), TDG()])) is computed once.
     """
     if isinstance(parameters, list):
-        return AGGREGATIONS[name]([parse_aggregation_function(param[0], param[1]) for param in parameters])
-    else:
-        return HEURISTICS[name](**parameters)
+        return AGGREGATIONS[name]([parse_aggregation_function(param[0], param[1], registry) for param in parameters])
+    parameters = {
+        key: [parse_aggregation_function(param[0], param[1], registry) for param in value]
+        if isinstance(value, list) and value and all(isinstance(param, tuple) for param in value) else value
+        for key, value in parameters.items()
+    }
+    if name in AGGREGATIONS:
+        return AGGREGATIONS[name](**parameters)
+    return registry.get(HEURISTICS[name], **parameters)
 
 class InvalidArgumentException(Exception):
     pass
\ No newline at end of file
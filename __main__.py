@@ -35,10 +35,60 @@ def main():
         "--sas_file", 
         help="Path to the SASplus file if the problem is already grounded."
     )
+    argparser.add_argument(
+        "-pr", "--prune", 
+        action="store_true",
+        help="Prune the grounded model (TDG reachability and relaxed executability) and compact its ids"
+    )
     argparser.add_argument(
         "-tor", "--totalorderreachability", 
         action="store_true",
-        help="Use total-order reachability analysis during grounding post-processing"
+        help="Use total-order reachability analysis during grounding post-processing (implies --prune)"
+    )
+    argparser.add_argument(
+        "-pu", "--pullup", 
+        action="store_true",
+        help="Pull subtask preconditions up into method preconditions during grounding post-processing (implies --prune)"
+    )
+    argparser.add_argument(
+        "-fh", "--flatten", 
+        action="store_true",
+        help="Inline single method tasks and single subtask chains and remove duplicate methods during grounding post-processing (implies --prune)"
+    )
+    argparser.add_argument(
+        "-lmp", "--liftmethodprecons", 
+        action="store_true",
+        help="Move pandaPI's method precondition actions into the preconditions of their methods"
+    )
+    argparser.add_argument(
+        "-mc", "--modelcache",
+        nargs="?", const=os.path.join(os.path.expanduser("~"), ".cache", "pytrich"),
+        help="Cache parsed models in this directory (default ~/.cache/pytrich when no directory is given)"
+    )
+    argparser.add_argument(
+        "-gc", "--groundingcache",
+        nargs="?", const=os.path.join(os.path.expanduser("~"), ".cache", "pytrich", "groundings"),
+        help="Cache pandaPI groundings in this directory (default ~/.cache/pytrich/groundings when no directory is given)"
+    )
+    argparser.add_argument(
+        "-gcmb", "--groundingcachemb",
+        type=float, default=1024,
+        help="Size cap (MB) of the grounding cache, least recently used groundings are evicted"
+    )
+    argparser.add_argument(
+        "-gt", "--groundingtimeout",
+        type=float, default=None,
+        help="Wall time limit (seconds) of each pandaPI grounding stage"
+    )
+    argparser.add_argument(
+        "-gmb", "--groundingmemorymb",
+        type=float, default=None,
+        help="Address space limit (MB) of each pandaPI grounding stage"
+    )
+    argparser.add_argument(
+        "-gf", "--groundingfiles",
+        action="store_true",
+        help="Hand off between pandaPI grounding stages through temporary files instead of FIFOs, running them one after the other"
     )
     argparser.add_argument(
         "-mg", "--monitorgrounder", 
@@ -102,7 +152,17 @@ def main():
     # Assign flags
     FLAGS.MONITOR_SEARCH_RESOURCES = args.monitorsearch
     FLAGS.MONITOR_LM_TIME = args.monitorlandmarks
+    FLAGS.USE_PRUNING = args.prune
     FLAGS.USE_TO_REACHABILITY = args.totalorderreachability
+    FLAGS.USE_PULLUP = args.pullup
+    FLAGS.USE_FLATTENING = args.flatten
+    FLAGS.LIFT_METHOD_PRECONDITIONS = args.liftmethodprecons
+    FLAGS.MODEL_CACHE_DIR = args.modelcache
+    FLAGS.GROUNDING_CACHE_DIR = args.groundingcache
+    FLAGS.GROUNDING_CACHE_MB = args.groundingcachemb
+    FLAGS.GROUNDING_TIMEOUT = args.groundingtimeout
+    FLAGS.GROUNDING_MEMORY_MB = args.groundingmemorymb
+    FLAGS.GROUNDING_STREAM = not args.groundingfiles
 
     # Extract domain and problem names if provided
     domain_name = os.path.basename(os.path.dirname(args.domain)) if args.domain else None
@@ -116,7 +176,7 @@ def main():
             heuristic_function = parse_aggregation_function(heuristic_name, parameters)
         else:
             heuristic_name, parameters = parse_argument_string(args.heuristic)
-            heuristic_function = HEURISTICS[heuristic_name](**parameters)
+            heuristic_function = parse_aggregation_function(heuristic_name, parameters)
     except ValueError as e:
         print(f"Error: {e}")
         sys.exit(1)